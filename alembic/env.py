@@ -1,8 +1,13 @@
+import logging
 import os
+import re
+import time
 from logging.config import fileConfig
+from typing import Any
 
-from sqlalchemy import engine_from_config
+from sqlalchemy import engine_from_config, text
 from alembic import context
+from authenticity_product.migrations import ZERO_DOWNTIME
 from authenticity_product.models import DeclarativeBase
 
 
@@ -25,6 +30,19 @@ target_metadata = DeclarativeBase.metadata
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
 # ... etc.
+logger = logging.getLogger("alembic.runtime.migration")
+
+# "-x mode=zero-downtime" runs the migrations against a database in use: each revision in its own
+# transaction, indexes built concurrently, and locks waited for no longer than the lock timeout
+mode = context.get_x_argument(as_dictionary=True).get("mode", os.getenv("MIGRATION_MODE", ""))
+lock_timeout = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+# monthly partitions, "<table>_pYYYYMM", are created by the application rather than migrations
+partition_pattern = re.compile(r".+_p\d{6}")
+
+
+def include_name(name: str | None, type_: str, parent_names: Any) -> bool:
+    """Leave the partitions out of the comparison of the database with the models."""
+    return not (type_ == "table" and name is not None and partition_pattern.fullmatch(name))
 
 
 def get_url() -> str:
@@ -64,9 +82,29 @@ def run_migrations_online() -> None:
 
     """
     connectable = engine_from_config({"sqlalchemy.url": get_url()})
+    zero_downtime = mode == ZERO_DOWNTIME
+    started_at = time.perf_counter()
+
+    def report_duration(ctx: Any, step: Any, heads: Any, run_args: Any) -> None:
+        nonlocal started_at
+        logger.info(f"Revision {step.up_revision_id} took {time.perf_counter() - started_at:.3f}s")
+        started_at = time.perf_counter()
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        if zero_downtime:
+            connection.execute(
+                text("SELECT set_config('lock_timeout', :timeout, false)"),
+                {"timeout": lock_timeout},
+            )
+            connection.commit()
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            transaction_per_migration=zero_downtime,
+            mode=mode,
+            on_version_apply=report_duration,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
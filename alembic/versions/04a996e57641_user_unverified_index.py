@@ -0,0 +1,21 @@
+"""user unverified index
+Revision ID: 04a996e57641
+Revises: 647e5280463b
+Create Date: 2026-10-19 16:47:53.681100
+"""
+from authenticity_product.migrations import create_index, drop_index
+
+
+# revision identifiers, used by Alembic.
+revision = "04a996e57641"
+down_revision = "647e5280463b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index("ix_user_unverified", "user", ["id"], postgresql_where="NOT is_verified")
+
+
+def downgrade() -> None:
+    drop_index("ix_user_unverified", "user")
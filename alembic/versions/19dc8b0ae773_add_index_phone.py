@@ -3,8 +3,7 @@ Revision ID: 19dc8b0ae773
 Revises: 3c86a2bcb416
 Create Date: 2025-03-08 15:33:14.864861
 """
-import sqlalchemy as sa
-from alembic import op
+from authenticity_product.migrations import create_index, drop_index
 
 
 # revision identifiers, used by Alembic.
@@ -15,12 +14,8 @@ depends_on = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_index("ix_phone", "user", ["phone"], unique=False)
-    # ### end Alembic commands ###
+    create_index("ix_phone", "user", ["phone"])
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_index("ix_phone", table_name="user")
-    # ### end Alembic commands ###
+    drop_index("ix_phone", "user")
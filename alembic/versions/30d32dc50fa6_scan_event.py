@@ -0,0 +1,36 @@
+"""scan event
+Revision ID: 30d32dc50fa6
+Revises: c5f77e2205e0
+Create Date: 2026-10-19 15:36:15.396008
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "30d32dc50fa6"
+down_revision = "c5f77e2205e0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the monthly partitions are created by the writes reaching them
+    op.create_table(
+        "scan_event",
+        sa.Column("id", sa.BigInteger(), sa.Identity(always=False), nullable=False),
+        sa.Column("scanned_at", sa.DateTime(), nullable=False),
+        sa.Column("code", sa.String(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=True),
+        sa.Column("result", sa.String(), nullable=False),
+        sa.Column("country", sa.String(), nullable=True),
+        sa.Column("latitude", sa.Float(), nullable=True),
+        sa.Column("longitude", sa.Float(), nullable=True),
+        sa.Column("client", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id", "scanned_at"),
+        postgresql_partition_by="RANGE (scanned_at)",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scan_event")
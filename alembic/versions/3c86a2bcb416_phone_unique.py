@@ -3,8 +3,8 @@ Revision ID: 3c86a2bcb416
 Revises: 9362bc9ad285
 Create Date: 2025-03-08 15:26:50.175995
 """
-import sqlalchemy as sa
 from alembic import op
+from authenticity_product.migrations import create_unique_constraint
 
 
 # revision identifiers, used by Alembic.
@@ -15,12 +15,9 @@ depends_on = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.create_unique_constraint(None, "user", ["phone"])
-    # ### end Alembic commands ###
+    # named as Postgres names the constraint of a unique column
+    create_unique_constraint("user_phone_key", "user", ["phone"])
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_constraint(None, "user", type_="unique")
-    # ### end Alembic commands ###
+    op.drop_constraint("user_phone_key", "user", type_="unique")
@@ -0,0 +1,29 @@
+"""rate limit bucket
+Revision ID: 58fcf42d97b8
+Revises: 87cb169b62b4
+Create Date: 2026-10-19 14:26:03.780521
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "58fcf42d97b8"
+down_revision = "87cb169b62b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rate_limit_bucket",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_bucket")
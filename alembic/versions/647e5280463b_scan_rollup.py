@@ -0,0 +1,39 @@
+"""scan rollup
+Revision ID: 647e5280463b
+Revises: 7f81175a2ca9
+Create Date: 2026-10-19 16:35:26.253653
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "647e5280463b"
+down_revision = "7f81175a2ca9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rollup_watermark",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("last_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.create_table(
+        "scan_rollup",
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("country", sa.String(), nullable=False),
+        sa.Column("scans", sa.BigInteger(), nullable=False),
+        sa.Column("authentic", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("product_id", "day", "country"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("scan_rollup")
+    op.drop_table("rollup_watermark")
@@ -0,0 +1,58 @@
+"""anomaly detection
+Revision ID: 7f81175a2ca9
+Revises: 30d32dc50fa6
+Create Date: 2026-10-19 16:09:32.356616
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "7f81175a2ca9"
+down_revision = "30d32dc50fa6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "code_activity",
+        sa.Column("code", sa.String(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=True),
+        sa.Column("first_seen_at", sa.DateTime(), nullable=False),
+        sa.Column("last_seen_at", sa.DateTime(), nullable=False),
+        sa.Column("scans", sa.BigInteger(), nullable=False),
+        sa.Column("recent", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("code"),
+    )
+    op.create_index(
+        op.f("ix_code_activity_last_seen_at"), "code_activity", ["last_seen_at"], unique=False
+    )
+    op.create_table(
+        "suspicious_code",
+        sa.Column("id", sa.BigInteger(), sa.Identity(always=False), nullable=False),
+        sa.Column("code", sa.String(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=True),
+        sa.Column("reason", sa.String(), nullable=False),
+        sa.Column("scans", sa.Integer(), nullable=False),
+        sa.Column("locations", sa.Integer(), nullable=False),
+        sa.Column("first_seen_at", sa.DateTime(), nullable=False),
+        sa.Column("flagged_at", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("code", "reason"),
+    )
+    op.create_index(
+        op.f("ix_suspicious_code_product_id"), "suspicious_code", ["product_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_suspicious_code_product_id"), table_name="suspicious_code")
+    op.drop_table("suspicious_code")
+    op.drop_index(op.f("ix_code_activity_last_seen_at"), table_name="code_activity")
+    op.drop_table("code_activity")
@@ -0,0 +1,46 @@
+"""product serial code
+Revision ID: 848514cb2c76
+Revises: f85302115113
+Create Date: 2026-10-19 16:12:40.318254
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "848514cb2c76"
+down_revision = "f85302115113"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "product",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("brand", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "serial_code",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("code", sa.String(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["product_id"], ["product.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        postgresql.ExcludeConstraint(("code", "="), name="serial_code_code_excl", using="hash"),
+    )
+    op.create_index(op.f("ix_serial_code_product_id"), "serial_code", ["product_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_serial_code_product_id"), table_name="serial_code")
+    op.drop_table("serial_code")
+    op.drop_table("product")
@@ -0,0 +1,49 @@
+"""outbox message
+Revision ID: 87cb169b62b4
+Revises: 19dc8b0ae773
+Create Date: 2026-10-19 14:08:06.673385
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "87cb169b62b4"
+down_revision = "19dc8b0ae773"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "outbox_message",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("idempotency_key", sa.String(), nullable=False),
+        sa.Column("event", sa.String(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("available_at", sa.DateTime(), nullable=False),
+        sa.Column("sent_at", sa.DateTime(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("idempotency_key"),
+    )
+    op.create_index(
+        "ix_outbox_message_pending",
+        "outbox_message",
+        ["available_at"],
+        unique=False,
+        postgresql_where=sa.text("sent_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_outbox_message_pending",
+        table_name="outbox_message",
+        postgresql_where=sa.text("sent_at IS NULL"),
+    )
+    op.drop_table("outbox_message")
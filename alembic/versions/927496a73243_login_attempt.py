@@ -0,0 +1,49 @@
+"""login attempt
+Revision ID: 927496a73243
+Revises: 04a996e57641
+Create Date: 2026-10-19 16:54:07.898023
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "927496a73243"
+down_revision = "04a996e57641"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the monthly partitions are created by the writes reaching them
+    op.create_table(
+        "login_attempt",
+        sa.Column("id", sa.BigInteger(), sa.Identity(always=False), nullable=False),
+        sa.Column("attempted_at", sa.DateTime(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=True),
+        sa.Column("identifier", sa.String(), nullable=False),
+        sa.Column("ip", sa.String(), nullable=True),
+        sa.Column("success", sa.Boolean(), nullable=False),
+        sa.Column("reason", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id", "attempted_at"),
+        postgresql_partition_by="RANGE (attempted_at)",
+    )
+    op.create_index(
+        "ix_login_attempt_attempted_at", "login_attempt", ["attempted_at", "id"], unique=False
+    )
+    op.create_index(
+        "ix_login_attempt_identifier",
+        "login_attempt",
+        ["identifier", "attempted_at", "id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_login_attempt_user_id", "login_attempt", ["user_id", "attempted_at", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_login_attempt_user_id", table_name="login_attempt")
+    op.drop_index("ix_login_attempt_identifier", table_name="login_attempt")
+    op.drop_index("ix_login_attempt_attempted_at", table_name="login_attempt")
+    op.drop_table("login_attempt")
@@ -0,0 +1,25 @@
+"""user first login
+Revision ID: c1fde1668f40
+Revises: 927496a73243
+Create Date: 2026-10-19 18:12:41.230517
+"""
+import sqlalchemy as sa
+from alembic import op
+from authenticity_product.migrations import backfill
+
+
+# revision identifiers, used by Alembic.
+revision = "c1fde1668f40"
+down_revision = "927496a73243"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("user", sa.Column("first_login_at", sa.DateTime(), nullable=True))
+    # the logins before this revision are unknown, so the existing users are all kept
+    backfill("user", "first_login_at = created_at", "first_login_at IS NULL")
+
+
+def downgrade() -> None:
+    op.drop_column("user", "first_login_at")
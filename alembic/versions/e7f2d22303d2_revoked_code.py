@@ -0,0 +1,31 @@
+"""revoked code
+Revision ID: e7f2d22303d2
+Revises: 848514cb2c76
+Create Date: 2026-10-19 15:13:18.828457
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "e7f2d22303d2"
+down_revision = "848514cb2c76"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "revoked_code",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("serial", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("reason", sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(["product_id"], ["product.id"]),
+        sa.PrimaryKeyConstraint("product_id", "serial"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("revoked_code")
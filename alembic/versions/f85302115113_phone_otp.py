@@ -0,0 +1,33 @@
+"""phone otp
+Revision ID: f85302115113
+Revises: 58fcf42d97b8
+Create Date: 2026-10-19 14:33:27.956617
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "f85302115113"
+down_revision = "58fcf42d97b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "phone_otp",
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("phone", sa.String(), nullable=False),
+        sa.Column("code_hash", sa.String(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("phone"),
+    )
+    op.create_index(op.f("ix_phone_otp_expires_at"), "phone_otp", ["expires_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_phone_otp_expires_at"), table_name="phone_otp")
+    op.drop_table("phone_otp")
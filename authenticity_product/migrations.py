@@ -0,0 +1,134 @@
+"""Migration helpers.
+
+In the zero-downtime mode of ``alembic/env.py``, indexes are built ``CONCURRENTLY`` outside of
+the migration transaction, unique constraints are attached to such an index, and backfills
+update keyset batches in their own transactions, so that migrating a large table while the
+application serves it only takes brief locks. Otherwise they run as plain DDL in the migration
+transaction, which is faster on a small or empty database.
+"""
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+from sqlalchemy import text
+from alembic import op
+
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+ZERO_DOWNTIME = "zero-downtime"
+
+
+def is_zero_downtime() -> bool:
+    """Return whether the migrations run in the zero-downtime mode."""
+    return bool(op.get_context().opts.get("mode") == ZERO_DOWNTIME)
+
+
+@contextmanager
+def step(name: str) -> Iterator[None]:
+    """Log the duration of a step of a migration."""
+    start = time.perf_counter()
+    yield
+    logger.info(f"Step {name} took {time.perf_counter() - start:.3f}s")
+
+
+def drop_invalid_index(name: str) -> None:
+    """Drop what an interrupted concurrent build of an index left, it is never used."""
+    connection = op.get_bind()
+    invalid = connection.execute(
+        text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+        ),
+        {"name": name},
+    ).first()
+    if invalid is not None:
+        op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+def create_index(
+    name: str,
+    table: str,
+    columns: list[str],
+    unique: bool = False,
+    postgresql_where: str | None = None,
+) -> None:
+    """Create an index, partial if given a condition, concurrently in the zero-downtime mode."""
+    where = text(postgresql_where) if postgresql_where is not None else None
+    with step(f"create index {name}"):
+        if not is_zero_downtime():
+            op.create_index(name, table, columns, unique=unique, postgresql_where=where)
+            return
+        with op.get_context().autocommit_block():
+            drop_invalid_index(name)
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                postgresql_where=where,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def drop_index(name: str, table: str) -> None:
+    """Drop an index, concurrently in the zero-downtime mode."""
+    with step(f"drop index {name}"):
+        if not is_zero_downtime():
+            op.drop_index(name, table_name=table)
+            return
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def create_unique_constraint(name: str, table: str, columns: list[str]) -> None:
+    """Create a unique constraint.
+
+    In the zero-downtime mode its index is built concurrently first, then attached to the
+    constraint, which only locks the table for the time of a catalog update.
+    """
+    if not is_zero_downtime():
+        with step(f"create unique constraint {name}"):
+            op.create_unique_constraint(name, table, columns)
+        return
+    create_index(name, table, columns, unique=True)
+    with step(f"attach unique constraint {name}"):
+        op.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" UNIQUE USING INDEX "{name}"')
+
+
+def backfill(
+    table: str,
+    assignments: str,
+    condition: str = "TRUE",
+    key: str = "id",
+    batch_size: int = 1000,
+    pause_in_seconds: float = 0.05,
+    params: dict[str, Any] | None = None,
+) -> int:
+    """Update the rows of a table matching a condition, and return their number.
+
+    In the zero-downtime mode the rows are updated in batches of keys, each committed on its
+    own and followed by a pause, so that no lock is held for long and replicas keep up.
+    """
+    with step(f"backfill {table}"):
+        if not is_zero_downtime():
+            statement = text(f'UPDATE "{table}" SET {assignments} WHERE {condition}')
+            return int(op.get_bind().execute(statement, params or {}).rowcount)
+        updated, last = 0, None
+        with op.get_context().autocommit_block():
+            while True:
+                keyset = f'AND "{key}" > :last ' if last is not None else ""
+                statement = text(
+                    f'UPDATE "{table}" SET {assignments} WHERE "{key}" IN ('
+                    f'SELECT "{key}" FROM "{table}" WHERE ({condition}) {keyset}'
+                    f'ORDER BY "{key}" LIMIT :batch_size) RETURNING "{key}"'
+                )
+                batch = {**(params or {}), "last": last, "batch_size": batch_size}
+                if not (keys := op.get_bind().execute(statement, batch).scalars().all()):
+                    return updated
+                updated += len(keys)
+                last = max(keys)
+                time.sleep(pause_in_seconds)
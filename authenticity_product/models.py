@@ -2,7 +2,23 @@
 from datetime import datetime
 
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
-from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Identity,
+    Index,
+    Integer,
+    String,
+    text,
+    UniqueConstraint,
+    Uuid,
+)
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped
 
@@ -34,8 +50,195 @@ class User(DeclarativeBase, SQLAlchemyBaseUserTableUUID):
     phone = Column(String(), nullable=False, unique=True)
     civility = Column(String(), nullable=True)
     role: Mapped[str] = Column(String, ForeignKey("role.name"), nullable=False)
+    # kept from the purge of the unverified users once set
+    first_login_at = Column(DateTime, nullable=True)
     Index("ix_phone", phone)
+    # the unverified users only, walked by the cleanup of those never verified
+    __table_args__ = (Index("ix_user_unverified", "id", postgresql_where=text("NOT is_verified")),)
 
     def __repr__(self) -> str:
         """Return a string representation of the product."""
         return f"{self.email})"
+
+
+class OutboxMessage(DeclarativeBase):
+    """Event to deliver, written in the transaction of the change which produced it."""
+
+    __tablename__ = "outbox_message"
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    idempotency_key = Column(String(), unique=True, nullable=False)
+    event = Column(String(), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    attempts: Mapped[int] = Column(Integer(), default=0, nullable=False)
+    available_at = Column(DateTime, default=datetime.now, nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String(), nullable=True)
+    Index("ix_outbox_message_pending", available_at, postgresql_where=sent_at.is_(None))
+
+
+class RateLimitBucket(DeclarativeBase):
+    """Token bucket shared by the workers, refilled from the time of its last update."""
+
+    __tablename__ = "rate_limit_bucket"
+    key = Column(String(), primary_key=True)
+    tokens = Column(Float(), nullable=False)
+
+
+class PhoneOtp(DeclarativeBase):
+    """One-time login code of a phone number, stored as a keyed hash."""
+
+    __tablename__ = "phone_otp"
+    phone = Column(String(), primary_key=True)
+    code_hash = Column(String(), nullable=False)
+    attempts: Mapped[int] = Column(Integer(), default=0, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Product(DeclarativeBase):
+    """Product whose items carry serial codes."""
+
+    __tablename__ = "product"
+    id = Column(Integer(), primary_key=True)
+    name = Column(String(), nullable=False)
+    brand = Column(String(), nullable=True)
+    description = Column(String(), nullable=True)
+
+
+class SerialCode(DeclarativeBase):
+    """Serial code printed on an item of a product.
+
+    Codes are only ever looked up by equality, so they are indexed with a hash index, smaller
+    than a btree on random strings. The exclusion constraint makes this index enforce
+    uniqueness, which a hash index cannot do on its own.
+    """
+
+    __tablename__ = "serial_code"
+    __table_args__ = (
+        ExcludeConstraint(  # type: ignore[no-untyped-call]
+            ("code", "="), name="serial_code_code_excl", using="hash"
+        ),
+    )
+    id = Column(BigInteger(), primary_key=True, autoincrement=True)
+    code = Column(String(), nullable=False)
+    product_id = Column(Integer(), ForeignKey("product.id"), nullable=False, index=True)
+
+
+class CodeGenerationJob(DeclarativeBase):
+    """Generation of the serial codes of a product batch, resumed from the codes committed."""
+
+    __tablename__ = "code_generation_job"
+    id: Mapped[int] = Column(Integer(), primary_key=True)
+    product_id = Column(Integer(), ForeignKey("product.id"), nullable=False)
+    requested = Column(BigInteger(), nullable=False)
+    generated = Column(BigInteger(), default=0, nullable=False)
+    status = Column(String(), default="pending", nullable=False)
+    rows_per_second = Column(Float(), nullable=True)
+    error = Column(String(), nullable=True)
+
+
+class RevokedCode(DeclarativeBase):
+    """Signed code revoked, whose signature is otherwise still valid."""
+
+    __tablename__ = "revoked_code"
+    product_id = Column(Integer(), ForeignKey("product.id"), primary_key=True)
+    serial = Column(BigInteger(), primary_key=True, autoincrement=False)
+    reason = Column(String(), nullable=True)
+
+
+class ScanEvent(DeclarativeBase):
+    """Scan of a code, in a table partitioned by month and written in batches.
+
+    Events are never updated, so they carry their scan time only, and no foreign key slows
+    their writes down.
+    """
+
+    __tablename__ = "scan_event"
+    __table_args__ = {"postgresql_partition_by": "RANGE (scanned_at)"}
+    created_at = None  # type: ignore[assignment]
+    updated_at = None  # type: ignore[assignment]
+    id = Column(BigInteger(), Identity(), primary_key=True)
+    scanned_at = Column(DateTime, primary_key=True)
+    code = Column(String(), nullable=False)
+    product_id = Column(Integer(), nullable=True)
+    result = Column(String(), nullable=False)
+    country = Column(String(), nullable=True)
+    latitude = Column(Float(), nullable=True)
+    longitude = Column(Float(), nullable=True)
+    client = Column(String(), nullable=True)
+
+
+class CodeActivity(DeclarativeBase):
+    """Recent scans of an authentic code, checkpointed by the anomaly detector."""
+
+    __tablename__ = "code_activity"
+    code = Column(String(), primary_key=True)
+    product_id = Column(Integer(), nullable=True)
+    first_seen_at = Column(DateTime(), nullable=False)
+    last_seen_at = Column(DateTime(), nullable=False, index=True)
+    scans = Column(BigInteger(), nullable=False)
+    # the latest scans, as [epoch seconds, latitude, longitude, country]
+    recent = Column(JSONB, nullable=False)
+
+
+class SuspiciousCode(DeclarativeBase):
+    """Authentic code whose scans look like those of a counterfeit, for a reason."""
+
+    __tablename__ = "suspicious_code"
+    __table_args__ = (UniqueConstraint("code", "reason"),)
+    id: Mapped[int] = Column(BigInteger(), Identity(), primary_key=True)
+    code = Column(String(), nullable=False)
+    product_id = Column(Integer(), nullable=True, index=True)
+    reason = Column(String(), nullable=False)
+    scans = Column(Integer(), nullable=False)
+    locations = Column(Integer(), nullable=False)
+    first_seen_at = Column(DateTime(), nullable=False)
+    flagged_at = Column(DateTime(), nullable=False)
+
+
+class ScanRollup(DeclarativeBase):
+    """Scans of a product per day and country, aggregated from the scan events past a watermark.
+
+    The scans of unknown codes, without product, are left out. A scan without country counts
+    under an empty one.
+    """
+
+    __tablename__ = "scan_rollup"
+    created_at = None  # type: ignore[assignment]
+    updated_at = None  # type: ignore[assignment]
+    product_id = Column(Integer(), primary_key=True)
+    day = Column(Date(), primary_key=True)
+    country = Column(String(), primary_key=True)
+    scans = Column(BigInteger(), nullable=False)
+    authentic = Column(BigInteger(), nullable=False)
+
+
+class RollupWatermark(DeclarativeBase):
+    """Id of the last event aggregated into a rollup."""
+
+    __tablename__ = "rollup_watermark"
+    name = Column(String(), primary_key=True)
+    last_id = Column(BigInteger(), nullable=False)
+
+
+class LoginAttempt(DeclarativeBase):
+    """Login attempt, in a table partitioned by month and written in batches for the audits.
+
+    The user is not a foreign key, so that the trail of a deleted user is kept.
+    """
+
+    __tablename__ = "login_attempt"
+    __table_args__ = (
+        Index("ix_login_attempt_attempted_at", "attempted_at", "id"),
+        Index("ix_login_attempt_user_id", "user_id", "attempted_at", "id"),
+        Index("ix_login_attempt_identifier", "identifier", "attempted_at", "id"),
+        {"postgresql_partition_by": "RANGE (attempted_at)"},
+    )
+    created_at = None  # type: ignore[assignment]
+    updated_at = None  # type: ignore[assignment]
+    id = Column(BigInteger(), Identity(), primary_key=True)
+    attempted_at = Column(DateTime, primary_key=True)
+    user_id = Column(Uuid(), nullable=True)
+    identifier = Column(String(), nullable=False)
+    ip = Column(String(), nullable=True)
+    success = Column(Boolean(), nullable=False)
+    reason = Column(String(), nullable=True)
@@ -1,9 +1,10 @@
 """Authenticity product schemas."""
 import re
 import uuid
+from datetime import date, datetime
 
 from fastapi_users import schemas
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, PositiveInt
 
 
 # Define regex patterns
@@ -62,3 +63,96 @@ class PhoneNumberRequest(BaseModel):
     """Phone number request."""
 
     phone_number: str
+
+
+class PhoneOtpVerifyRequest(PhoneNumberRequest):
+    """Phone one-time code verification request."""
+
+    code: str
+
+
+class CodeGenerationJobCreate(BaseModel):
+    """Code generation job create schema."""
+
+    product_id: int
+    count: PositiveInt
+
+
+class CodeGenerationJobRead(BaseModel):
+    """Code generation job read schema."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    product_id: int
+    requested: int
+    generated: int
+    status: str
+    rows_per_second: float | None = None
+    error: str | None = None
+
+
+class SuspiciousCodeRead(BaseModel):
+    """Suspicious code read schema."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    code: str
+    product_id: int | None = None
+    reason: str
+    scans: int
+    locations: int
+    first_seen_at: datetime
+    flagged_at: datetime
+
+
+class CodeActivityRead(BaseModel):
+    """Code activity read schema."""
+
+    code: str
+    product_id: int | None = None
+    first_seen_at: datetime
+    last_seen_at: datetime
+    scans: int
+    flags: list[SuspiciousCodeRead]
+
+
+class ScanRollupRead(BaseModel):
+    """Scan rollup read schema."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    product_id: int
+    day: date
+    country: str
+    scans: int
+    authentic: int
+
+
+class ScanRollupPage(BaseModel):
+    """Scan rollup page schema, with the cursor of the next page if any."""
+
+    items: list[ScanRollupRead]
+    next: str | None = None
+
+
+class LoginAttemptRead(BaseModel):
+    """Login attempt read schema."""
+
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    attempted_at: datetime
+    user_id: uuid.UUID | None = None
+    identifier: str
+    ip: str | None = None
+    success: bool
+    reason: str | None = None
+
+
+class LoginAttemptPage(BaseModel):
+    """Login attempt page schema, with the cursor of the next page if any."""
+
+    items: list[LoginAttemptRead]
+    next: str | None = None
@@ -0,0 +1,23 @@
+"""Serial code generation, run in the processes of the code generation pool.
+
+The pool spawns its processes, which import this module afresh, so it only depends on the
+standard library, unlike the job runner in ``services.http.code_generation``.
+"""
+import base64
+import secrets
+
+
+# the alphabet of ``verifier``, which stays self-contained to be handed to retailers
+CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CODE_LENGTH = 16
+FROM_BASE32 = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", CODE_ALPHABET.encode())
+
+
+def generate_chunk(size: int) -> bytes:
+    """Return random codes in the text format of COPY, one per line."""
+    encoded = base64.b32encode(secrets.token_bytes(size * CODE_LENGTH * 5 // 8))
+    encoded = encoded.translate(FROM_BASE32)
+    return b"".join(
+        encoded[start : start + CODE_LENGTH] + b"\n"
+        for start in range(0, len(encoded), CODE_LENGTH)
+    )
@@ -1,9 +1,32 @@
 """Init file for http services."""
+import functools
 import os
 
 import requests
 from jwcrypto.jwk import JWK
+from opentelemetry.trace import SpanKind
+from authenticity_product.services.http.tracing import tracer
 
 
-rsa_key = JWK(**requests.get(os.environ["FASTAPI_USERS_RSA_KEY_URL"], timeout=10).json()["keys"])
-private_key: str = rsa_key.export_to_pem(private_key=True, password=None)
+@functools.cache
+def get_rsa_key() -> JWK:
+    """Fetch the signing key on first use rather than at import."""
+    with tracer.start_as_current_span(
+        "jwks.fetch",
+        kind=SpanKind.CLIENT,
+        attributes={"url.full": os.environ["FASTAPI_USERS_RSA_KEY_URL"]},
+    ):
+        return JWK(
+            **requests.get(os.environ["FASTAPI_USERS_RSA_KEY_URL"], timeout=10).json()["keys"]
+        )
+
+
+@functools.cache
+def get_product_code_key() -> JWK:
+    """Fetch the key signing the product codes, the signing key of the tokens unless configured."""
+    if not (key_url := os.getenv("PRODUCT_CODE_KEY_URL")):
+        return get_rsa_key()
+    with tracer.start_as_current_span(
+        "jwks.fetch", kind=SpanKind.CLIENT, attributes={"url.full": key_url}
+    ):
+        return JWK(**requests.get(key_url, timeout=10).json()["keys"])
@@ -1,12 +1,15 @@
 """http entrypoint file admin."""
+import asyncio
 import os
+from typing import Any
 
 import jwt
 import requests
 from sqladmin import ModelView
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
-from authenticity_product.models import User
+from authenticity_product.models import SuspiciousCode, User
+from authenticity_product.services.http.cache import principal_cache
 from authenticity_product.services.http.config import settings
 
 
@@ -32,6 +35,48 @@ class UserAdmin(ModelView, model=User):  # type: ignore
         User.role,
     ]
 
+    async def after_model_change(
+        self, data: dict[str, Any], model: User, is_created: bool, request: Request
+    ) -> None:
+        """After an edit, drop the stale principal from the cache."""
+        principal_cache.invalidate(model.id)
+
+    async def after_model_delete(self, model: User, request: Request) -> None:
+        """After delete, drop the principal from the cache."""
+        principal_cache.invalidate(model.id)
+
+
+class SuspiciousCodeAdmin(ModelView, model=SuspiciousCode):  # type: ignore
+    """Suspicious code admin view, flagged by the anomaly detector."""
+
+    can_create = False
+    can_edit = False
+    column_list = [
+        SuspiciousCode.code,
+        SuspiciousCode.product_id,
+        SuspiciousCode.reason,
+        SuspiciousCode.scans,
+        SuspiciousCode.locations,
+        SuspiciousCode.flagged_at,
+    ]
+    column_searchable_list = [SuspiciousCode.code]
+    column_sortable_list = [SuspiciousCode.flagged_at, SuspiciousCode.scans]
+    column_default_sort = [(SuspiciousCode.flagged_at, True)]
+
+
+def is_admin_token(token: str) -> bool:
+    """Check that a token is valid, unexpired and of an admin."""
+    try:
+        decoded = jwt.decode(
+            jwt=token,
+            audience=["fastapi-users:auth"],
+            key=settings.public_key,
+            algorithms=["RS256"],
+        )
+    except jwt.PyJWTError:
+        return False
+    return bool(decoded.get("role") == "admin")
+
 
 class AdminAuth(AuthenticationBackend):
     """Admin authentication backend."""
@@ -39,23 +84,18 @@ class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         """Login user."""
         form = await request.form()
-        username, password = form["username"], form["password"]
-        data = {"username": username, "password": password}
-        response = requests.post(
-            f'https://{os.environ["DNS_DOMAIN"]}/auth/jwt/login/', data=data, timeout=10
+        data = {"username": form.get("username"), "password": form.get("password")}
+        response = await asyncio.to_thread(
+            requests.post,
+            f'https://{os.environ["DNS_DOMAIN"]}/auth/jwt/login/',
+            data=data,
+            timeout=10,
         )
-        res = response.json()
-        if tocken := res.get("access_token"):
-            decoded = jwt.decode(
-                jwt=tocken,
-                audience=["fastapi-users:auth"],
-                key=settings.public_key,
-                algorithms=["RS256"],
-            )
-            if decoded["role"] == "admin":
-                request.session.update({"token": res["access_token"]})
-                return True
+        if not response.ok:
             return False
+        if (token := response.json().get("access_token")) and is_admin_token(token):
+            request.session.update({"token": token})
+            return True
         return False
 
     async def logout(self, request: Request) -> bool:
@@ -65,9 +105,5 @@ class AdminAuth(AuthenticationBackend):
         return True
 
     async def authenticate(self, request: Request) -> bool:
-        """Authenticate user."""
-
-        if request.session.get("token"):
-            return False
-        # Check the token in depth
-        return True
+        """Authenticate user, as long as the token of the session is of an admin."""
+        return (token := request.session.get("token")) is not None and is_admin_token(token)
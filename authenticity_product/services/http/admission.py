@@ -0,0 +1,207 @@
+"""Admission control module.
+
+Login and registration hash passwords, which makes them the most expensive routes. Their
+requests are admitted by token buckets per client IP and per identifier, then by a cap on the
+requests hashing concurrently in the worker, so bursts are shed with a 429 or a 503 before any
+hashing starts.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator
+from typing import NamedTuple, Protocol
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.metrics import ADMISSION_REJECTIONS
+
+
+logger = logging.getLogger(__name__)
+
+# the update only happens, and a row is only returned, when the refilled bucket has a token
+TAKE_STATEMENT = text(
+    """
+    INSERT INTO rate_limit_bucket AS bucket (key, tokens, created_at, updated_at)
+    VALUES (:key, :capacity - 1, LOCALTIMESTAMP, LOCALTIMESTAMP)
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = LEAST(
+            :capacity,
+            bucket.tokens + EXTRACT(EPOCH FROM LOCALTIMESTAMP - bucket.updated_at) * :rate
+        ) - 1,
+        updated_at = LOCALTIMESTAMP
+    WHERE LEAST(
+        :capacity, bucket.tokens + EXTRACT(EPOCH FROM LOCALTIMESTAMP - bucket.updated_at) * :rate
+    ) >= 1
+    RETURNING tokens
+    """
+)
+
+
+class BucketLimit(NamedTuple):
+    """Burst size and sustained rate of a token bucket."""
+
+    capacity: float
+    refill_per_second: float
+
+
+class BucketStore(Protocol):
+    """Storage of the token buckets."""
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        """Take a token, and return 0 or the seconds to wait for one."""
+
+
+class InMemoryBucketStore:
+    """Token buckets of this worker, the least recently used ones are evicted."""
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        """Take a token, and return 0 or the seconds to wait for one."""
+        now = time.monotonic()
+        tokens, updated_at = self.buckets.pop(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated_at) * limit.refill_per_second)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.refill_per_second
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_size:
+            self.buckets.popitem(last=False)
+        return retry_after
+
+
+class PostgresBucketStore:
+    """Token buckets shared by every worker in the rate_limit_bucket table.
+
+    A bucket is taken with a single upsert. When the database cannot be reached the requests
+    are admitted, the routes behind fail anyway.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def take(self, key: str, limit: BucketLimit) -> float:
+        """Take a token, and return 0 or the seconds to wait for one."""
+        try:
+            async with self.engine.begin() as connection:
+                row = (
+                    await connection.execute(
+                        TAKE_STATEMENT,
+                        {"key": key, "capacity": limit.capacity, "rate": limit.refill_per_second},
+                    )
+                ).first()
+        except Exception:  # pylint: disable=broad-except
+            logger.warning("Rate limit store unavailable, request admitted", exc_info=True)
+            return 0.0
+        return 0.0 if row is not None else 1 / limit.refill_per_second
+
+
+class Admission:
+    """Dependency admitting the requests of an expensive route.
+
+    The identifier is read from the form or JSON body, which FastAPI parsed before running the
+    dependencies. The hashing slot, for the routes which hash, is held until the response is
+    sent.
+    """
+
+    def __init__(
+        self,
+        route: str,
+        store: BucketStore,
+        ip_limit: BucketLimit,
+        identifier_limit: BucketLimit,
+        identifier_field: str,
+        hash_slots: asyncio.Semaphore | None = None,
+        hash_wait_in_seconds: float = 0,
+    ):
+        self.route = route
+        self.store = store
+        self.ip_limit = ip_limit
+        self.identifier_limit = identifier_limit
+        self.identifier_field = identifier_field
+        self.hash_slots = hash_slots
+        self.hash_wait_in_seconds = hash_wait_in_seconds
+
+    async def __call__(self, request: Request) -> AsyncGenerator[None, None]:
+        """Reject the request when a limit is reached, otherwise hold a hashing slot."""
+        ip = request.client.host if request.client is not None else "unknown"
+        await self.take("ip", f"{self.route}:ip:{ip}", self.ip_limit)
+        if identifier := await self.get_identifier(request):
+            digest = hashlib.sha256(identifier.strip().lower().encode()).hexdigest()[:32]
+            await self.take(
+                "identifier", f"{self.route}:identifier:{digest}", self.identifier_limit
+            )
+        if self.hash_slots is None:
+            yield
+            return
+
+        try:
+            async with asyncio.timeout(self.hash_wait_in_seconds):
+                await self.hash_slots.acquire()
+        except TimeoutError:
+            ADMISSION_REJECTIONS.labels(self.route, "concurrency").inc()
+            raise HTTPException(  # pylint: disable=raise-missing-from
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent requests",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            self.hash_slots.release()
+
+    async def take(self, bucket: str, key: str, limit: BucketLimit) -> None:
+        """Take a token from a bucket, or reject the request with a 429."""
+        if retry_after := await self.store.take(key, limit):
+            ADMISSION_REJECTIONS.labels(self.route, bucket).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+    async def get_identifier(self, request: Request) -> str | None:
+        """Return the account targeted by the request, if it has one."""
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+            value = body.get(self.identifier_field) if isinstance(body, dict) else None
+        else:
+            value = (await request.form()).get(self.identifier_field)
+        return value if isinstance(value, str) else None
+
+
+bucket_store: BucketStore
+if settings.admission_store == "postgres":
+    bucket_store = PostgresBucketStore(engine_async)
+else:
+    bucket_store = InMemoryBucketStore()
+login_admission = Admission(
+    "login",
+    bucket_store,
+    BucketLimit(settings.admission_ip_capacity, settings.admission_ip_refill_per_second),
+    BucketLimit(
+        settings.admission_identifier_capacity, settings.admission_identifier_refill_per_second
+    ),
+    "username",
+    asyncio.Semaphore(settings.admission_max_concurrent_hashes),
+    settings.admission_hash_wait_in_seconds,
+)
+# registration shares the limits and the hashing slots of the login
+register_admission = Admission(
+    "register",
+    bucket_store,
+    login_admission.ip_limit,
+    login_admission.identifier_limit,
+    "email",
+    login_admission.hash_slots,
+    settings.admission_hash_wait_in_seconds,
+)
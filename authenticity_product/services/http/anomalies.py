@@ -0,0 +1,343 @@
+"""Counterfeit anomaly detection module.
+
+A genuine code scanned many times, from many places, or from places too far apart for the time
+between its scans, was likely copied onto counterfeits. The detector keeps, for each authentic
+code scanned lately, its first scan, its scan count and its latest scans with their coarse
+location, in a bounded LRU so that the memory does not grow with the codes. It is fed by the
+scans the service records, and never reads the scan events back.
+
+Each worker sees its own scans. A checkpoint locks the stored activity of the codes scanned
+since the previous one, merges it with the scans of the worker, so that the workers learn the
+scans of each other, stores it back and flags the codes whose merged window is suspicious. On
+startup, the activity of the codes scanned within the window is loaded back.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from authenticity_product.models import CodeActivity, SuspiciousCode
+from authenticity_product.schemas import CodeActivityRead, SuspiciousCodeRead
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.metrics import ANOMALY_TRACKED_CODES, SUSPICIOUS_CODES
+from authenticity_product.services.http.users import current_admin_user
+
+
+logger = logging.getLogger(__name__)
+
+# epoch seconds, coarse latitude and longitude, country
+Scan = tuple[float, float | None, float | None, str | None]
+EARTH_RADIUS_IN_KM = 6371
+# below, the distance may only come from the rounding of the positions
+MIN_TRAVEL_IN_KM = 100
+
+
+def distance_in_km(first: Scan, second: Scan) -> float | None:
+    """Return the great-circle distance between two scans, unless one has no position."""
+    if None in (first[1], first[2], second[1], second[2]):
+        return None
+    latitude, other_latitude = math.radians(first[1] or 0), math.radians(second[1] or 0)
+    half_chord = (
+        math.sin((other_latitude - latitude) / 2) ** 2
+        + math.cos(latitude)
+        * math.cos(other_latitude)
+        * math.sin(math.radians((second[2] or 0) - (first[2] or 0)) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_IN_KM * math.asin(math.sqrt(half_chord))
+
+
+def location(scan: Scan) -> Any:
+    """Return the place of a scan, its country or else its position."""
+    return scan[3] or (None if scan[1] is None else (scan[1], scan[2]))
+
+
+class Activity:
+    """First scan, scan count and latest scans of a code."""
+
+    __slots__ = ("product_id", "first_seen", "scans", "unsaved", "recent")
+
+    def __init__(self, product_id: int | None, first_seen: float):
+        self.product_id = product_id
+        self.first_seen = first_seen
+        self.scans = 0
+        self.unsaved = 0
+        self.recent: list[Scan] = []
+
+    def add(self, scan: Scan, max_recent: int) -> None:
+        """Count a scan, keeping the latest ones only."""
+        self.recent.append(scan)
+        del self.recent[:-max_recent]
+        self.scans += 1
+        self.unsaved += 1
+
+    def merge(self, row: Any, max_recent: int) -> None:
+        """Merge the activity stored by the workers with the scans not saved yet."""
+        self.first_seen = min(self.first_seen, row.first_seen_at.timestamp())
+        self.scans = row.scans + self.unsaved
+        self.recent = sorted(
+            set(self.recent) | {tuple(scan) for scan in row.recent}, key=lambda scan: scan[0]
+        )
+        del self.recent[:-max_recent]
+
+
+class AnomalyDetector:
+    """Sliding windows of the scans of the authentic codes, flagging the suspicious ones."""
+
+    def __init__(
+        self,
+        window_in_seconds: float,
+        max_scans: int,
+        max_locations: int,
+        max_speed_in_kmh: float,
+        max_codes: int,
+        checkpoint_interval_in_seconds: float,
+        batch_size: int = 1000,
+    ):
+        self.window_in_seconds = window_in_seconds
+        self.max_scans = max_scans
+        self.max_locations = max_locations
+        self.max_speed_in_kmh = max_speed_in_kmh
+        self.max_codes = max_codes
+        self.checkpoint_interval_in_seconds = checkpoint_interval_in_seconds
+        self.batch_size = batch_size
+        # enough scans to tell a code went over any of the limits
+        self.max_recent = max(max_scans, max_locations) + 1
+        self._activities: OrderedDict[str, Activity] = OrderedDict()
+        self._dirty: dict[str, Activity] = {}
+        self._task: asyncio.Task[None] | None = None
+        ANOMALY_TRACKED_CODES.set_function(lambda: len(self._activities))
+
+    def observe(
+        self,
+        code: str,
+        product_id: int | None,
+        latitude: float | None,
+        longitude: float | None,
+        country: str | None,
+        scanned_at: float | None = None,
+    ) -> None:
+        """Add the scan of an authentic code to its window."""
+        scanned_at = time.time() if scanned_at is None else scanned_at
+        if (activity := self._activities.get(code)) is None:
+            activity = self._activities[code] = Activity(product_id, scanned_at)
+            while len(self._activities) > self.max_codes:
+                self._activities.popitem(last=False)
+        else:
+            self._activities.move_to_end(code)
+        activity.add((scanned_at, latitude, longitude, country), self.max_recent)
+        # kept until saved, even once evicted
+        self._dirty[code] = activity
+
+    def anomalies(self, activity: Activity, now: float) -> tuple[list[str], int, int]:
+        """Return the reasons a code looks counterfeit, its scans and places in the window."""
+        recent = [scan for scan in activity.recent if scan[0] > now - self.window_in_seconds]
+        locations = len({location(scan) for scan in recent} - {None})
+        reasons = []
+        if len(recent) > self.max_scans:
+            reasons.append("scans")
+        if locations > self.max_locations:
+            reasons.append("locations")
+        for previous, scan in itertools.pairwise(recent):
+            distance = distance_in_km(previous, scan)
+            if distance is not None and distance > MIN_TRAVEL_IN_KM:
+                hours = max(scan[0] - previous[0], 1) / 3600
+                if distance / hours > self.max_speed_in_kmh:
+                    reasons.append("travel")
+                    break
+        return reasons, len(recent), locations
+
+    async def load(self) -> None:
+        """Load the activity of the codes scanned within the window."""
+        async with async_session_maker() as session:
+            rows = (
+                await session.execute(
+                    select(CodeActivity)
+                    .where(
+                        CodeActivity.last_seen_at
+                        > datetime.now() - timedelta(seconds=self.window_in_seconds)
+                    )
+                    .order_by(CodeActivity.last_seen_at.desc())
+                    .limit(self.max_codes)
+                )
+            ).scalars()
+            for row in reversed(rows.all()):
+                activity = Activity(row.product_id, row.first_seen_at.timestamp())
+                activity.merge(row, self.max_recent)
+                self._activities[row.code] = activity
+
+    async def checkpoint(self) -> None:
+        """Save the activity of the codes scanned since the last checkpoint, and flag them."""
+        dirty, self._dirty = self._dirty, {}
+        # locked in the same order by every worker
+        codes = sorted(dirty)
+        try:
+            for start in range(0, len(codes), self.batch_size):
+                await self.save(
+                    {code: dirty[code] for code in codes[start : start + self.batch_size]}
+                )
+        except BaseException:
+            for code in codes:
+                self._dirty.setdefault(code, dirty[code])
+            raise
+
+    async def save(self, activities: dict[str, Activity]) -> None:
+        """Merge, save and check the activity of codes in a transaction."""
+        now = time.time()
+        async with async_session_maker() as session:
+            stored = await session.execute(
+                select(CodeActivity)
+                .where(CodeActivity.code.in_(list(activities)))
+                .with_for_update()
+            )
+            for row in stored.scalars():
+                activities[row.code].merge(row, self.max_recent)
+            # the scans observed while the statement runs are left for the next checkpoint
+            saved = {code: activity.unsaved for code, activity in activities.items()}
+            statement = insert(CodeActivity).values(
+                [
+                    {
+                        "code": code,
+                        "product_id": activity.product_id,
+                        "first_seen_at": datetime.fromtimestamp(activity.first_seen),
+                        "last_seen_at": datetime.fromtimestamp(activity.recent[-1][0]),
+                        "scans": activity.scans,
+                        "recent": activity.recent,
+                        "created_at": datetime.now(),
+                        "updated_at": datetime.now(),
+                    }
+                    for code, activity in activities.items()
+                ]
+            )
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[CodeActivity.code],
+                    set_={
+                        column: statement.excluded[column]
+                        for column in ("first_seen_at", "last_seen_at", "scans", "recent")
+                    },
+                )
+            )
+            flags: list[dict[str, Any]] = []
+            for code, activity in activities.items():
+                reasons, scans, locations = self.anomalies(activity, now)
+                flags.extend(
+                    {
+                        "code": code,
+                        "product_id": activity.product_id,
+                        "reason": reason,
+                        "scans": scans,
+                        "locations": locations,
+                        "first_seen_at": datetime.fromtimestamp(activity.first_seen),
+                        "flagged_at": datetime.fromtimestamp(now),
+                        "created_at": datetime.now(),
+                        "updated_at": datetime.now(),
+                    }
+                    for reason in reasons
+                )
+            if flags:
+                flag_statement = insert(SuspiciousCode).values(flags)
+                flagged = await session.execute(
+                    flag_statement.on_conflict_do_update(
+                        index_elements=[SuspiciousCode.code, SuspiciousCode.reason],
+                        set_={
+                            column: flag_statement.excluded[column]
+                            for column in ("scans", "locations", "flagged_at", "updated_at")
+                        },
+                    ).returning(SuspiciousCode.reason, literal_column("xmax = 0").label("new"))
+                )
+                for reason, new in flagged.all():
+                    if new:
+                        SUSPICIOUS_CODES.labels(reason).inc()
+            await session.commit()
+        for code, activity in activities.items():
+            activity.unsaved -= saved[code]
+
+    async def run(self) -> None:
+        """Checkpoint the activity forever."""
+        while True:
+            await asyncio.sleep(self.checkpoint_interval_in_seconds)
+            try:
+                await self.checkpoint()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Anomaly detection checkpoint failed")
+
+    async def start(self) -> None:
+        """Load the activity within the window, and checkpoint it in the background."""
+        try:
+            await self.load()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Loading the scan activity failed, the windows start empty")
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the checkpoints, saving the activity a last time."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        try:
+            await self.checkpoint()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Last anomaly detection checkpoint failed")
+
+
+anomaly_detector = AnomalyDetector(
+    settings.anomaly_window_in_seconds,
+    settings.anomaly_max_scans,
+    settings.anomaly_max_locations,
+    settings.anomaly_max_speed_in_kmh,
+    settings.anomaly_max_codes,
+    settings.anomaly_checkpoint_interval_in_seconds,
+)
+
+
+def get_anomaly_router() -> APIRouter:
+    """Return the admin routes of the suspicious codes."""
+    router = APIRouter(dependencies=[Depends(current_admin_user)])
+
+    @router.get("", response_model=list[SuspiciousCodeRead])
+    async def list_suspicious_codes(
+        product_id: int | None = None,
+        before: int | None = None,
+        limit: int = Query(100, ge=1, le=1000),
+    ) -> list[SuspiciousCode]:
+        """Return the latest suspicious codes, those flagged before an id for the next page."""
+        statement = select(SuspiciousCode).order_by(SuspiciousCode.id.desc()).limit(limit)
+        if product_id is not None:
+            statement = statement.where(SuspiciousCode.product_id == product_id)
+        if before is not None:
+            statement = statement.where(SuspiciousCode.id < before)
+        async with async_session_maker() as session:
+            return list((await session.execute(statement)).scalars())
+
+    @router.get("/{code}", response_model=CodeActivityRead)
+    async def read_activity(code: str) -> dict[str, Any]:
+        """Return the activity of a code as of the last checkpoint, with its flags."""
+        async with async_session_maker() as session:
+            if (activity := await session.get(CodeActivity, code)) is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+            flags = await session.execute(
+                select(SuspiciousCode)
+                .where(SuspiciousCode.code == code)
+                .order_by(SuspiciousCode.id)
+            )
+            return {
+                "code": activity.code,
+                "product_id": activity.product_id,
+                "first_seen_at": activity.first_seen_at,
+                "last_seen_at": activity.last_seen_at,
+                "scans": activity.scans,
+                "flags": list(flags.scalars()),
+            }
+
+    return router
@@ -0,0 +1,63 @@
+"""Login audit routes module.
+
+The login attempts recorded are read by the admins by keyset pages, the latest attempts first,
+filtered by user, identifier and time range.
+"""
+import uuid
+from datetime import datetime
+from typing import Any
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import literal, select, tuple_
+from authenticity_product.models import LoginAttempt
+from authenticity_product.schemas import LoginAttemptPage
+from authenticity_product.services.http.cursors import decode_cursor, encode_cursor
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.users import current_admin_user
+
+
+def get_login_audit_router() -> APIRouter:
+    """Return the admin routes of the login audit trail."""
+    router = APIRouter(dependencies=[Depends(current_admin_user)])
+
+    @router.get("/logins", response_model=LoginAttemptPage)
+    async def list_login_attempts(
+        user_id: uuid.UUID | None = None,
+        identifier: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        after: str | None = None,
+        limit: int = Query(100, ge=1, le=1000),
+    ) -> dict[str, Any]:
+        """Return a page of the login attempts, latest first, and the next page cursor."""
+        statement = (
+            select(LoginAttempt)
+            .order_by(LoginAttempt.attempted_at.desc(), LoginAttempt.id.desc())
+            .limit(limit)
+        )
+        if user_id is not None:
+            statement = statement.where(LoginAttempt.user_id == user_id)
+        if identifier is not None:
+            statement = statement.where(LoginAttempt.identifier == identifier)
+        if start is not None:
+            statement = statement.where(LoginAttempt.attempted_at >= start)
+        if end is not None:
+            statement = statement.where(LoginAttempt.attempted_at < end)
+        if after:
+            key = decode_cursor(after, datetime.fromisoformat, int)
+            statement = statement.where(
+                tuple_(LoginAttempt.attempted_at, LoginAttempt.id)
+                < tuple_(*(literal(value) for value in key))
+            )
+        async with async_session_maker() as session:
+            page = list((await session.execute(statement)).scalars())
+        return {
+            "items": page,
+            "next": (
+                encode_cursor([str(page[-1].attempted_at), page[-1].id])
+                if len(page) == limit
+                else None
+            ),
+        }
+
+    return router
@@ -0,0 +1,168 @@
+"""Batched writes module.
+
+Rows recorded on the request path, such as the scan events, are queued in memory and written
+by a background task with ``COPY``, a batch being flushed once full or once its first row has
+waited for the flush interval, so that a request never waits for an INSERT. The queue is
+bounded: when the database falls behind, new rows are dropped and counted rather than letting
+memory grow, and the rows still queued or being written when the shutdown timeout expires are
+counted as lost.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.metrics import (
+    BATCH_WRITER_FLUSH_LATENCY,
+    BATCH_WRITER_QUEUE_SIZE,
+    BATCH_WRITER_ROWS,
+)
+from authenticity_product.services.http.partitions import (
+    create_partition,
+    month_start,
+    next_month,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+    """Background writer of the rows of a table, in batches."""
+
+    def __init__(
+        self,
+        table: str,
+        columns: Sequence[str],
+        partition_column: str | None = None,
+        queue_size: int = 100_000,
+        batch_size: int = 5000,
+        flush_interval_in_seconds: float = 1,
+        shutdown_timeout_in_seconds: float = 5,
+    ):
+        self.table = table
+        self.columns = list(columns)
+        self.partition_index = columns.index(partition_column) if partition_column else None
+        self.batch_size = batch_size
+        self.flush_interval_in_seconds = flush_interval_in_seconds
+        self.shutdown_timeout_in_seconds = shutdown_timeout_in_seconds
+        self.queue: asyncio.Queue[tuple[Any, ...]] = asyncio.Queue(queue_size)
+        self._partitions: set[datetime] = set()
+        self._batch: list[tuple[Any, ...]] = []
+        # the batch being written, kept until its write ends to be counted if it is interrupted
+        self._flushing: list[tuple[Any, ...]] = []
+        self._writing: asyncio.Future[None] | None = None
+        self._task: asyncio.Task[None] | None = None
+        BATCH_WRITER_QUEUE_SIZE.labels(table).set_function(self.queue.qsize)
+
+    def add(self, row: tuple[Any, ...]) -> bool:
+        """Queue a row, and return whether it was accepted rather than dropped."""
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            BATCH_WRITER_ROWS.labels(self.table, "dropped").inc()
+            return False
+        return True
+
+    async def collect(self) -> None:
+        """Wait for a row, then collect rows until the batch is full or the interval expired.
+
+        The rows are collected on the writer, so that none is lost when it is cancelled.
+        """
+        self._batch.append(await self.queue.get())
+        deadline = time.monotonic() + self.flush_interval_in_seconds
+        while len(self._batch) < self.batch_size:
+            if self.queue.empty():
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), deadline - time.monotonic())
+                except asyncio.TimeoutError:
+                    return
+                self._batch.append(row)
+            else:
+                self._batch.append(self.queue.get_nowait())
+
+    async def create_partitions(self, connection: AsyncConnection, months: set[datetime]) -> None:
+        """Create the partitions of months not known yet, and of the months following them."""
+        for month in sorted(months - self._partitions):
+            await create_partition(connection, self.table, month)
+            await create_partition(connection, self.table, next_month(month))
+            self._partitions.add(month)
+
+    async def write(self, batch: list[tuple[Any, ...]]) -> None:
+        """Copy a batch of rows, creating the partitions it reaches."""
+        with BATCH_WRITER_FLUSH_LATENCY.labels(self.table).time():
+            async with engine_async.connect() as connection:
+                if self.partition_index is not None:
+                    months = {month_start(row[self.partition_index]) for row in batch}
+                    await self.create_partitions(connection, months)
+                driver_connection: Any = (await connection.get_raw_connection()).driver_connection
+                await driver_connection.copy_records_to_table(
+                    self.table, records=batch, columns=self.columns
+                )
+        BATCH_WRITER_ROWS.labels(self.table, "written").inc(len(batch))
+
+    async def flush(self, batch: list[tuple[Any, ...]]) -> None:
+        """Write a batch, retried once, counting its rows as failed rather than raising."""
+        for attempt in range(2):
+            try:
+                await self.write(batch)
+                return
+            except Exception:  # pylint: disable=broad-except
+                # the partitions are checked again, one may have been dropped meanwhile
+                self._partitions.clear()
+                if attempt:
+                    logger.exception(f"Writing {len(batch)} rows to {self.table} failed")
+        BATCH_WRITER_ROWS.labels(self.table, "failed").inc(len(batch))
+
+    async def run(self) -> None:
+        """Write the queued rows forever."""
+        while True:
+            await self.collect()
+            self._flushing, self._batch = self._batch, []
+            # a write under way is completed by stop rather than cancelled
+            self._writing = asyncio.ensure_future(self.flush(self._flushing))
+            await asyncio.shield(self._writing)
+            self._flushing = []
+
+    async def drain(self) -> None:
+        """Complete the write under way, then write the rows collected and queued."""
+        if self._writing is not None:
+            await self._writing
+            self._flushing = []
+        while self._batch or not self.queue.empty():
+            while len(self._batch) < self.batch_size and not self.queue.empty():
+                self._batch.append(self.queue.get_nowait())
+            # kept collected until written, to be counted if the timeout interrupts it
+            await self.flush(self._batch)
+            self._batch = []
+
+    async def start(self) -> None:
+        """Start writing the queued rows in the background, once the partitions are ready."""
+        if self.partition_index is not None:
+            try:
+                async with engine_async.connect() as connection:
+                    await self.create_partitions(connection, {month_start(datetime.now())})
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Creating the partitions of {self.table} failed")
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop writing, once the rows queued are written or the shutdown timeout expired."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.drain(), self.shutdown_timeout_in_seconds)
+        if lost := len(self._flushing) + len(self._batch) + self.queue.qsize():
+            logger.error(f"{lost} rows of {self.table} lost on shutdown")
+            BATCH_WRITER_ROWS.labels(self.table, "lost").inc(lost)
+            self._flushing, self._batch = [], []
+            while not self.queue.empty():
+                self.queue.get_nowait()
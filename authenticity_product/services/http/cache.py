@@ -0,0 +1,145 @@
+"""Principal and verified token cache module."""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Protocol
+from uuid import UUID
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from authenticity_product.models import User
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.shared_cache import SharedMemoryCache
+
+
+class CacheBackend(Protocol):
+    """Storage of the cached values."""
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value, or None if it is missing or expired."""
+
+    def set(self, key: str, value: Any, ttl_in_seconds: float | None = None) -> None:
+        """Store a value, for the default time to live of the cache unless given."""
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache."""
+
+    def clear(self) -> None:
+        """Remove every value from the cache."""
+
+
+class TTLCache:
+    """In-process LRU cache whose entries expire after a fixed time to live."""
+
+    def __init__(self, max_size: int, ttl_in_seconds: float):
+        self.max_size = max_size
+        self.ttl_in_seconds = ttl_in_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value, or None if it is missing or expired."""
+        if (entry := self._entries.get(key)) is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_in_seconds: float | None = None) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        ttl_in_seconds = self.ttl_in_seconds if ttl_in_seconds is None else ttl_in_seconds
+        self._entries[key] = (time.monotonic() + ttl_in_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every value from the cache."""
+        self._entries.clear()
+
+
+class PrincipalCache:
+    """Cache of authenticated users keyed by id.
+
+    Only column values are stored, every hit builds a new detached ``User`` so that
+    concurrent requests never share an instance attached to their own session.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def get(self, user_id: UUID) -> User | None:
+        """Return a detached copy of the cached user."""
+        if (values := self.backend.get(str(user_id))) is None:
+            return None
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def set(self, user: User) -> None:
+        """Cache the column values of a user."""
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        self.backend.set(str(user.id), values)
+
+    def invalidate(self, user_id: UUID) -> None:
+        """Drop a user from the cache."""
+        self.backend.delete(str(user_id))
+
+
+class TokenCache:
+    """Cache of the user ids of the tokens whose signature was verified, keyed by their hash.
+
+    An entry never outlives its token, so a hit is as good as decoding the token again.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def key(token: str) -> str:
+        """Return the key of a token, which is not stored itself."""
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> str | None:
+        """Return the user id of a verified token."""
+        user_id: str | None = self.backend.get(self.key(token))
+        return user_id
+
+    def set(self, token: str, user_id: str, expires_at: float | None) -> None:
+        """Cache the user id of a verified token until it expires."""
+        ttl_in_seconds = None
+        if expires_at is not None:
+            if (ttl_in_seconds := expires_at - time.time()) <= 0:
+                return
+            ttl_in_seconds = min(ttl_in_seconds, settings.token_cache_ttl_in_seconds)
+        self.backend.set(self.key(token), user_id, ttl_in_seconds)
+
+
+def get_backend(name: str, max_size: int, ttl_in_seconds: float, slot_size: int) -> CacheBackend:
+    """Return a cache backend, shared by the workers of the host if configured."""
+    if settings.cache_backend == "shared":
+        return SharedMemoryCache(
+            f"{settings.shared_cache_name}_{name}", max_size, slot_size, ttl_in_seconds
+        )
+    return TTLCache(max_size, ttl_in_seconds)
+
+
+principal_cache = PrincipalCache(
+    get_backend(
+        "principal",
+        settings.principal_cache_max_size,
+        settings.principal_cache_ttl_in_seconds,
+        slot_size=1024,
+    )
+)
+token_cache = TokenCache(
+    get_backend(
+        "token", settings.token_cache_max_size, settings.token_cache_ttl_in_seconds, slot_size=128
+    )
+)
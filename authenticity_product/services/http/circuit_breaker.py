@@ -0,0 +1,132 @@
+"""Database circuit breaker module."""
+import logging
+import time
+from typing import Any
+
+from asyncpg import exceptions as asyncpg_exceptions
+from fastapi import HTTPException, status
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+
+logger = logging.getLogger(__name__)
+
+# the errors of asyncpg meaning the connection to the database was lost or refused
+ASYNCPG_CONNECTION_ERRORS = (
+    asyncpg_exceptions.PostgresConnectionError,
+    asyncpg_exceptions.ConnectionDoesNotExistError,
+    asyncpg_exceptions.CannotConnectNowError,
+)
+# the SQLSTATE of the connection exceptions, and of a server shutting down or starting up
+DISCONNECT_SQLSTATES = ("08", "57P01", "57P02", "57P03")
+# errors which may mean that the database could not be reached, told apart from a failing
+# statement by is_disconnect
+CONNECTION_ERRORS = (
+    exc.DBAPIError,
+    exc.TimeoutError,
+    ConnectionError,
+    TimeoutError,
+)
+# the errors answered with a 503, raised by the database drivers only, as a builtin timeout or
+# connection error may as well come from any outbound call of a request
+DATABASE_UNAVAILABLE_ERRORS = (exc.DBAPIError, exc.TimeoutError, *ASYNCPG_CONNECTION_ERRORS)
+
+
+def is_disconnect(error: BaseException) -> bool:
+    """Tell whether an error means the database could not be reached, not that a statement failed.
+
+    The statement timeouts, deadlocks and lock timeouts carry their SQLSTATE, while a driver
+    failing before the server answered has none.
+    """
+    if isinstance(error, exc.DBAPIError):
+        if error.connection_invalidated or isinstance(
+            error.orig.__cause__, ASYNCPG_CONNECTION_ERRORS
+        ):
+            return True
+        sqlstate = getattr(error.orig, "pgcode", None)
+        return isinstance(error, exc.OperationalError) and (
+            sqlstate is None or sqlstate.startswith(DISCONNECT_SQLSTATES)
+        )
+    return isinstance(
+        error, (exc.TimeoutError, ConnectionError, TimeoutError, *ASYNCPG_CONNECTION_ERRORS)
+    )
+
+
+class CircuitBreaker:
+    """Circuit breaker opening after consecutive failures to reach the database.
+
+    While it is open, requests are rejected at once instead of waiting for a connection. Once
+    the reset timeout elapsed, one request per timeout is let through to try the database again,
+    and the first success closes the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout_in_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_in_seconds = reset_timeout_in_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        """Return closed, open, or half-open once a trial is due."""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout_in_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Check whether a request may use the database."""
+        if (state := self.state) == "half-open":
+            # re-arm the timeout so that a single trial runs until it succeeds or fails
+            self.opened_at = time.monotonic()
+        return state != "open"
+
+    def record_success(self) -> None:
+        """Close the breaker."""
+        if self.opened_at is not None:
+            logger.info("Database reachable again, circuit breaker closed")
+        self.failures, self.opened_at = 0, None
+
+    def record_failure(self) -> None:
+        """Count a failure, and open the breaker once the threshold is reached."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.error(f"Database unreachable {self.failures} times, circuit breaker opened")
+            self.opened_at = time.monotonic()
+
+    def record_error(self, error: BaseException) -> None:
+        """Count an error as a failure if it means the database could not be reached."""
+        if is_disconnect(error):
+            self.record_failure()
+
+    def check(self) -> None:
+        """Reject the request with a 503 while the breaker is open."""
+        if not self.allow():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Database unavailable",
+                headers={"Retry-After": str(int(self.reset_timeout_in_seconds))},
+            )
+
+    def watch(self, engine: Engine) -> None:
+        """Close the breaker whenever the pool of an engine hands out a connection."""
+        event.listen(engine, "checkout", self.on_checkout)
+
+    def on_checkout(self, *args: Any) -> None:
+        """Record a successful connection checkout."""
+        if self.failures:
+            self.record_success()
+
+
+async def database_unavailable_handler(request: Request, error: Exception) -> JSONResponse:
+    """Answer with a 503 when the database could not be reached while serving a request."""
+    if not is_disconnect(error):
+        raise error
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database unavailable"},
+    )
@@ -0,0 +1,317 @@
+"""Bloom filter of the serial codes module.
+
+Most forged codes are random strings that were never issued. A Bloom filter of every serial
+code tells such a code is unknown without a query: a code missing from the filter is certainly
+unknown, while a code it holds is looked up as before, which counts its false positives.
+
+The filter is a file mapped in memory by every worker of the host. A single worker, holding an
+exclusive lock on a companion file, builds it from ``serial_code`` then adds the codes past the
+last id it read, the others only mapping it, so that no two processes set the bits of a byte
+concurrently. The file keeps the last id read, so a restarted worker reads on from there rather
+than building it again. It keeps as well the identity of the table read, so that it is built
+again once read from another database, or from this one before a restore or a reseed, as it is
+when the highest id of the table is below the last id read. Once the codes outgrow the capacity
+it was sized for, a larger filter is built aside and renamed over the file, the other workers
+mapping it again when they see it.
+
+Ids are allocated before their transaction commits, so a code may show after codes of higher
+ids. The gaps in the ids read are read again until every transaction running when they were
+seen has ended, after which they are rolled back inserts or collisions.
+"""
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+from collections.abc import Iterable
+from typing import BinaryIO
+
+from sqlalchemy import text
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.id_gaps import IdGaps, take_snapshot
+from authenticity_product.services.http.metrics import (
+    CODE_FILTER_CODES,
+    CODE_FILTER_FALSE_POSITIVE_RATE,
+)
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"APBLOOM2"
+# magic, bit count, hash count, the codes added and the id up to which all were read, then the
+# identity of the table read
+HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+PROGRESS = struct.Struct("<QQ")
+PROGRESS_OFFSET = 24
+# the table is another one once the database or the table was created again, or truncated
+IDENTITY_STATEMENT = text(
+    "SELECT (SELECT oid FROM pg_database WHERE datname = current_database())::bigint "
+    "AS database, 'serial_code'::regclass::oid::bigint AS relation, "
+    "pg_relation_filenode('serial_code')::bigint AS filenode, "
+    "(SELECT max(id) FROM serial_code) AS max_id"
+)
+READ_STATEMENT = text("SELECT id, code FROM serial_code WHERE id > :after ORDER BY id LIMIT :limit")
+
+
+def sizing(capacity: int, false_positive_rate: float) -> tuple[int, int]:
+    """Return the bits and hashes of a filter of a capacity with a false positive rate."""
+    bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+    bits = max(8, bits + -bits % 8)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+class BloomFilter:
+    """Bit array of a Bloom filter, mapped from a file."""
+
+    def __init__(self, path: str):
+        with open(path, "r+b") as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self._map = mmap.mmap(file.fileno(), 0)
+        magic, self.bits, self.hashes, _, _, self.identity = HEADER.unpack_from(self._map)
+        if magic != MAGIC or len(self._map) != HEADER_SIZE + self.bits // 8:
+            self._map.close()
+            raise ValueError(f"{path} is not a Bloom filter")
+
+    @classmethod
+    def create(
+        cls, path: str, capacity: int, false_positive_rate: float, identity: int = 0
+    ) -> "BloomFilter":
+        """Create an empty filter of the codes of a table, replacing the file if any."""
+        bits, hashes = sizing(capacity, false_positive_rate)
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, bits, hashes, 0, 0, identity).ljust(HEADER_SIZE, b"\0"))
+            file.truncate(HEADER_SIZE + bits // 8)
+        return cls(path)
+
+    def positions(self, code: str) -> list[int]:
+        """Return the bits of a code, from two halves of its hash."""
+        digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [
+            HEADER_SIZE * 8 + (first + index * second) % self.bits for index in range(self.hashes)
+        ]
+
+    def __contains__(self, code: str) -> bool:
+        """Tell whether a code may have been added."""
+        return all(self._map[bit >> 3] >> (bit & 7) & 1 for bit in self.positions(code))
+
+    def add(self, codes: Iterable[str]) -> None:
+        """Set the bits of codes."""
+        added = 0
+        for code in codes:
+            new = False
+            for bit in self.positions(code):
+                if not (byte := self._map[bit >> 3]) >> (bit & 7) & 1:
+                    self._map[bit >> 3] = byte | 1 << (bit & 7)
+                    new = True
+            added += new
+        count, last_id = PROGRESS.unpack_from(self._map, PROGRESS_OFFSET)
+        PROGRESS.pack_into(self._map, PROGRESS_OFFSET, count + added, last_id)
+
+    @property
+    def count(self) -> int:
+        """Return the number of codes added, those hashing to bits all set being missed."""
+        return int(PROGRESS.unpack_from(self._map, PROGRESS_OFFSET)[0])
+
+    @property
+    def last_id(self) -> int:
+        """Return the id up to which every code was added."""
+        return int(PROGRESS.unpack_from(self._map, PROGRESS_OFFSET)[1])
+
+    @last_id.setter
+    def last_id(self, last_id: int) -> None:
+        PROGRESS.pack_into(self._map, PROGRESS_OFFSET, self.count, last_id)
+
+    def false_positive_rate(self) -> float:
+        """Return the false positive rate expected from the codes added."""
+        return float((1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes)
+
+    def close(self) -> None:
+        """Unmap the file."""
+        self._map.close()
+
+
+class CodeFilter:
+    """Bloom filter of the serial codes shared by the workers of a host, kept up to date by one."""
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int,
+        false_positive_rate: float,
+        refresh_interval_in_seconds: float,
+        batch_size: int = 50000,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.refresh_interval_in_seconds = refresh_interval_in_seconds
+        self.batch_size = batch_size
+        self.bloom: BloomFilter | None = None
+        self._gaps = IdGaps()
+        self._lock_file: BinaryIO | None = None
+        self._writing = asyncio.Lock()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def writer(self) -> bool:
+        """Tell whether this process keeps the filter up to date."""
+        return self._lock_file is not None
+
+    def might_contain(self, code: str) -> bool:
+        """Tell whether a code may have been issued, always so until the filter is built."""
+        return self.bloom is None or code in self.bloom
+
+    async def add(self, codes: list[str]) -> None:
+        """Add the codes issued by this process, the writer reading them later otherwise."""
+        # while the filter is being read or rebuilt, its next reading adds the codes
+        if self.writer and self.bloom is not None and not self._writing.locked():
+            async with self._writing:
+                await asyncio.to_thread(self.bloom.add, codes)
+
+    def elect(self) -> bool:
+        """Take the lock making this process the writer, unless another process holds it."""
+        lock_file = open(f"{self.path}.lock", "ab")  # pylint: disable=consider-using-with
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def attach(self) -> None:
+        """Map the filter, again once it was replaced, unless there is none yet."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        if self.bloom is None or self.bloom.inode != inode:
+            previous, self.bloom = self.bloom, BloomFilter(self.path)
+            if previous is not None:
+                previous.close()
+
+    async def refresh(self) -> None:
+        """Map the latest filter, and bring it up to date if this process is the writer."""
+        if self.writer or self.elect():
+            async with self._writing:
+                with contextlib.suppress(ValueError):
+                    self.attach()
+                identity, max_id = await self.identify()
+                if self.bloom is not None and (
+                    self.bloom.identity != identity or self.bloom.last_id > max_id
+                ):
+                    logger.warning(
+                        "The Bloom filter of the serial codes was read from another table, "
+                        "building it again"
+                    )
+                    await self.build(identity)
+                elif self.bloom is None or (
+                    self.bloom.false_positive_rate() > 2 * self.false_positive_rate
+                ):
+                    await self.build(identity)
+                else:
+                    await self.read(self.bloom)
+        else:
+            self.attach()
+        if self.bloom is not None:
+            CODE_FILTER_CODES.set(self.bloom.count)
+            CODE_FILTER_FALSE_POSITIVE_RATE.set(self.bloom.false_positive_rate())
+
+    @staticmethod
+    async def identify() -> tuple[int, int]:
+        """Return the identity of the table of the codes, and its highest id."""
+        async with engine_async.connect() as connection:
+            row = (await connection.execute(IDENTITY_STATEMENT)).one()
+        digest = hashlib.blake2b(
+            f"{row.database}:{row.relation}:{row.filenode}".encode(), digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "little"), row.max_id or 0
+
+    async def build(self, identity: int) -> None:
+        """Build a filter of every code of a table aside, then replace the mapped one with it."""
+        async with engine_async.connect() as connection:
+            estimate = await connection.scalar(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'serial_code'::regclass")
+            )
+        # the statistics lag behind the table, unlike the codes of the outgrown filter
+        count = 0 if self.bloom is None else self.bloom.count
+        capacity = max(self.capacity, 2 * int(estimate or 0), 2 * count)
+        logger.info(f"Building the Bloom filter of the serial codes for {capacity} codes")
+        path = f"{self.path}.{os.getpid()}"
+        bloom = BloomFilter.create(path, capacity, self.false_positive_rate, identity)
+        self._gaps.clear()
+        try:
+            await self.read(bloom)
+        except BaseException:
+            bloom.close()
+            os.unlink(path)
+            raise
+        os.replace(path, self.path)
+        previous, self.bloom = self.bloom, bloom
+        if previous is not None:
+            previous.close()
+
+    async def read(self, bloom: BloomFilter) -> None:
+        """Add the codes past the last id read, gaps included, to a filter."""
+        async with engine_async.connect() as connection:
+            snapshot = await take_snapshot(connection)
+            after = last_read = bloom.last_id
+            gaps: list[int] = []
+            while True:
+                rows = (
+                    await connection.execute(
+                        READ_STATEMENT, {"after": last_read, "limit": self.batch_size}
+                    )
+                ).all()
+                for row in rows:
+                    if row.id > last_read + 1 and self._gaps.is_open(last_read + 1, snapshot):
+                        gaps.append(last_read + 1)
+                    last_read = row.id
+                await asyncio.to_thread(bloom.add, [row.code for row in rows])
+                if len(rows) < self.batch_size:
+                    break
+        # the gaps filled since, or closed, are read no more
+        self._gaps.keep(gaps)
+        bloom.last_id = min(gaps, default=last_read + 1) - 1
+        if last_read > after:
+            logger.debug(f"Bloom filter of the serial codes read up to id {last_read}")
+
+    async def run(self) -> None:
+        """Refresh the filter forever."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Bloom filter refresh failed")
+            await asyncio.sleep(self.refresh_interval_in_seconds)
+
+    async def start(self) -> None:
+        """Build or map the filter and keep it up to date in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop refreshing the filter, and hand the writes over to another worker."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+code_filter = CodeFilter(
+    settings.code_filter_path,
+    settings.code_filter_capacity,
+    settings.code_filter_false_positive_rate,
+    settings.code_filter_refresh_interval_in_seconds,
+)
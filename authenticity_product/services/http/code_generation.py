@@ -0,0 +1,246 @@
+"""Bulk serial code generation module.
+
+Codes are generated by a pool of processes in chunks, each copied to a staging table through
+``COPY`` then inserted into ``serial_code`` skipping the codes already taken, and committed
+with the progress of its job. A collision only shows as a chunk inserting fewer codes than it
+carried, the shortfall being generated again with the next chunks, so no code is checked on its
+own. The chunks in flight bound the memory used whatever the size of the batch, and a job
+interrupted resumes from the codes it committed, under an advisory lock held while it runs.
+The codes committed are added to the Bloom filter of the codes right away when this process
+keeps it up to date, see ``code_filter``.
+
+Usage: python -m authenticity_product.services.http.code_generation generate PRODUCT_ID COUNT
+       python -m authenticity_product.services.http.code_generation resume JOB_ID
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from authenticity_product.models import CodeGenerationJob
+from authenticity_product.schemas import CodeGenerationJobCreate, CodeGenerationJobRead
+from authenticity_product.serial_codes import generate_chunk
+from authenticity_product.services.http.code_filter import code_filter
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import async_session_maker, engine_async
+from authenticity_product.services.http.metrics import CODE_COLLISIONS, CODES_GENERATED
+from authenticity_product.services.http.users import current_admin_user
+
+
+logger = logging.getLogger(__name__)
+
+INSERT_STATEMENT = text(
+    "INSERT INTO serial_code (code, product_id, created_at, updated_at) "
+    "SELECT code, :product_id, LOCALTIMESTAMP, LOCALTIMESTAMP FROM code_staging "
+    "ON CONFLICT DO NOTHING"
+)
+PROGRESS_STATEMENT = text(
+    "UPDATE code_generation_job SET generated = generated + :inserted, "
+    "rows_per_second = :rows_per_second, updated_at = LOCALTIMESTAMP WHERE id = :id"
+)
+
+
+async def set_status(
+    connection: AsyncConnection, job_id: int, job_status: str, error: str | None = None
+) -> None:
+    """Set the status of a job and commit it."""
+    await connection.execute(
+        text(
+            "UPDATE code_generation_job SET status = :status, error = :error, "
+            "updated_at = LOCALTIMESTAMP WHERE id = :id"
+        ),
+        {"id": job_id, "status": job_status, "error": error},
+    )
+    await connection.commit()
+
+
+class CodeGenerator:
+    """Runner of the code generation jobs."""
+
+    def __init__(self, chunk_size: int, workers: int):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def create_job(self, product_id: int, count: int) -> CodeGenerationJob:
+        """Record a job generating codes for a product."""
+        async with async_session_maker() as session:
+            job = CodeGenerationJob(product_id=product_id, requested=count, generated=0)
+            session.add(job)
+            await session.commit()
+        return job
+
+    async def insert_chunk(self, connection: AsyncConnection, product_id: int, chunk: bytes) -> int:
+        """Copy a chunk of codes and insert those not taken, and return their number."""
+        await connection.execute(
+            text(
+                "CREATE TEMPORARY TABLE IF NOT EXISTS code_staging (code text) "
+                "ON COMMIT DELETE ROWS"
+            )
+        )
+        driver_connection: Any = (await connection.get_raw_connection()).driver_connection
+        # a buffer rather than bytes, which asyncpg would take for a path
+        await driver_connection.copy_to_table(
+            "code_staging", source=memoryview(chunk), columns=["code"]
+        )
+        result = await connection.execute(INSERT_STATEMENT, {"product_id": product_id})
+        return int(result.rowcount)
+
+    async def run(self, job_id: int) -> None:
+        """Generate the codes a job is missing, unless another process runs it."""
+        async with engine_async.connect() as connection:
+            locked = await connection.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext('code_generation'), :id)"),
+                {"id": job_id},
+            )
+            await connection.commit()
+            if not locked:
+                logger.info(f"Code generation job {job_id} already runs")
+                return
+            try:
+                await self.run_locked(connection, job_id)
+            except Exception as error:
+                await connection.rollback()
+                await set_status(connection, job_id, "failed", str(error))
+                raise
+            finally:
+                # closing the connection releases the lock, whatever state it was left in
+                await connection.invalidate()
+
+    async def run_locked(self, connection: AsyncConnection, job_id: int) -> None:
+        """Generate the codes of a job, each chunk committed with its progress."""
+        job = (
+            await connection.execute(
+                text(
+                    "SELECT product_id, requested, generated FROM code_generation_job "
+                    "WHERE id = :id"
+                ),
+                {"id": job_id},
+            )
+        ).one()
+        remaining = unsubmitted = job.requested - job.generated
+        await set_status(connection, job_id, "running")
+        loop = asyncio.get_running_loop()
+        pending: deque[asyncio.Future[bytes]] = deque()
+        began, inserted_since_start = time.perf_counter(), 0
+        # spawned rather than forked, the process runs threads and an event loop, the chunks
+        # being generated by a module which imports the standard library only
+        pool = ProcessPoolExecutor(self.workers, multiprocessing.get_context("spawn"))
+        try:
+            while remaining > 0:
+                while unsubmitted > 0 and len(pending) < 2 * self.workers:
+                    size = min(self.chunk_size, unsubmitted)
+                    pending.append(loop.run_in_executor(pool, generate_chunk, size))
+                    unsubmitted -= size
+                chunk = await pending.popleft()
+                size = chunk.count(b"\n")
+                inserted = await self.insert_chunk(connection, job.product_id, chunk)
+                remaining -= inserted
+                unsubmitted += size - inserted
+                inserted_since_start += inserted
+                rows_per_second = inserted_since_start / (time.perf_counter() - began)
+                await connection.execute(
+                    PROGRESS_STATEMENT,
+                    {"id": job_id, "inserted": inserted, "rows_per_second": rows_per_second},
+                )
+                await connection.commit()
+                await code_filter.add(chunk.decode().split())
+                CODES_GENERATED.inc(inserted)
+                CODE_COLLISIONS.inc(size - inserted)
+                logger.info(
+                    f"Code generation job {job_id}: {job.requested - remaining}/"
+                    f"{job.requested} codes, {rows_per_second:.0f} rows/s"
+                )
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        await set_status(connection, job_id, "done")
+
+    def start(self, job_id: int) -> None:
+        """Run a job in the background of the application."""
+        task = asyncio.create_task(self.run(job_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self) -> None:
+        """Interrupt the jobs running in the background, they are resumed later."""
+        for task in list(self._tasks):
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+
+
+code_generator = CodeGenerator(
+    settings.code_generation_chunk_size, settings.code_generation_workers
+)
+
+
+async def get_job(job_id: int) -> CodeGenerationJob:
+    """Return a job, or answer with a 404."""
+    async with async_session_maker() as session:
+        if (job := await session.get(CodeGenerationJob, job_id)) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return job
+
+
+def get_code_generation_router() -> APIRouter:
+    """Return the admin routes of the code generation jobs."""
+    router = APIRouter(dependencies=[Depends(current_admin_user)])
+
+    @router.post(
+        "/jobs", status_code=status.HTTP_202_ACCEPTED, response_model=CodeGenerationJobRead
+    )
+    async def create_job(body: CodeGenerationJobCreate) -> CodeGenerationJob:
+        """Generate the codes of a product batch in the background."""
+        job = await code_generator.create_job(body.product_id, body.count)
+        code_generator.start(job.id)
+        return job
+
+    @router.get("/jobs/{job_id}", response_model=CodeGenerationJobRead)
+    async def read_job(job_id: int) -> CodeGenerationJob:
+        """Return the progress of a job."""
+        return await get_job(job_id)
+
+    @router.post(
+        "/jobs/{job_id}/resume",
+        status_code=status.HTTP_202_ACCEPTED,
+        response_model=CodeGenerationJobRead,
+    )
+    async def resume_job(job_id: int) -> CodeGenerationJob:
+        """Resume an interrupted job."""
+        job = await get_job(job_id)
+        if job.status != "done":
+            code_generator.start(job_id)
+        return job
+
+    return router
+
+
+async def main(arguments: argparse.Namespace) -> None:
+    """Create or resume a job and run it in this process."""
+    if arguments.command == "generate":
+        job_id = (await code_generator.create_job(arguments.product_id, arguments.count)).id
+    else:
+        job_id = arguments.job_id
+    await code_generator.run(job_id)
+    job = await get_job(job_id)
+    print(CodeGenerationJobRead.model_validate(job).model_dump_json())
+    await engine_async.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate")
+    generate.add_argument("product_id", type=int)
+    generate.add_argument("count", type=int)
+    commands.add_parser("resume").add_argument("job_id", type=int)
+    asyncio.run(main(parser.parse_args()))
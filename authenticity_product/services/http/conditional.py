@@ -0,0 +1,114 @@
+"""Conditional GET support for user resources."""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import cast
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi_users import exceptions
+from authenticity_product.models import User
+from authenticity_product.schemas import UserRead
+from authenticity_product.services.http.users import (
+    current_active_user,
+    fastapi_users,
+    get_user_manager,
+    UserManager,
+)
+
+
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
+
+
+def user_etag(user: User) -> str:
+    """Return the entity tag of a user, derived from its id and last update."""
+    updated_at = cast(datetime, user.updated_at)
+    return f'"{user.id.hex}-{int(updated_at.timestamp() * 1_000_000):x}"'
+
+
+def user_last_modified(user: User) -> str:
+    """Return the last update of a user formatted as an HTTP date."""
+    return format_datetime(cast(datetime, user.updated_at).astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, updated_at: datetime) -> bool:
+    """Check the request validators against the current state of the resource."""
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        candidates = {
+            candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")
+        }
+        return "*" in candidates or etag in candidates
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return updated_at.astimezone(timezone.utc).replace(microsecond=0) <= since
+    return False
+
+
+def conditional_user_response(request: Request, response: Response, user: User) -> Response | None:
+    """Set the validators of a user response, and return a 304 response when they match."""
+    etag = user_etag(user)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": user_last_modified(user),
+        "Cache-Control": "private, no-cache",
+    }
+    if is_not_modified(request, etag, cast(datetime, user.updated_at)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def get_conditional_users_router() -> APIRouter:
+    """Generate the read routes of users answering conditional requests.
+
+    It must be included before the users router of fastapi users so that its routes take
+    precedence over the unconditional ones.
+    """
+    router = APIRouter()
+
+    @router.get(
+        "/me",
+        response_model=UserRead,
+        name="users:current_user",
+        responses={
+            status.HTTP_304_NOT_MODIFIED: {"description": "The user has not changed."},
+            status.HTTP_401_UNAUTHORIZED: {"description": "Missing token or inactive user."},
+        },
+    )
+    async def me(
+        request: Request, response: Response, user: User = Depends(current_active_user)
+    ) -> UserRead | Response:
+        """Return the current user, or 304 when the client copy is still fresh."""
+        if (not_modified := conditional_user_response(request, response, user)) is not None:
+            return not_modified
+        return UserRead.model_validate(user)
+
+    @router.get(
+        "/{id}",
+        response_model=UserRead,
+        dependencies=[Depends(current_superuser)],
+        name="users:user",
+        responses={
+            status.HTTP_304_NOT_MODIFIED: {"description": "The user has not changed."},
+            status.HTTP_401_UNAUTHORIZED: {"description": "Missing token or inactive user."},
+            status.HTTP_403_FORBIDDEN: {"description": "Not a superuser."},
+            status.HTTP_404_NOT_FOUND: {"description": "The user does not exist."},
+        },
+    )
+    async def user(
+        id: str,  # pylint: disable=redefined-builtin
+        request: Request,
+        response: Response,
+        user_manager: UserManager = Depends(get_user_manager),
+    ) -> UserRead | Response:
+        """Return a user, or 304 when the client copy is still fresh."""
+        try:
+            found = await user_manager.get(user_manager.parse_id(id))
+        except (exceptions.UserNotExists, exceptions.InvalidID) as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND) from e
+        if (not_modified := conditional_user_response(request, response, found)) is not None:
+            return not_modified
+        return UserRead.model_validate(found)
+
+    return router
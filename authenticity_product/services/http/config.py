@@ -1,4 +1,5 @@
 """Config module."""
+import functools
 import json
 import os
 from typing import Any
@@ -10,25 +11,48 @@ from fastapi.exceptions import RequestValidationError
 from fastapi.security import OAuth2PasswordBearer
 from fastapi_pagination import add_pagination
 from jwcrypto.jwk import JWK
+from opentelemetry.trace import SpanKind
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import JSONResponse
-from authenticity_product.services.http import private_key, rsa_key
+from authenticity_product.services.http import get_product_code_key, get_rsa_key
+from authenticity_product.services.http.circuit_breaker import (
+    CircuitBreaker,
+    CONNECTION_ERRORS,
+    DATABASE_UNAVAILABLE_ERRORS,
+    database_unavailable_handler,
+)
+from authenticity_product.services.http.metrics import (
+    metrics_endpoint,
+    pool_collector,
+    PrometheusMiddleware,
+)
+from authenticity_product.services.http.sql_instrumentation import (
+    QueryInstrumentation,
+    QueryStatsMiddleware,
+)
+from authenticity_product.services.http.structured_logging import LogContextMiddleware
+from authenticity_product.services.http.tracing import tracer, TracingMiddleware
 
 
-public_key_web_content = None
-
-if public_key_url := os.environ["PUBLIC_KEY_URL"] if os.getenv("PUBLIC_KEY_URL") else None:
-    with urlopen(os.environ["PUBLIC_KEY_URL"]) as f:
-        public_key_web_content = json.loads(f.read())["keys"]
+@functools.cache
+def get_public_key_web_content() -> list[dict[str, Any]]:
+    """Fetch the public keys on first use rather than at import."""
+    if not (public_key_url := os.getenv("PUBLIC_KEY_URL")):
+        return []
+    with tracer.start_as_current_span(
+        "jwks.fetch", kind=SpanKind.CLIENT, attributes={"url.full": public_key_url}
+    ):
+        with urlopen(public_key_url) as f:
+            keys: list[dict[str, Any]] = json.loads(f.read())["keys"] or []
+            return keys
 
 
 class FastApiSettingsMixin:
     """FastApi settings mixin."""
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-    public_key_web_content: list[dict] = public_key_web_content if public_key_web_content else []  # type: ignore
 
     @classmethod
     def add_validation_exception_handler(cls, app: FastAPI) -> None:
@@ -67,9 +91,41 @@ class FastApiSettingsMixin:
     def init_app(cls, app: FastAPI) -> None:
         """Init fast api app."""
         cls.add_middleware(app)
+        cls.add_query_stats(app)
+        cls.add_metrics(app)
+        cls.add_tracing(app)
+        cls.add_log_context(app)
         cls.add_validation_exception_handler(app)
+        cls.add_database_exception_handler(app)
         add_pagination(app)
 
+    @classmethod
+    def add_database_exception_handler(cls, app: FastAPI) -> None:
+        """Answer with a 503 rather than a 500 when the database cannot be reached."""
+        for error in DATABASE_UNAVAILABLE_ERRORS:
+            app.add_exception_handler(error, database_unavailable_handler)
+
+    @classmethod
+    def add_query_stats(cls, app: FastAPI) -> None:
+        """Report the queries of each request in a Server-Timing header and the access log."""
+        app.add_middleware(QueryStatsMiddleware)
+
+    @classmethod
+    def add_metrics(cls, app: FastAPI) -> None:
+        """Measure the requests of a fast api application and expose them on /metrics."""
+        app.add_middleware(PrometheusMiddleware)
+        app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
+    @classmethod
+    def add_tracing(cls, app: FastAPI) -> None:
+        """Trace the requests of a fast api application."""
+        app.add_middleware(TracingMiddleware)
+
+    @classmethod
+    def add_log_context(cls, app: FastAPI) -> None:
+        """Give the logs of each request its id, route and user."""
+        app.add_middleware(LogContextMiddleware)
+
     @classmethod
     def get_public_key(cls, index: int = 0) -> str:
         """Returns a public key from a url contains a decoded header and a token."""
@@ -77,7 +133,7 @@ class FastApiSettingsMixin:
         # fast api or other you can check the same error in this link
         # https://stackoverflow.com/questions/49820173/requests-recursionerror-maximum-recursion-depth-exceeded
         try:
-            header_key = cls.public_key_web_content[index]
+            header_key = get_public_key_web_content()[index]
             return JWK(**header_key).export_to_pem()
         except Exception:
             raise HTTPException(detail="Invalid Key", status_code=400) from Exception
@@ -97,7 +153,7 @@ class FastApiSettingsMixin:
     def get_private_key(cls, index: int = 0) -> str:
         """Returns a private key from a url contains a decoded header and a token."""
         try:
-            header_key = cls.public_key_web_content[index]
+            header_key = get_public_key_web_content()[index]
             return JWK(**header_key).export_to_pem(private_key=True, password=None)
         except Exception:
             raise HTTPException(detail="unauthorized", status_code=401) from Exception
@@ -111,10 +167,12 @@ class DbSettingsMixin:
         f"@{os.environ['DB_HOST']}/{os.environ['DB_NAME']}?application_name={os.getenv('APPLICATION_NAME', 'default_myem_app')}"
     )
 
+    db_connect_timeout_in_seconds = int(os.getenv("DB_CONNECT_TIMEOUT_IN_SECONDS", "5"))
+    db_pool_timeout_in_seconds = float(os.getenv("DB_POOL_TIMEOUT_IN_SECONDS", "10"))
     engine = create_engine(
         db_uri,
         connect_args={
-            "connect_timeout": 31536000,
+            "connect_timeout": db_connect_timeout_in_seconds,
             "keepalives": 1,
             "keepalives_idle": 60,
             "keepalives_interval": 10,
@@ -124,15 +182,33 @@ class DbSettingsMixin:
         max_overflow=25,
         pool_pre_ping=True,
         pool_recycle=600,
+        pool_timeout=db_pool_timeout_in_seconds,
     )
     session_maker = sessionmaker(bind=engine)
+    circuit_breaker = CircuitBreaker(
+        int(os.getenv("DB_CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5")),
+        float(os.getenv("DB_CIRCUIT_BREAKER_RESET_TIMEOUT_IN_SECONDS", "10")),
+    )
+    health_probe_interval_in_seconds = float(os.getenv("HEALTH_PROBE_INTERVAL_IN_SECONDS", "5"))
+    slow_query_threshold_in_ms = float(os.getenv("SLOW_QUERY_THRESHOLD_IN_MS", "200"))
+    explain_slow_queries = os.getenv("EXPLAIN_SLOW_QUERIES", "false").lower() == "true"
+    repeated_query_threshold = int(os.getenv("REPEATED_QUERY_THRESHOLD", "10"))
+    db_replica_hosts = [host for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host]
+    db_replica_max_lag_in_seconds = float(os.getenv("DB_REPLICA_MAX_LAG_IN_SECONDS", "5"))
+    db_replica_probe_interval_in_seconds = float(
+        os.getenv("DB_REPLICA_PROBE_INTERVAL_IN_SECONDS", "5")
+    )
 
     @classmethod
     def get_db(cls) -> Any:
         """Get database instance."""
+        cls.circuit_breaker.check()
         db = cls.session_maker()
         try:
             yield db
+        except CONNECTION_ERRORS as error:
+            cls.circuit_breaker.record_error(error)
+            raise
         finally:
             db.close()
 
@@ -140,9 +216,142 @@ class DbSettingsMixin:
 class Settings(DbSettingsMixin, FastApiSettingsMixin):
     """Settings."""
 
-    private_key: str = private_key
-    public_key: str = rsa_key.export_to_pem()
     token_expiration_in_seconds = int(os.environ["TOKEN_EXPIRATION_IN_SECONDS"])
+    principal_cache_ttl_in_seconds = int(os.getenv("PRINCIPAL_CACHE_TTL_IN_SECONDS", "30"))
+    principal_cache_max_size = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+    token_cache_ttl_in_seconds = int(os.getenv("TOKEN_CACHE_TTL_IN_SECONDS", "300"))
+    token_cache_max_size = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+    verification_cache_max_size = int(os.getenv("VERIFICATION_CACHE_MAX_SIZE", "100000"))
+    verification_cache_ttl_in_seconds = int(os.getenv("VERIFICATION_CACHE_TTL_IN_SECONDS", "300"))
+    verification_negative_ttl_in_seconds = int(
+        os.getenv("VERIFICATION_NEGATIVE_TTL_IN_SECONDS", "30")
+    )
+    revocation_cache_ttl_in_seconds = int(os.getenv("REVOCATION_CACHE_TTL_IN_SECONDS", "60"))
+    code_generation_chunk_size = int(os.getenv("CODE_GENERATION_CHUNK_SIZE", "100000"))
+    code_generation_workers = int(os.getenv("CODE_GENERATION_WORKERS", str(os.cpu_count() or 1)))
+    # maximum codes of a batch verification, by role, unknown roles having the limit of users
+    batch_verify_limits = {
+        role: int(limit)
+        for role, limit in (
+            item.split(":")
+            for item in os.getenv("BATCH_VERIFY_LIMITS", "admin:10000,user:1000").split(",")
+        )
+    }
+    code_filter_enabled = os.getenv("CODE_FILTER_ENABLED", "true").lower() == "true"
+    code_filter_path = os.getenv("CODE_FILTER_PATH", "/tmp/authenticity_product_codes.bloom")
+    # codes the Bloom filter is sized for, a larger one being built once they are outgrown
+    code_filter_capacity = int(os.getenv("CODE_FILTER_CAPACITY", "10000000"))
+    code_filter_false_positive_rate = float(os.getenv("CODE_FILTER_FALSE_POSITIVE_RATE", "0.01"))
+    code_filter_refresh_interval_in_seconds = float(
+        os.getenv("CODE_FILTER_REFRESH_INTERVAL_IN_SECONDS", "5")
+    )
+    batch_verify_chunk_size = int(os.getenv("BATCH_VERIFY_CHUNK_SIZE", "1000"))
+    scan_events_enabled = os.getenv("SCAN_EVENTS_ENABLED", "true").lower() == "true"
+    scan_events_queue_size = int(os.getenv("SCAN_EVENTS_QUEUE_SIZE", "100000"))
+    scan_events_batch_size = int(os.getenv("SCAN_EVENTS_BATCH_SIZE", "5000"))
+    scan_events_flush_interval_in_seconds = float(
+        os.getenv("SCAN_EVENTS_FLUSH_INTERVAL_IN_SECONDS", "1")
+    )
+    scan_events_shutdown_timeout_in_seconds = float(
+        os.getenv("SCAN_EVENTS_SHUTDOWN_TIMEOUT_IN_SECONDS", "5")
+    )
+    scan_country_header = os.getenv("SCAN_COUNTRY_HEADER", "CF-IPCountry")
+    anomaly_detection_enabled = os.getenv("ANOMALY_DETECTION_ENABLED", "true").lower() == "true"
+    anomaly_window_in_seconds = float(os.getenv("ANOMALY_WINDOW_IN_SECONDS", "3600"))
+    # a code scanned more often or in more places within the window is flagged
+    anomaly_max_scans = int(os.getenv("ANOMALY_MAX_SCANS", "20"))
+    anomaly_max_locations = int(os.getenv("ANOMALY_MAX_LOCATIONS", "3"))
+    anomaly_max_speed_in_kmh = float(os.getenv("ANOMALY_MAX_SPEED_IN_KMH", "900"))
+    anomaly_max_codes = int(os.getenv("ANOMALY_MAX_CODES", "100000"))
+    anomaly_checkpoint_interval_in_seconds = float(
+        os.getenv("ANOMALY_CHECKPOINT_INTERVAL_IN_SECONDS", "10")
+    )
+    rollups_enabled = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+    rollup_interval_in_seconds = float(os.getenv("ROLLUP_INTERVAL_IN_SECONDS", "30"))
+    rollup_batch_size = int(os.getenv("ROLLUP_BATCH_SIZE", "100000"))
+    rollup_export_page_size = int(os.getenv("ROLLUP_EXPORT_PAGE_SIZE", "5000"))
+    maintenance_enabled = os.getenv("MAINTENANCE_ENABLED", "true").lower() == "true"
+    maintenance_interval_in_seconds = float(os.getenv("MAINTENANCE_INTERVAL_IN_SECONDS", "600"))
+    # rows deleted per transaction, and time a job may run before resuming on its next run
+    maintenance_batch_size = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+    maintenance_time_budget_in_seconds = float(
+        os.getenv("MAINTENANCE_TIME_BUDGET_IN_SECONDS", "30")
+    )
+    unverified_user_retention_in_days = int(os.getenv("UNVERIFIED_USER_RETENTION_IN_DAYS", "30"))
+    outbox_retention_in_days = int(os.getenv("OUTBOX_RETENTION_IN_DAYS", "7"))
+    login_audit_enabled = os.getenv("LOGIN_AUDIT_ENABLED", "true").lower() == "true"
+    login_audit_queue_size = int(os.getenv("LOGIN_AUDIT_QUEUE_SIZE", "10000"))
+    login_audit_batch_size = int(os.getenv("LOGIN_AUDIT_BATCH_SIZE", "500"))
+    login_audit_flush_interval_in_seconds = float(
+        os.getenv("LOGIN_AUDIT_FLUSH_INTERVAL_IN_SECONDS", "1")
+    )
+    login_audit_shutdown_timeout_in_seconds = float(
+        os.getenv("LOGIN_AUDIT_SHUTDOWN_TIMEOUT_IN_SECONDS", "5")
+    )
+    # the months of attempts entirely older are dropped
+    login_audit_retention_in_days = int(os.getenv("LOGIN_AUDIT_RETENTION_IN_DAYS", "365"))
+    cache_backend = os.getenv("CACHE_BACKEND", "memory")
+    shared_cache_name = os.getenv("SHARED_CACHE_NAME", "authenticity_product")
+    profiling_enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    profiling_sample_rate = float(os.getenv("PROFILING_SAMPLE_RATE", "0.001"))
+    profiling_interval_in_seconds = float(os.getenv("PROFILING_INTERVAL_IN_SECONDS", "0.001"))
+    profiling_output_dir = os.getenv("PROFILING_OUTPUT_DIR", "/tmp/profiles")
+    admission_store = os.getenv("ADMISSION_STORE", "memory")
+    admission_ip_capacity = float(os.getenv("ADMISSION_IP_CAPACITY", "30"))
+    admission_ip_refill_per_second = float(os.getenv("ADMISSION_IP_REFILL_PER_SECOND", "0.5"))
+    admission_identifier_capacity = float(os.getenv("ADMISSION_IDENTIFIER_CAPACITY", "5"))
+    admission_identifier_refill_per_second = float(
+        os.getenv("ADMISSION_IDENTIFIER_REFILL_PER_SECOND", "0.1")
+    )
+    admission_max_concurrent_hashes = int(os.getenv("ADMISSION_MAX_CONCURRENT_HASHES", "4"))
+    admission_hash_wait_in_seconds = float(os.getenv("ADMISSION_HASH_WAIT_IN_SECONDS", "1"))
+    otp_store = os.getenv("OTP_STORE", "postgres")
+    otp_ttl_in_seconds = int(os.getenv("OTP_TTL_IN_SECONDS", "300"))
+    otp_max_attempts = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+    otp_length = int(os.getenv("OTP_LENGTH", "6"))
+    outbox_enabled = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+    outbox_batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    outbox_concurrency = int(os.getenv("OUTBOX_CONCURRENCY", "10"))
+    outbox_max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+    outbox_poll_interval_in_seconds = float(os.getenv("OUTBOX_POLL_INTERVAL_IN_SECONDS", "1"))
+
+    @functools.cached_property
+    def private_key(self) -> str:
+        """Return the signing key."""
+        private_key: str = get_rsa_key().export_to_pem(private_key=True, password=None)
+        return private_key
+
+    @functools.cached_property
+    def public_key(self) -> str:
+        """Return the verifying key."""
+        public_key: str = get_rsa_key().export_to_pem()
+        return public_key
+
+    @functools.cached_property
+    def product_code_key(self) -> Any:
+        """Return the key signing the product codes."""
+        return get_product_code_key().get_op_key("sign")
+
+    @functools.cached_property
+    def otp_secret(self) -> bytes:
+        """Return the key of the one-time code hashes, the signing key unless configured."""
+        return os.getenv("OTP_SECRET", "").encode() or get_rsa_key().export_to_pem(
+            private_key=True, password=None
+        )
+
+    @functools.cached_property
+    def admin_secret_key(self) -> str:
+        """Return the key signing the admin sessions, the signing key unless configured."""
+        secret_key: str = os.getenv("ADMIN_SECRET_KEY") or self.private_key
+        return secret_key
 
 
 settings = Settings()
+pool_collector.add_engine("psycopg2", settings.engine)
+settings.circuit_breaker.watch(settings.engine)
+query_instrumentation = QueryInstrumentation(
+    settings.slow_query_threshold_in_ms,
+    settings.explain_slow_queries,
+    settings.repeated_query_threshold,
+)
+query_instrumentation.instrument(settings.engine)
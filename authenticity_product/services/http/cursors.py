@@ -0,0 +1,25 @@
+"""Keyset pagination cursors module.
+
+A page read by keyset ends with the key of its last row, handed to the client as an opaque
+cursor to read the following page from, rather than an offset the database would count.
+"""
+import base64
+import json
+from collections.abc import Callable, Sequence
+from typing import Any
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    """Return the cursor of the page following a key, made of JSON values."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str, *parsers: Callable[[Any], Any]) -> tuple[Any, ...]:
+    """Return the key a cursor follows, a value per parser, or answer with a 422."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor))
+        return tuple(parse(value) for parse, value in zip(parsers, key, strict=True))
+    except (TypeError, ValueError) as error:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Invalid cursor") from error
@@ -5,27 +5,82 @@ from collections.abc import AsyncGenerator
 
 from fastapi import Depends
 from fastapi_users.db import SQLAlchemyUserDatabase
+from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from authenticity_product.models import User
+from authenticity_product.services.http.circuit_breaker import CONNECTION_ERRORS
+from authenticity_product.services.http.config import query_instrumentation, settings
+from authenticity_product.services.http.metrics import pool_collector
+from authenticity_product.services.http.replicas import Replica, ReplicaSet, RoutingSession
+from authenticity_product.services.http.tracing import instrument_engine
 
 
 DATABASE_URL_ASYNC = f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
 
 
-engine_async = create_async_engine(DATABASE_URL_ASYNC)
-_conn_async = engine_async.connect()
+engine_async = create_async_engine(
+    DATABASE_URL_ASYNC,
+    connect_args={"timeout": settings.db_connect_timeout_in_seconds},
+    pool_timeout=settings.db_pool_timeout_in_seconds,
+)
+pool_collector.add_engine("asyncpg", engine_async.sync_engine)
+settings.circuit_breaker.watch(engine_async.sync_engine)
+query_instrumentation.instrument(engine_async.sync_engine)
+instrument_engine(engine_async.sync_engine)
+
+
+def create_replica(host: str) -> Replica:
+    """Create the engines of a read replica."""
+    credentials = f"{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+    replica = Replica(
+        host,
+        create_async_engine(
+            f"postgresql+asyncpg://{credentials}@{host}/{os.getenv('DB_NAME')}",
+            connect_args={"timeout": settings.db_connect_timeout_in_seconds},
+        ),
+        create_engine(
+            f"postgresql+psycopg2://{credentials}@{host}/{os.getenv('DB_NAME')}",
+            connect_args={"connect_timeout": settings.db_connect_timeout_in_seconds},
+            pool_pre_ping=True,
+            pool_recycle=600,
+        ),
+    )
+    pool_collector.add_engine(f"asyncpg-replica-{host}", replica.engine_async.sync_engine)
+    pool_collector.add_engine(f"psycopg2-replica-{host}", replica.engine)
+    for engine in (replica.engine_async.sync_engine, replica.engine):
+        query_instrumentation.instrument(engine)
+        instrument_engine(engine)
+    return replica
+
+
+replica_set = ReplicaSet(
+    [create_replica(host) for host in settings.db_replica_hosts],
+    settings.db_replica_max_lag_in_seconds,
+)
 async_session_maker = async_session = sessionmaker(  # type: ignore
     bind=engine_async,
     class_=AsyncSession,
     expire_on_commit=False,
+    sync_session_class=RoutingSession,
+    primary=engine_async.sync_engine,
+    replica_set=replica_set,
+    use_async_engines=True,
+)
+admin_session_maker = sessionmaker(
+    class_=RoutingSession, primary=settings.engine, replica_set=replica_set
 )
 
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     """Async session generator."""
+    settings.circuit_breaker.check()
     async with async_session_maker() as _session:
-        yield _session
+        try:
+            yield _session
+        except CONNECTION_ERRORS as error:
+            settings.circuit_breaker.record_error(error)
+            raise
 
 
 async def get_user_db_async(
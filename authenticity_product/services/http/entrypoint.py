@@ -1,57 +1,179 @@
-"""http entrypoint file."""
-from fastapi import FastAPI
-from sqladmin import Admin
+"""http entrypoint file.
+
+The application is assembled by ``create_app``, the admin and everything doing I/O is only
+built by its lifespan, so importing this module stays cheap.
+"""
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, Depends, FastAPI
 from sqlalchemy import select
 from sqlalchemy_utils import register_composites
 from authenticity_product.models import Role
 from authenticity_product.schemas import UserCreate, UserRead, UserUpdate
-from authenticity_product.services.http.admin import AdminAuth, UserAdmin
-from authenticity_product.services.http.config import settings
-from authenticity_product.services.http.db_async import _conn_async, async_session_maker
+from authenticity_product.services.http import get_product_code_key, get_rsa_key
+from authenticity_product.services.http.admission import login_admission, register_admission
+from authenticity_product.services.http.anomalies import anomaly_detector, get_anomaly_router
+from authenticity_product.services.http.audit import get_login_audit_router
+from authenticity_product.services.http.code_filter import code_filter
+from authenticity_product.services.http.code_generation import (
+    code_generator,
+    get_code_generation_router,
+)
+from authenticity_product.services.http.conditional import get_conditional_users_router
+from authenticity_product.services.http.config import get_public_key_web_content, settings
+from authenticity_product.services.http.db_async import (
+    admin_session_maker,
+    async_session_maker,
+    engine_async,
+    replica_set,
+)
+from authenticity_product.services.http.health import get_health_router, health_monitor
+from authenticity_product.services.http.login_audit import audit_client, login_attempt_writer
+from authenticity_product.services.http.maintenance import scheduler
+from authenticity_product.services.http.otp import get_otp_router
+from authenticity_product.services.http.outbox import outbox_dispatcher
+from authenticity_product.services.http.profiling import ProfilingMiddleware
+from authenticity_product.services.http.rollups import get_analytics_router, rollup_job
+from authenticity_product.services.http.scan_events import scan_event_writer
+from authenticity_product.services.http.structured_logging import configure_logging
+from authenticity_product.services.http.tracing import configure_tracing
 from authenticity_product.services.http.users import auth_backend, fastapi_users
+from authenticity_product.services.http.verification import get_verify_router
 
 
-app = FastAPI(
-    title="Product Authenticity",
-)
-app.include_router(fastapi_users.get_auth_router(auth_backend), prefix="/auth/jwt", tags=["auth"])
+def get_auth_routers() -> tuple[APIRouter, APIRouter]:
+    """Return the login route of fastapi-users apart from its other auth routes."""
+    login_router, auth_router = APIRouter(), APIRouter()
+    for route in fastapi_users.get_auth_router(auth_backend).routes:
+        router = login_router if getattr(route, "path", None) == "/login" else auth_router
+        router.routes.append(route)
+    return login_router, auth_router
 
-app.include_router(
-    fastapi_users.get_register_router(UserRead, UserCreate),  # type: ignore
-    prefix="/auth",
-    tags=["auth"],
-)
-app.include_router(
-    fastapi_users.get_reset_password_router(),
-    prefix="/auth",
-    tags=["auth"],
-)
-app.include_router(
-    fastapi_users.get_verify_router(UserRead),
-    prefix="/auth",
-    tags=["auth"],
-)
-app.include_router(
-    fastapi_users.get_users_router(UserRead, UserUpdate),
-    prefix="/users",
-    tags=["users"],
-)
 
+def add_admin(application: FastAPI) -> None:
+    """Mount the admin, once per application."""
+    # sqladmin is only imported by the processes serving requests
+    # pylint: disable=import-outside-toplevel
+    from sqladmin import Admin
+    from authenticity_product.services.http.admin import (
+        AdminAuth,
+        SuspiciousCodeAdmin,
+        UserAdmin,
+    )
+
+    if getattr(application.state, "admin", None) is None:
+        application.state.admin = Admin(
+            application,
+            session_maker=admin_session_maker,
+            authentication_backend=AdminAuth(secret_key=settings.admin_secret_key),
+        )
+        application.state.admin.add_view(UserAdmin)
+        application.state.admin.add_view(SuspiciousCodeAdmin)
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    """Fetch the keys, create the roles and start the background tasks, then stop them.
+
+    The tasks are stopped on shutdown, and as well when a later startup step fails.
+    """
+    # no request waits on a key, and the startup fails rather than the requests
+    await asyncio.to_thread(get_rsa_key)
+    await asyncio.to_thread(get_product_code_key)
+    await asyncio.to_thread(get_public_key_web_content)
+    try:
+        async with async_session_maker() as session:
+            for role_name in ("admin", "user"):
+                statement = select(Role).where(Role.name == role_name.lower())
+                if not ((await session.execute(statement)).first()):
+                    session.add(Role(name=role_name.lower()))
+                    await session.commit()
+        async with engine_async.connect() as connection:
+            await connection.run_sync(register_composites)
+        add_admin(application)
+        await replica_set.start(settings.db_replica_probe_interval_in_seconds)
+        await health_monitor.start()
+        if settings.outbox_enabled:
+            await outbox_dispatcher.start()
+        await scan_event_writer.start()
+        await login_attempt_writer.start()
+        if settings.code_filter_enabled:
+            await code_filter.start()
+        if settings.anomaly_detection_enabled:
+            await anomaly_detector.start()
+        if settings.rollups_enabled:
+            await rollup_job.start()
+        if settings.maintenance_enabled:
+            await scheduler.start()
+        yield
+    finally:
+        await scheduler.stop()
+        await rollup_job.stop()
+        await anomaly_detector.stop()
+        await code_filter.stop()
+        await login_attempt_writer.stop()
+        await scan_event_writer.stop()
+        await code_generator.stop()
+        await outbox_dispatcher.stop()
+        await health_monitor.stop()
+        await replica_set.stop()
+
+
+def create_app() -> FastAPI:
+    """Assemble the application."""
+    configure_logging()
+    configure_tracing()
+    application = FastAPI(title="Product Authenticity", lifespan=lifespan)
+    login_router, auth_router = get_auth_routers()
+    # only the login hashes a password, logging out is never charged a token
+    application.include_router(
+        login_router,
+        prefix="/auth/jwt",
+        tags=["auth"],
+        dependencies=[Depends(login_admission), Depends(audit_client)],
+    )
+    application.include_router(auth_router, prefix="/auth/jwt", tags=["auth"])
+
+    application.include_router(
+        fastapi_users.get_register_router(UserRead, UserCreate),  # type: ignore
+        prefix="/auth",
+        tags=["auth"],
+        dependencies=[Depends(register_admission)],
+    )
+    application.include_router(get_otp_router(), prefix="/auth/otp", tags=["auth"])
+    application.include_router(
+        fastapi_users.get_reset_password_router(),
+        prefix="/auth",
+        tags=["auth"],
+    )
+    application.include_router(
+        fastapi_users.get_verify_router(UserRead),
+        prefix="/auth",
+        tags=["auth"],
+    )
+    application.include_router(get_health_router(), tags=["health"])
+    application.include_router(get_verify_router(), prefix="/verify", tags=["verify"])
+    application.include_router(get_code_generation_router(), prefix="/codes", tags=["codes"])
+    application.include_router(get_analytics_router(), prefix="/analytics", tags=["analytics"])
+    application.include_router(get_login_audit_router(), prefix="/audit", tags=["audit"])
+    application.include_router(get_anomaly_router(), prefix="/anomalies", tags=["anomalies"])
+    application.include_router(get_conditional_users_router(), prefix="/users", tags=["users"])
+    application.include_router(
+        fastapi_users.get_users_router(UserRead, UserUpdate),
+        prefix="/users",
+        tags=["users"],
+    )
 
-@app.on_event("startup")
-async def startup() -> None:
-    """Connect to database at app startup required for fastapi_users, and create roles."""
-    async with async_session_maker() as session:
-        for role_name in ("admin", "user"):
-            statement = select(Role).where(Role.name == role_name.lower())
-            if not ((await session.execute(statement)).first()):
-                session.add(Role(name=role_name.lower()))
-                await session.commit()
-    register_composites(_conn_async)
+    settings.init_app(application)
+    application.add_middleware(
+        ProfilingMiddleware,
+        sample_rate=settings.profiling_sample_rate if settings.profiling_enabled else 0.0,
+        interval_in_seconds=settings.profiling_interval_in_seconds,
+        output_dir=settings.profiling_output_dir,
+    )
+    return application
 
 
-settings.init_app(app)
-admin = Admin(app, settings.engine)
-admin.add_view(UserAdmin)
-authentication_backend = AdminAuth(secret_key="secret_key")
-admin = Admin(app, settings.engine, authentication_backend=authentication_backend)
+app = create_app()
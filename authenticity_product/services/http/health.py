@@ -0,0 +1,145 @@
+"""Health and readiness module."""
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any
+
+from fastapi import APIRouter, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.responses import JSONResponse
+from authenticity_product.services.http.circuit_breaker import CircuitBreaker
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async, replica_set
+from authenticity_product.services.http.metrics import pool_collector
+from authenticity_product.services.http.replicas import ReplicaSet
+
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Database probe run in the background, whose last result is served by the endpoints.
+
+    The probes feed the circuit breaker, so it closes again even when no request comes in.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        circuit_breaker: CircuitBreaker,
+        replicas: ReplicaSet,
+        interval_in_seconds: float,
+        probe_timeout_in_seconds: float = 2,
+    ):
+        self.engine = engine
+        self.circuit_breaker = circuit_breaker
+        self.replicas = replicas
+        self.interval_in_seconds = interval_in_seconds
+        self.probe_timeout_in_seconds = probe_timeout_in_seconds
+        self.database_reachable = False
+        self.latency_in_ms: float | None = None
+        self.checked_at: float | None = None
+        self._task: asyncio.Task[None] | None = None
+
+    async def probe(self) -> None:
+        """Check that the primary database answers."""
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.probe_timeout_in_seconds):
+                async with self.engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+        except Exception:  # pylint: disable=broad-except
+            if self.database_reachable:
+                logger.warning("Database health probe failed", exc_info=True)
+            self.database_reachable, self.latency_in_ms = False, None
+            self.circuit_breaker.record_failure()
+        else:
+            self.database_reachable = True
+            self.latency_in_ms = (time.perf_counter() - start) * 1000
+            self.circuit_breaker.record_success()
+        self.checked_at = time.monotonic()
+
+    async def run(self) -> None:
+        """Probe the database forever."""
+        while True:
+            await asyncio.sleep(self.interval_in_seconds)
+            await self.probe()
+
+    async def start(self) -> None:
+        """Probe the database once, then keep probing it in the background."""
+        await self.probe()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop probing the database."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    @property
+    def is_ready(self) -> bool:
+        """Check that the last probe is recent and succeeded, and that the breaker is closed."""
+        return (
+            self.database_reachable
+            and self.circuit_breaker.state == "closed"
+            and self.checked_at is not None
+            and time.monotonic() - self.checked_at <= 3 * self.interval_in_seconds
+        )
+
+    def report(self) -> dict[str, Any]:
+        """Return the cached state of the database, its pools and its replicas."""
+        return {
+            "status": "ready" if self.is_ready else "unavailable",
+            "database": {
+                "reachable": self.database_reachable,
+                "latency_in_ms": self.latency_in_ms,
+                "checked_seconds_ago": (
+                    None if self.checked_at is None else time.monotonic() - self.checked_at
+                ),
+            },
+            "circuit_breaker": {
+                "state": self.circuit_breaker.state,
+                "failures": self.circuit_breaker.failures,
+            },
+            "pools": pool_collector.pool_states(),
+            "replicas": {
+                replica.host: {"healthy": replica.healthy, "lag_in_seconds": replica.lag_in_seconds}
+                for replica in self.replicas.replicas
+            },
+        }
+
+
+health_monitor = HealthMonitor(
+    engine_async,
+    settings.circuit_breaker,
+    replica_set,
+    settings.health_probe_interval_in_seconds,
+)
+
+
+def get_health_router() -> APIRouter:
+    """Return the liveness and readiness routes."""
+    router = APIRouter()
+
+    @router.get("/healthz")
+    async def healthz() -> dict[str, str]:
+        """Tell that the process serves requests, whatever the state of the database."""
+        return {"status": "ok", "circuit_breaker": settings.circuit_breaker.state}
+
+    @router.get("/readyz")
+    async def readyz() -> JSONResponse:
+        """Tell whether the instance can serve traffic, from the last background probe."""
+        return JSONResponse(
+            status_code=(
+                status.HTTP_200_OK
+                if health_monitor.is_ready
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            ),
+            content=health_monitor.report(),
+        )
+
+    return router
@@ -0,0 +1,58 @@
+"""Id gaps module.
+
+Ids are allocated before their transaction commits, so a reader following a table by id may see
+a row before rows of lower ids. A gap in the ids read may then be filled by a transaction which
+was running when it was seen, and only once every such transaction has ended are its ids those
+of rolled back inserts or collisions. The gaps are kept with the next transaction id of the
+snapshot they were seen in, and are open while that transaction id is above the lowest one still
+running.
+"""
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+SNAPSHOT_STATEMENT = text(
+    "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS xmin, "
+    "pg_snapshot_xmax(pg_current_snapshot())::text::bigint AS xmax"
+)
+
+
+class Snapshot(NamedTuple):
+    """Lowest transaction id still running, and next transaction id, of a snapshot."""
+
+    xmin: int
+    xmax: int
+
+
+async def take_snapshot(connection: AsyncConnection) -> Snapshot:
+    """Return the transaction ids bounding the snapshot of a connection."""
+    row = (await connection.execute(SNAPSHOT_STATEMENT)).one()
+    return Snapshot(row.xmin, row.xmax)
+
+
+class IdGaps:
+    """Gaps in the ids read from a table, by first id, with the next transaction id when seen."""
+
+    def __init__(self) -> None:
+        self._gaps: dict[int, int] = {}
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._gaps)
+
+    def __len__(self) -> int:
+        return len(self._gaps)
+
+    def is_open(self, first: int, snapshot: Snapshot) -> bool:
+        """Record the gap starting at an id, and tell whether a running insert may fill it."""
+        return self._gaps.setdefault(first, snapshot.xmax) > snapshot.xmin
+
+    def keep(self, firsts: Iterable[int]) -> None:
+        """Forget every gap but those starting at some ids."""
+        self._gaps = {first: self._gaps[first] for first in firsts}
+
+    def clear(self) -> None:
+        """Forget every gap."""
+        self._gaps = {}
@@ -0,0 +1,60 @@
+"""Login audit module.
+
+Every login attempt, by password or by phone code, is recorded for the security reviews with
+the identifier given, the user it matched if any, the address of the client, and its outcome
+with the reason of a failure. The attempts are queued and written in batches to
+``login_attempt``, partitioned by month, so that a login never waits for an INSERT, and the
+months past the retention are dropped whole by the maintenance scheduler.
+"""
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi import Request
+from authenticity_product.models import User
+from authenticity_product.services.http.batch_writer import BatchWriter
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.metrics import LOGIN_ATTEMPTS
+
+
+LOGIN_ATTEMPT_COLUMNS = ("attempted_at", "user_id", "identifier", "ip", "success", "reason")
+UNKNOWN_USER = "unknown_user"
+INVALID_PASSWORD = "invalid_password"
+INVALID_CODE = "invalid_code"
+INACTIVE_USER = "inactive_user"
+
+# the address of the client of the login route being served
+login_client: ContextVar[str | None] = ContextVar("login_client", default=None)
+
+login_attempt_writer = BatchWriter(
+    "login_attempt",
+    LOGIN_ATTEMPT_COLUMNS,
+    partition_column="attempted_at",
+    queue_size=settings.login_audit_queue_size,
+    batch_size=settings.login_audit_batch_size,
+    flush_interval_in_seconds=settings.login_audit_flush_interval_in_seconds,
+    shutdown_timeout_in_seconds=settings.login_audit_shutdown_timeout_in_seconds,
+)
+
+
+async def audit_client(request: Request) -> None:
+    """Keep the address of the client of a login route, for the attempts it records."""
+    login_client.set(request.client.host if request.client is not None else None)
+
+
+def record_login(
+    identifier: str, user: User | None, success: bool, reason: str | None = None
+) -> None:
+    """Queue a login attempt, dropped if the writer falls behind."""
+    LOGIN_ATTEMPTS.labels(reason or "success").inc()
+    if not settings.login_audit_enabled:
+        return
+    login_attempt_writer.add(
+        (
+            datetime.now(),
+            None if user is None else user.id,
+            str(identifier)[:320],
+            login_client.get(),
+            success,
+            reason,
+        )
+    )
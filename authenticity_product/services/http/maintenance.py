@@ -0,0 +1,241 @@
+"""Background maintenance module.
+
+The tables which only grow, users who never verified their email nor logged in, expired
+one-time codes, delivered outbox messages, idle rate limit buckets and login attempts past
+their retention, are cleaned up by jobs run by an in-process scheduler. Every replica schedules every job, and
+each run first takes a Postgres advisory lock named after the job, so that a single replica
+runs it while the others skip their turn. The lock is held by a session of its own and
+released with it, should the replica die mid-run.
+
+The rows are deleted by small keyset batches, each in its own transaction, so that no lock is
+held long and the replicas stream small changes. A run stops once its time budget is spent,
+the next run resuming from the start of the rows still matching. The tables partitioned by
+month drop their old months whole instead.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Any, Protocol
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from authenticity_product.services.http.cache import principal_cache
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.metrics import (
+    MAINTENANCE_DELETED_ROWS,
+    MAINTENANCE_DROPPED_PARTITIONS,
+    MAINTENANCE_RUN_LATENCY,
+    MAINTENANCE_RUNS,
+)
+from authenticity_product.services.http.partitions import drop_partitions
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job(Protocol):
+    """Maintenance job, run by a single replica at a time."""
+
+    name: str
+
+    async def run(self, engine: AsyncEngine, batch_size: int, deadline: float) -> bool:
+        """Do the work due until the deadline, and return whether it is done."""
+
+
+class BatchedDelete:
+    """Job deleting the rows of a table matching a condition, by keyset batches on a key."""
+
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        key: str,
+        condition: str,
+        parameters: dict[str, Any] | None = None,
+        on_deleted: Callable[[list[Any]], None] | None = None,
+    ):
+        self.name = name
+        self.table = table
+        self.key = key
+        self.condition = condition
+        self.parameters = parameters or {}
+        self.on_deleted = on_deleted
+
+    def statement(self, first: bool) -> Any:
+        """Return the statement deleting the next batch, and returning its size and last key."""
+        keyset = "" if first else f" AND {self.key} > :after"
+        # the deleted keys themselves are only returned to the jobs which need them
+        keys = f", ARRAY(SELECT {self.key} FROM deleted) AS keys" if self.on_deleted else ""
+        # rows locked by a request are left for the next run rather than waited for
+        return text(
+            f'WITH batch AS (SELECT {self.key} FROM "{self.table}" '
+            f"WHERE {self.condition}{keyset} ORDER BY {self.key} LIMIT :limit "
+            f"FOR UPDATE SKIP LOCKED), "
+            f'deleted AS (DELETE FROM "{self.table}" '
+            f"WHERE {self.key} IN (SELECT {self.key} FROM batch) RETURNING {self.key}) "
+            f"SELECT (SELECT count(*) FROM deleted) AS deleted, "
+            f"(SELECT {self.key} FROM batch ORDER BY {self.key} DESC LIMIT 1) AS last{keys}"
+        )
+
+    async def run(self, engine: AsyncEngine, batch_size: int, deadline: float) -> bool:
+        """Delete the rows matching until none is left or the deadline, and return if done."""
+        after = None
+        while time.monotonic() < deadline:
+            parameters = {**self.parameters, "limit": batch_size}
+            if after is not None:
+                parameters["after"] = after
+            async with engine.begin() as connection:
+                batch = (await connection.execute(self.statement(after is None), parameters)).one()
+            if self.on_deleted is not None:
+                self.on_deleted(batch.keys)
+            MAINTENANCE_DELETED_ROWS.labels(self.name).inc(batch.deleted)
+            if batch.deleted < batch_size:
+                return True
+            after = batch.last
+        return False
+
+
+class PartitionRetention:
+    """Job dropping the months of a partitioned table entirely older than the retention."""
+
+    def __init__(self, name: str, table: str, retention_in_days: int):
+        self.name = name
+        self.table = table
+        self.retention_in_days = retention_in_days
+
+    async def run(self, engine: AsyncEngine, batch_size: int, deadline: float) -> bool:
+        """Drop the months past the retention, at once whatever the deadline."""
+        async with engine.connect() as connection:
+            dropped = await drop_partitions(
+                connection, self.table, datetime.now() - timedelta(days=self.retention_in_days)
+            )
+        if dropped:
+            logger.info(f"Dropped the partitions {', '.join(dropped)} past the retention")
+        MAINTENANCE_DROPPED_PARTITIONS.labels(self.name).inc(len(dropped))
+        return True
+
+
+class Scheduler:
+    """In-process scheduler running each job periodically on a single replica at a time."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        jobs: list[Job],
+        interval_in_seconds: float,
+        batch_size: int,
+        time_budget_in_seconds: float,
+    ):
+        self.engine = engine
+        self.jobs = jobs
+        self.interval_in_seconds = interval_in_seconds
+        self.batch_size = batch_size
+        self.time_budget_in_seconds = time_budget_in_seconds
+        self._tasks: list[asyncio.Task[None]] = []
+
+    async def run_once(self, job: Job) -> str:
+        """Run a job if no other replica is running it, and return the outcome."""
+        async with self.engine.connect() as connection:
+            locked = await connection.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:name))"),
+                {"name": f"maintenance:{job.name}"},
+            )
+            # the lock belongs to the session, not to the transaction of the query
+            await connection.commit()
+            if not locked:
+                outcome = "skipped"
+            else:
+                began = time.monotonic()
+                try:
+                    done = await job.run(
+                        self.engine, self.batch_size, began + self.time_budget_in_seconds
+                    )
+                    outcome = "completed" if done else "interrupted"
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception(f"Maintenance job {job.name} failed")
+                    outcome = "failed"
+                finally:
+                    MAINTENANCE_RUN_LATENCY.labels(job.name).observe(time.monotonic() - began)
+                    await connection.execute(
+                        text("SELECT pg_advisory_unlock(hashtext(:name))"),
+                        {"name": f"maintenance:{job.name}"},
+                    )
+                    await connection.commit()
+        MAINTENANCE_RUNS.labels(job.name, outcome).inc()
+        return outcome
+
+    async def run(self, job: Job) -> None:
+        """Run a job forever, once per interval."""
+        while True:
+            await asyncio.sleep(self.interval_in_seconds)
+            try:
+                await self.run_once(job)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(f"Maintenance job {job.name} could not be scheduled")
+
+    async def start(self) -> None:
+        """Start running the jobs in the background."""
+        self._tasks = [asyncio.create_task(self.run(job)) for job in self.jobs]
+
+    async def stop(self) -> None:
+        """Stop running the jobs, interrupting those running."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+
+def invalidate_principals(user_ids: list[Any]) -> None:
+    """Drop the deleted users from the principal cache."""
+    for user_id in user_ids:
+        principal_cache.invalidate(user_id)
+
+
+unverified_users = BatchedDelete(
+    "unverified_users",
+    "user",
+    "id",
+    "NOT is_verified AND role = 'user' AND first_login_at IS NULL "
+    "AND created_at < LOCALTIMESTAMP - make_interval(days => :retention_in_days)",
+    {"retention_in_days": settings.unverified_user_retention_in_days},
+    on_deleted=invalidate_principals,
+)
+expired_phone_otps = BatchedDelete(
+    "expired_phone_otps", "phone_otp", "phone", "expires_at <= LOCALTIMESTAMP"
+)
+sent_outbox_messages = BatchedDelete(
+    "sent_outbox_messages",
+    "outbox_message",
+    "id",
+    "sent_at < LOCALTIMESTAMP - make_interval(days => :retention_in_days)",
+    {"retention_in_days": settings.outbox_retention_in_days},
+)
+# a day without requests refills any bucket
+idle_rate_limit_buckets = BatchedDelete(
+    "idle_rate_limit_buckets",
+    "rate_limit_bucket",
+    "key",
+    "updated_at < LOCALTIMESTAMP - INTERVAL '1 day'",
+)
+expired_login_attempts = PartitionRetention(
+    "expired_login_attempts", "login_attempt", settings.login_audit_retention_in_days
+)
+scheduler = Scheduler(
+    engine_async,
+    [
+        unverified_users,
+        expired_phone_otps,
+        sent_outbox_messages,
+        idle_rate_limit_buckets,
+        expired_login_attempts,
+    ],
+    settings.maintenance_interval_in_seconds,
+    settings.maintenance_batch_size,
+    settings.maintenance_time_budget_in_seconds,
+)
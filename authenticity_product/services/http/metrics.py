@@ -0,0 +1,194 @@
+"""Prometheus metrics module."""
+import time
+from collections.abc import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    generate_latest,
+    Histogram,
+    REGISTRY,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route template and status.",
+    ["method", "route", "status"],
+)
+AUTH_OPERATION_LATENCY = Histogram(
+    "auth_operation_duration_seconds",
+    "Latency of authentication operations (token, password hashing and user lookup).",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests shed before password hashing, by route and by the limit which rejected them.",
+    ["route", "bucket"],
+)
+VERIFICATION_LOOKUPS = Counter(
+    "verification_lookups_total",
+    "Serial code verifications, by whether the cache or the database answered and the outcome.",
+    ["source", "result"],
+)
+CODES_GENERATED = Counter(
+    "serial_codes_generated_total", "Serial codes inserted by the generation jobs."
+)
+CODE_COLLISIONS = Counter(
+    "serial_code_collisions_total",
+    "Generated serial codes already taken, generated again by the next chunk.",
+)
+CODE_FILTER_CODES = Gauge(
+    "serial_code_filter_codes", "Serial codes added to the Bloom filter of the serial codes."
+)
+CODE_FILTER_FALSE_POSITIVE_RATE = Gauge(
+    "serial_code_filter_false_positive_rate",
+    "False positive rate of the Bloom filter of the serial codes, expected from its codes.",
+)
+CODE_FILTER_FALSE_POSITIVES = Counter(
+    "serial_code_filter_false_positives_total",
+    "Unknown serial codes the Bloom filter let through to the database.",
+)
+ANOMALY_TRACKED_CODES = Gauge(
+    "anomaly_tracked_codes", "Authentic codes whose recent scans the anomaly detector keeps."
+)
+SUSPICIOUS_CODES = Counter(
+    "suspicious_codes_total", "Authentic codes flagged as suspicious, by reason.", ["reason"]
+)
+ROLLUP_EVENTS = Counter("scan_rollup_events_total", "Scan events aggregated into the scan rollups.")
+ROLLUP_LAG = Gauge(
+    "scan_rollup_lag_seconds", "Age of the last scan event aggregated into the scan rollups."
+)
+MAINTENANCE_RUNS = Counter(
+    "maintenance_runs_total",
+    "Runs of the maintenance jobs, by job and outcome (completed, interrupted by the time "
+    "budget, skipped while another replica leads, or failed).",
+    ["job", "outcome"],
+)
+MAINTENANCE_DELETED_ROWS = Counter(
+    "maintenance_deleted_rows_total", "Rows deleted by the maintenance jobs, by job.", ["job"]
+)
+MAINTENANCE_DROPPED_PARTITIONS = Counter(
+    "maintenance_dropped_partitions_total",
+    "Monthly partitions dropped by the maintenance jobs, by job.",
+    ["job"],
+)
+MAINTENANCE_RUN_LATENCY = Histogram(
+    "maintenance_run_duration_seconds", "Latency of the maintenance job runs, by job.", ["job"]
+)
+LOGIN_ATTEMPTS = Counter(
+    "login_attempts_total", "Login attempts, by reason of failure or success.", ["reason"]
+)
+BATCH_WRITER_ROWS = Counter(
+    "batch_writer_rows_total",
+    "Rows of the batched writes, by table and outcome (written, dropped, failed or lost).",
+    ["table", "outcome"],
+)
+BATCH_WRITER_QUEUE_SIZE = Gauge(
+    "batch_writer_queue_size", "Rows queued for a batched write, by table.", ["table"]
+)
+BATCH_WRITER_FLUSH_LATENCY = Histogram(
+    "batch_writer_flush_duration_seconds", "Latency of the batched writes, by table.", ["table"]
+)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class PoolCollector(Collector):
+    """Collector reading the state of the SQLAlchemy connection pools at scrape time."""
+
+    def __init__(self) -> None:
+        self.engines: dict[str, Engine] = {}
+
+    def add_engine(self, name: str, engine: Engine) -> None:
+        """Expose the pool of an engine under the given name."""
+        self.engines[name] = engine
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        """Yield the pool gauges of every registered engine."""
+        size = GaugeMetricFamily("db_pool_size", "Configured size of the pool.", labels=["engine"])
+        connections = GaugeMetricFamily(
+            "db_pool_connections",
+            "Connections of the pool by state.",
+            labels=["engine", "state"],
+        )
+        for name, state in self.pool_states().items():
+            size.add_metric([name], state["size"])
+            for key in ("checked_out", "checked_in", "overflow"):
+                connections.add_metric([name, key], state[key])
+        yield size
+        yield connections
+
+    def pool_states(self) -> dict[str, dict[str, int]]:
+        """Return the size and connections of the queue pool of every registered engine."""
+        return {
+            name: {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            }
+            for name, engine in self.engines.items()
+            if isinstance(pool := engine.pool, QueuePool)
+        }
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+class PrometheusMiddleware:
+    """ASGI middleware observing the latency of every HTTP request.
+
+    The route label is the path template matched by the router, never the raw path, so the
+    cardinality of the histogram stays bounded by the number of routes.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # labels() takes a lock on every call, the children are cached per label values instead
+        self._observers: dict[tuple[str, str, int], Histogram] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Time the request and observe it once the response has been sent."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            key = (scope["method"], route_template(scope), status_code)
+            if (observer := self._observers.get(key)) is None:
+                observer = self._observers[key] = REQUEST_LATENCY.labels(*key)
+            observer.observe(elapsed)
+
+
+def route_template(scope: Scope) -> str:
+    """Return the path template of the route which handled the request."""
+    if (route := scope.get("route")) is not None:
+        return str(route.path)
+    return UNMATCHED_ROUTE
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Expose the metrics in the Prometheus text format."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
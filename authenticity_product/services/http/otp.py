@@ -0,0 +1,248 @@
+"""Phone one-time code login module.
+
+A code is sent to the phone of a user, and exchanged for a token. Codes are only stored as an
+HMAC of the phone and the code, expire after their TTL and are dropped after too many wrong
+attempts, so checking one is a cheap keyed hash instead of a password hash.
+
+The codes are kept in the phone_otp table, so that a code requested on one worker can be
+verified on any other. The in-process store only suits a single worker, in development.
+"""
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Protocol
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi_users import exceptions
+from fastapi_users.router.common import ErrorCode
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from authenticity_product.schemas import PhoneNumberRequest, PhoneOtpVerifyRequest, UserEmailOrPhone
+from authenticity_product.services.http.admission import Admission, bucket_store, login_admission
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.login_audit import (
+    audit_client,
+    INACTIVE_USER,
+    INVALID_CODE,
+    record_login,
+    UNKNOWN_USER,
+)
+from authenticity_product.services.http.users import (
+    auth_backend,
+    get_jwt_strategy,
+    get_user_manager,
+    UserManager,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SAVE_STATEMENT = text(
+    """
+    INSERT INTO phone_otp (phone, code_hash, attempts, expires_at, created_at, updated_at)
+    VALUES (:phone, :code_hash, 0, :expires_at, LOCALTIMESTAMP, LOCALTIMESTAMP)
+    ON CONFLICT (phone) DO UPDATE SET
+        code_hash = EXCLUDED.code_hash,
+        attempts = 0,
+        expires_at = EXCLUDED.expires_at,
+        updated_at = LOCALTIMESTAMP
+    """
+)
+ATTEMPT_STATEMENT = text(
+    """
+    UPDATE phone_otp SET attempts = attempts + 1, updated_at = LOCALTIMESTAMP
+    WHERE phone = :phone AND expires_at > LOCALTIMESTAMP AND attempts < :max_attempts
+    RETURNING code_hash, attempts
+    """
+)
+DELETE_STATEMENT = text("DELETE FROM phone_otp WHERE phone = :phone RETURNING phone")
+
+
+def hash_code(phone: str, code: str) -> str:
+    """Return the keyed hash of the code of a phone."""
+    return hmac.new(settings.otp_secret, f"{phone}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+def generate_code(length: int) -> str:
+    """Return a random numeric code."""
+    return str(secrets.randbelow(10**length)).zfill(length)
+
+
+class OtpStore(Protocol):
+    """Storage of the pending codes."""
+
+    async def save(self, phone: str, code_hash: str, ttl_in_seconds: int) -> None:
+        """Store the code of a phone, replacing its previous one."""
+
+    async def verify(self, phone: str, code_hash: str, max_attempts: int) -> bool:
+        """Count an attempt, and consume the code of a phone if it matches."""
+
+
+class InMemoryOtpStore:
+    """Codes of this worker, evicted once expired or when the store is full.
+
+    The other workers never see them, so this store only suits a single worker.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        # phone -> (code hash, attempts, expiry), in expiry order since the TTL is the same
+        self.codes: OrderedDict[str, tuple[str, int, float]] = OrderedDict()
+
+    def evict(self) -> None:
+        """Drop the expired codes, and the oldest ones above the maximum size."""
+        now = time.monotonic()
+        while self.codes and (
+            len(self.codes) > self.max_size or next(iter(self.codes.values()))[2] <= now
+        ):
+            self.codes.popitem(last=False)
+
+    async def save(self, phone: str, code_hash: str, ttl_in_seconds: int) -> None:
+        """Store the code of a phone, replacing its previous one."""
+        self.codes.pop(phone, None)
+        self.codes[phone] = (code_hash, 0, time.monotonic() + ttl_in_seconds)
+        self.evict()
+
+    async def verify(self, phone: str, code_hash: str, max_attempts: int) -> bool:
+        """Count an attempt, and consume the code of a phone if it matches."""
+        self.evict()
+        if (entry := self.codes.get(phone)) is None:
+            return False
+        stored_hash, attempts, expires_at = entry
+        if hmac.compare_digest(stored_hash, code_hash):
+            del self.codes[phone]
+            return True
+        if attempts + 1 >= max_attempts:
+            del self.codes[phone]
+        else:
+            self.codes[phone] = (stored_hash, attempts + 1, expires_at)
+        return False
+
+
+class PostgresOtpStore:
+    """Codes shared by every worker in the phone_otp table."""
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def save(self, phone: str, code_hash: str, ttl_in_seconds: int) -> None:
+        """Store the code of a phone, replacing its previous one."""
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                SAVE_STATEMENT,
+                {
+                    "phone": phone,
+                    "code_hash": code_hash,
+                    "expires_at": datetime.now() + timedelta(seconds=ttl_in_seconds),
+                },
+            )
+
+    async def verify(self, phone: str, code_hash: str, max_attempts: int) -> bool:
+        """Count an attempt, and consume the code of a phone if it matches.
+
+        The attempt is counted first, so concurrent guesses cannot exceed the maximum, and only
+        the request deleting the code succeeds.
+        """
+        async with self.engine.begin() as connection:
+            params = {"phone": phone, "max_attempts": max_attempts}
+            if (row := (await connection.execute(ATTEMPT_STATEMENT, params)).first()) is None:
+                return False
+            if hmac.compare_digest(row.code_hash, code_hash) or row.attempts >= max_attempts:
+                deleted = (await connection.execute(DELETE_STATEMENT, {"phone": phone})).first()
+                return deleted is not None and hmac.compare_digest(row.code_hash, code_hash)
+        return False
+
+
+class OtpSender(Protocol):
+    """Delivery of the codes."""
+
+    async def send(self, phone: str, code: str) -> None:
+        """Send a code to a phone."""
+
+
+class LogOtpSender:
+    """Sender logging that a code was sent, until an SMS provider is plugged in.
+
+    The code itself is never logged, whoever reads the logs could log in with it.
+    """
+
+    async def send(self, phone: str, code: str) -> None:
+        """Log the phone a code was sent to."""
+        logger.info(f"One-time code sent to {phone}", extra={"event": "otp.sent", "phone": phone})
+
+
+otp_store: OtpStore
+if settings.otp_store == "memory":
+    otp_store = InMemoryOtpStore()
+else:
+    otp_store = PostgresOtpStore(engine_async)
+otp_sender: OtpSender = LogOtpSender()
+otp_admission = Admission(
+    "otp", bucket_store, login_admission.ip_limit, login_admission.identifier_limit, "phone_number"
+)
+
+
+def get_phone(phone_number: str) -> UserEmailOrPhone:
+    """Validate a phone number."""
+    if not (phone := UserEmailOrPhone(phone_number)).is_phone():
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid phone number"
+        )
+    return phone
+
+
+def get_otp_router() -> APIRouter:
+    """Return the routes of the phone code login."""
+    router = APIRouter(dependencies=[Depends(otp_admission), Depends(audit_client)])
+
+    @router.post("/request", status_code=status.HTTP_202_ACCEPTED)
+    async def request_code(
+        body: PhoneNumberRequest, user_manager: UserManager = Depends(get_user_manager)
+    ) -> None:
+        """Send a code to the phone of an active user, without telling whether it exists."""
+        phone = get_phone(body.phone_number)
+        try:
+            user = await user_manager.get_by_email_and_phone(phone)
+        except exceptions.UserNotExists:
+            return
+        if not user.is_active:
+            return
+        code = generate_code(settings.otp_length)
+        await otp_store.save(phone, hash_code(phone, code), settings.otp_ttl_in_seconds)
+        await otp_sender.send(phone, code)
+
+    @router.post("/verify")
+    async def verify_code(
+        request: Request,
+        body: PhoneOtpVerifyRequest,
+        user_manager: UserManager = Depends(get_user_manager),
+    ) -> Response:
+        """Exchange a code for a token."""
+        phone = get_phone(body.phone_number)
+        if not await otp_store.verify(
+            phone, hash_code(phone, body.code), settings.otp_max_attempts
+        ):
+            record_login(phone, None, False, INVALID_CODE)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=ErrorCode.LOGIN_BAD_CREDENTIALS
+            )
+        try:
+            user = await user_manager.get_by_email_and_phone(phone)
+        except exceptions.UserNotExists:
+            user = None
+        if user is None or not user.is_active:
+            record_login(phone, user, False, UNKNOWN_USER if user is None else INACTIVE_USER)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=ErrorCode.LOGIN_BAD_CREDENTIALS
+            )
+        record_login(phone, user, True)
+        response = await auth_backend.login(get_jwt_strategy(), user)
+        await user_manager.on_after_login(user, request, response)
+        return response
+
+    return router
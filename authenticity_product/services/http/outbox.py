@@ -0,0 +1,191 @@
+"""Transactional outbox module.
+
+User lifecycle events are written to the ``outbox_message`` table in the transaction of the
+change which produced them, and delivered later by a background dispatcher, so requests never
+wait for an email or SMS provider and no event is lost when the process stops.
+"""
+import asyncio
+import contextlib
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Protocol
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from authenticity_product.models import OutboxMessage, User
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.replicas import RoutingSession
+
+
+logger = logging.getLogger(__name__)
+
+USER_REGISTERED = "user.registered"
+USER_FORGOT_PASSWORD = "user.forgot_password"
+USER_REQUEST_VERIFY = "user.request_verify"
+
+
+def create_message(
+    event_name: str, payload: dict[str, Any], idempotency_key: str | None = None
+) -> OutboxMessage:
+    """Create an outbox message, keyed by the event and its payload unless a key is given."""
+    if idempotency_key is None:
+        digest = hashlib.sha256(repr(sorted(payload.items())).encode()).hexdigest()
+        idempotency_key = f"{event_name}:{digest}"
+    return OutboxMessage(
+        idempotency_key=idempotency_key,
+        event=event_name,
+        payload=payload,
+        attempts=0,
+        available_at=datetime.now(),
+    )
+
+
+def stage_registered_users(session: Session, flush_context: Any, instances: Any) -> None:
+    """Add a registration message for each new user to the flush which inserts it."""
+    for user in [obj for obj in session.new if isinstance(obj, User)]:
+        if user.id is None:
+            user.id = uuid.uuid4()
+        session.add(
+            create_message(
+                USER_REGISTERED,
+                {
+                    "user_id": str(user.id),
+                    "email": user.email,
+                    "phone": user.phone,
+                    "first_name": user.first_name,
+                },
+                idempotency_key=f"{USER_REGISTERED}:{user.id}",
+            )
+        )
+
+
+# only the sessions of the application stage messages, not every session of the process
+event.listen(RoutingSession, "before_flush", stage_registered_users)
+
+
+class Sender(Protocol):
+    """Delivery of outbox messages, which must be idempotent on the key of the message."""
+
+    async def send(self, message: OutboxMessage) -> None:
+        """Deliver a message, raising on failure."""
+
+
+class LogSender:
+    """Sender writing the messages to the log, until real delivery is plugged in."""
+
+    async def send(self, message: OutboxMessage) -> None:
+        """Log the event of a message, never its payload, which may carry tokens."""
+        logger.info(f"Outbox {message.event} [{message.idempotency_key}]")
+
+
+class OutboxDispatcher:
+    """Background task draining the outbox in batches.
+
+    Pending messages are locked with SKIP LOCKED, so several workers share the outbox without
+    sending a message twice. Failed messages are retried with an exponential backoff until
+    the maximum number of attempts. Sent messages are purged by the maintenance scheduler.
+    """
+
+    def __init__(
+        self,
+        session_maker: sessionmaker,  # type: ignore[type-arg]
+        sender: Sender,
+        batch_size: int = 100,
+        concurrency: int = 10,
+        max_attempts: int = 10,
+        poll_interval_in_seconds: float = 1,
+        base_backoff_in_seconds: float = 2,
+    ):
+        self.session_maker = session_maker
+        self.sender = sender
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_attempts = max_attempts
+        self.poll_interval_in_seconds = poll_interval_in_seconds
+        self.base_backoff_in_seconds = base_backoff_in_seconds
+        self._task: asyncio.Task[None] | None = None
+
+    async def send(self, message: OutboxMessage) -> Exception | None:
+        """Send a message, returning the error instead of raising it."""
+        async with self.semaphore:
+            try:
+                await self.sender.send(message)
+            except Exception as error:  # pylint: disable=broad-except
+                return error
+        return None
+
+    async def dispatch_batch(self) -> int:
+        """Send a batch of due messages, and return its size."""
+        session: AsyncSession
+        async with self.session_maker() as session:
+            messages = (
+                (
+                    await session.execute(
+                        select(OutboxMessage)
+                        .where(
+                            OutboxMessage.sent_at.is_(None),
+                            OutboxMessage.available_at <= datetime.now(),
+                            OutboxMessage.attempts < self.max_attempts,
+                        )
+                        .order_by(OutboxMessage.id)
+                        .limit(self.batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                )
+                .scalars()
+                .all()
+            )
+            errors = await asyncio.gather(*(self.send(message) for message in messages))
+            now = datetime.now()
+            for message, error in zip(messages, errors):
+                message.attempts += 1
+                if error is None:
+                    message.sent_at, message.last_error = now, None
+                    continue
+                message.last_error = repr(error)
+                message.available_at = now + timedelta(
+                    seconds=min(self.base_backoff_in_seconds * 2**message.attempts, 3600)
+                )
+                if message.attempts >= self.max_attempts:
+                    logger.error(
+                        f"Outbox message {message.idempotency_key} abandoned after "
+                        f"{message.attempts} attempts: {message.last_error}"
+                    )
+            await session.commit()
+        return len(messages)
+
+    async def run(self) -> None:
+        """Drain the outbox forever, polling while it is empty."""
+        while True:
+            try:
+                if await self.dispatch_batch() == self.batch_size:
+                    continue
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Outbox dispatch failed")
+            await asyncio.sleep(self.poll_interval_in_seconds)
+
+    async def start(self) -> None:
+        """Start draining the outbox in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop draining the outbox."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+outbox_dispatcher = OutboxDispatcher(
+    async_session_maker,
+    LogSender(),
+    batch_size=settings.outbox_batch_size,
+    concurrency=settings.outbox_concurrency,
+    max_attempts=settings.outbox_max_attempts,
+    poll_interval_in_seconds=settings.outbox_poll_interval_in_seconds,
+)
@@ -0,0 +1,87 @@
+"""Monthly partitions module.
+
+Append-only tables such as the scan events are partitioned by month on their timestamp, the
+partition of a month being created by the first write reaching it, so that no migration has
+to run ahead of the calendar and old months can be dropped at once. The partition of the next
+month is created along, so that the first writes of a month do not wait for it.
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+def month_start(moment: datetime) -> datetime:
+    """Return the first instant of the month of a moment."""
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    """Return the first instant of the month following a month."""
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """Return the name of the partition of a table holding a month."""
+    return f"{table}_p{month:%Y%m}"
+
+
+async def create_partition(connection: AsyncConnection, table: str, month: datetime) -> None:
+    """Create the partition of a table holding a month, unless it exists, and commit."""
+    # attaching a partition locks the whole table, better fail and retry than block its readers
+    await connection.execute(text("SET LOCAL lock_timeout = '2s'"))
+    # concurrent creations of a same partition would conflict on its catalog entries
+    await connection.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": table}
+    )
+    await connection.execute(
+        text(
+            f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+        )
+    )
+    await connection.commit()
+
+
+async def drop_partitions(connection: AsyncConnection, table: str, before: datetime) -> list[str]:
+    """Drop the partitions of a table holding months entirely before an instant.
+
+    A partition is detached concurrently, which waits for the queries reading it instead of
+    locking the table against them, then dropped, so the connection is switched to autocommit.
+    Return the names of the partitions dropped, none while another process drops those of the
+    table.
+    """
+    await connection.execution_options(isolation_level="AUTOCOMMIT")
+    key = f"{table}:drop"
+    if not await connection.scalar(
+        text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": key}
+    ):
+        return []
+    try:
+        partitions = await connection.execute(
+            text(
+                "SELECT child.relname AS name, pg_inherits.inhdetachpending AS pending "
+                "FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "WHERE parent.relname = :table ORDER BY child.relname"
+            ),
+            {"table": table},
+        )
+        dropped = []
+        for name, pending in partitions.all():
+            try:
+                month = datetime.strptime(name.removeprefix(f"{table}_p"), "%Y%m")
+            except ValueError:
+                continue
+            if name == partition_name(table, month) and next_month(month) <= before:
+                # an interrupted concurrent detach leaves the partition pending, to finalize
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                await connection.execute(
+                    text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" {mode}')
+                )
+                await connection.execute(text(f'DROP TABLE "{name}"'))
+                dropped.append(name)
+        return dropped
+    finally:
+        await connection.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": key})
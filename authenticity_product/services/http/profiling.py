@@ -0,0 +1,122 @@
+"""On-demand request profiling module."""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from pathlib import Path
+
+import jwt
+from pyinstrument import Profiler
+from pyinstrument.renderers import SpeedscopeRenderer
+from pyinstrument.session import Session
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from authenticity_product.services.http.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+
+def is_admin_token(authorization: str | None) -> bool:
+    """Check that an authorization header carries a valid token of an admin."""
+    if authorization is None or not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        decoded = jwt.decode(
+            jwt=authorization[len("bearer ") :],
+            audience=["fastapi-users:auth"],
+            key=settings.public_key,
+            algorithms=["RS256"],
+        )
+    except jwt.PyJWTError:
+        return False
+    return bool(decoded.get("role") == "admin")
+
+
+def render_speedscope(session: Session) -> str:
+    """Render a profiler session in the speedscope format."""
+    return str(SpeedscopeRenderer().render(session))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests with a sampling profiler.
+
+    An admin requests the profile of its own request with the ``X-Profile`` header, the
+    speedscope file is then returned in place of the response body. When profiling is enabled
+    in the settings, a fraction of the traffic is also profiled and the files are stored in
+    the output directory.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        sample_rate: float = 0.0,
+        interval_in_seconds: float = 0.001,
+        output_dir: str = "profiles",
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.interval_in_seconds = interval_in_seconds
+        self.output_dir = Path(output_dir)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Profile the request when asked by an admin or picked by the sampling."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if PROFILE_HEADER in headers and is_admin_token(headers.get("authorization")):
+            await self.return_profile(scope, receive, send)
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            await self.store_profile(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def profile(self, scope: Scope, receive: Receive, send: Send) -> Session:
+        """Run the request under the profiler."""
+        profiler = Profiler(interval=self.interval_in_seconds, async_mode="enabled")
+        profiler.start(target_description=f'{scope["method"]} {scope["path"]}')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session = profiler.stop()
+        return session
+
+    async def return_profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Profile the request and send the speedscope file as the response."""
+
+        async def discard(message: Message) -> None:
+            return None
+
+        session = await self.profile(scope, receive, discard)
+        body = (await asyncio.to_thread(render_speedscope, session)).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"content-disposition", b'attachment; filename="profile.speedscope.json"'),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def store_profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Profile the request and write the speedscope file to the output directory."""
+        session = await self.profile(scope, receive, send)
+        name = f'{time.strftime("%Y%m%dT%H%M%S")}-{scope["method"]}-{uuid.uuid4().hex[:8]}'
+        path = self.output_dir / f"{name}.speedscope.json"
+        await asyncio.to_thread(self.write_profile, path, session)
+        logger.info(f'Profile of "{scope["method"]} {scope["path"]}" written to {path}')
+
+    @staticmethod
+    def write_profile(path: Path, session: Session) -> None:
+        """Write a speedscope file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(render_speedscope(session))
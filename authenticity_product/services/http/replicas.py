@@ -0,0 +1,137 @@
+"""Read replicas module."""
+import asyncio
+import contextlib
+import itertools
+import logging
+from typing import Any
+
+from sqlalchemy import Engine, Select, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+
+logger = logging.getLogger(__name__)
+
+# 0 on a replica which replayed everything it received, and on a server which is not a replica
+LAG_STATEMENT = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    """A read replica, reachable through an async and a sync engine."""
+
+    def __init__(self, host: str, engine_async: AsyncEngine, engine: Engine):
+        self.host = host
+        self.engine_async = engine_async
+        self.engine = engine
+        self.healthy = False
+        self.lag_in_seconds: float | None = None
+
+
+class ReplicaSet:
+    """Read replicas whose health and replication lag are probed in the background.
+
+    A replica is used only while its last probe succeeded and its lag is below the maximum.
+    """
+
+    def __init__(
+        self,
+        replicas: list[Replica],
+        max_lag_in_seconds: float,
+        probe_timeout_in_seconds: float = 2,
+    ):
+        self.replicas = replicas
+        self.max_lag_in_seconds = max_lag_in_seconds
+        self.probe_timeout_in_seconds = probe_timeout_in_seconds
+        self._round_robin = itertools.count()
+        self._task: asyncio.Task[None] | None = None
+
+    def pick(self) -> Replica | None:
+        """Return a healthy replica, or None when reads must go to the primary."""
+        if not (healthy := [replica for replica in self.replicas if replica.healthy]):
+            return None
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    async def probe_replica(self, replica: Replica) -> None:
+        """Measure the lag of a replica and update its health."""
+        try:
+            async with asyncio.timeout(self.probe_timeout_in_seconds):
+                async with replica.engine_async.connect() as connection:
+                    lag = float((await connection.execute(LAG_STATEMENT)).scalar_one())
+        except Exception:  # pylint: disable=broad-except
+            if replica.healthy:
+                logger.warning(f"Replica {replica.host} is unreachable", exc_info=True)
+            replica.healthy, replica.lag_in_seconds = False, None
+            return
+        replica.lag_in_seconds = lag
+        if replica.healthy and lag > self.max_lag_in_seconds:
+            logger.warning(f"Replica {replica.host} lags by {lag:.1f}s, reads fall back")
+        replica.healthy = lag <= self.max_lag_in_seconds
+
+    async def probe(self) -> None:
+        """Probe every replica."""
+        await asyncio.gather(*(self.probe_replica(replica) for replica in self.replicas))
+
+    async def run(self, interval_in_seconds: float) -> None:
+        """Probe the replicas forever."""
+        while True:
+            await self.probe()
+            await asyncio.sleep(interval_in_seconds)
+
+    async def start(self, interval_in_seconds: float) -> None:
+        """Probe the replicas once, then keep probing them in the background."""
+        if not self.replicas:
+            return
+        await self.probe()
+        self._task = asyncio.create_task(self.run(interval_in_seconds))
+
+    async def stop(self) -> None:
+        """Stop probing the replicas."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+def is_read_only(clause: Any) -> bool:
+    """Check whether a statement can be served by a replica."""
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session sending read-only statements to a replica, and everything else to the primary.
+
+    Once the session wrote, or ran anything but a plain select, it sticks to the primary, so
+    the reads which follow a write in the same request see it. The replica is picked once per
+    session, so that its reads are never served by replicas with different lags.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        primary: Engine,
+        replica_set: ReplicaSet,
+        use_async_engines: bool = False,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.primary = primary
+        self.replica_set = replica_set
+        self.use_async_engines = use_async_engines
+
+    def get_bind(  # type: ignore[override]
+        self, mapper: Any = None, *, clause: Any = None, **kw: Any
+    ) -> Engine:
+        """Return the engine which must run a statement."""
+        if self.info.get("use_primary") or self._flushing or not is_read_only(clause):
+            self.info["use_primary"] = True
+            return self.primary
+        if (replica := self.info.get("replica")) is None:
+            if (replica := self.replica_set.pick()) is None:
+                return self.primary
+            self.info["replica"] = replica
+        return replica.engine_async.sync_engine if self.use_async_engines else replica.engine
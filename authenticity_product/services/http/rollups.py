@@ -0,0 +1,263 @@
+"""Scan analytics rollups module.
+
+The dashboards read the scans of a product per day and country from ``scan_rollup`` rather
+than grouping the raw scan events. A background job aggregates the events past the id stored
+in ``rollup_watermark`` by batches, each batch added to the rollups and moving the watermark in
+one transaction, so that an event is counted exactly once whichever replica runs the job, the
+others skipping the batch locked.
+
+The events of concurrent writers commit out of the order of their ids, so a batch stops before
+a gap in the ids until every transaction running when the gap was seen has ended, the ids then
+missing being those of rolled back writes.
+
+The rollups are read by keyset pages on their primary key, and exported as CSV or NDJSON by
+streaming those pages.
+"""
+import asyncio
+import contextlib
+import csv
+import io
+import logging
+import time
+from collections.abc import AsyncIterator
+from datetime import date
+from typing import Any, Literal
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import literal, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection
+from authenticity_product.models import ScanRollup
+from authenticity_product.schemas import ScanRollupPage, ScanRollupRead
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.cursors import decode_cursor, encode_cursor
+from authenticity_product.services.http.db_async import async_session_maker, engine_async
+from authenticity_product.services.http.id_gaps import IdGaps, take_snapshot
+from authenticity_product.services.http.metrics import ROLLUP_EVENTS, ROLLUP_LAG
+from authenticity_product.services.http.users import current_admin_user
+
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = "scan_rollup"
+ROLLUP_STATEMENT = text(
+    """
+    INSERT INTO scan_rollup AS rollup (product_id, day, country, scans, authentic)
+    SELECT product_id, scanned_at::date, coalesce(country, ''), count(*),
+        count(*) FILTER (WHERE result = 'authentic')
+    FROM scan_event
+    WHERE id > :after AND id <= :until AND product_id IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (product_id, day, country) DO UPDATE
+    SET scans = rollup.scans + excluded.scans, authentic = rollup.authentic + excluded.authentic
+    """
+)
+EXPORT_COLUMNS = ("product_id", "day", "country", "scans", "authentic")
+
+
+class RollupJob:
+    """Background aggregation of the scan events into the rollups."""
+
+    def __init__(self, interval_in_seconds: float, batch_size: int):
+        self.interval_in_seconds = interval_in_seconds
+        self.batch_size = batch_size
+        self._gaps = IdGaps()
+        self._task: asyncio.Task[None] | None = None
+
+    async def batch_end(self, connection: AsyncConnection, after: int) -> tuple[int, int]:
+        """Return the last id of the next batch of events, and their number."""
+        snapshot = await take_snapshot(connection)
+        ids = await connection.scalars(
+            text("SELECT id FROM scan_event WHERE id > :after ORDER BY id LIMIT :limit"),
+            {"after": after, "limit": self.batch_size},
+        )
+        until, events = after, 0
+        for event_id in ids:
+            if event_id > until + 1 and self._gaps.is_open(until + 1, snapshot):
+                break
+            until, events = event_id, events + 1
+        self._gaps.keep([first for first in self._gaps if first > until])
+        return until, events
+
+    async def aggregate(self) -> int:
+        """Add the next batch of events to the rollups, and return their number."""
+        async with engine_async.connect() as connection:
+            locked = await connection.scalar(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": ROLLUP_NAME}
+            )
+            if not locked:
+                return 0
+            after = await connection.scalar(
+                text(
+                    "INSERT INTO rollup_watermark (name, last_id, created_at, updated_at) "
+                    "VALUES (:name, 0, LOCALTIMESTAMP, LOCALTIMESTAMP) "
+                    "ON CONFLICT (name) DO UPDATE SET name = excluded.name RETURNING last_id"
+                ),
+                {"name": ROLLUP_NAME},
+            )
+            until, events = await self.batch_end(connection, after)
+            if until == after:
+                await connection.rollback()
+                return 0
+            await connection.execute(ROLLUP_STATEMENT, {"after": after, "until": until})
+            await connection.execute(
+                text(
+                    "UPDATE rollup_watermark SET last_id = :until, updated_at = LOCALTIMESTAMP "
+                    "WHERE name = :name"
+                ),
+                {"name": ROLLUP_NAME, "until": until},
+            )
+            scanned_at = await connection.scalar(
+                text("SELECT scanned_at FROM scan_event WHERE id = :id"), {"id": until}
+            )
+            await connection.commit()
+        ROLLUP_EVENTS.inc(events)
+        if scanned_at is not None:
+            ROLLUP_LAG.set(time.time() - scanned_at.timestamp())
+        return events
+
+    async def catch_up(self) -> None:
+        """Aggregate the events by batches until none is left."""
+        while await self.aggregate() == self.batch_size:
+            pass
+
+    async def run(self) -> None:
+        """Aggregate the new events forever."""
+        while True:
+            try:
+                await self.catch_up()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Scan rollup failed")
+            await asyncio.sleep(self.interval_in_seconds)
+
+    async def start(self) -> None:
+        """Start aggregating the events in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop aggregating the events."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+rollup_job = RollupJob(settings.rollup_interval_in_seconds, settings.rollup_batch_size)
+
+
+class RollupFilter:
+    """Filter of the rollups, as query parameters."""
+
+    def __init__(
+        self,
+        product_id: int | None = None,
+        start: date | None = None,
+        end: date | None = None,
+        country: str | None = None,
+    ):
+        self.product_id = product_id
+        self.start = start
+        self.end = end
+        self.country = country
+
+    async def page(self, after: tuple[Any, ...] | None, limit: int) -> list[ScanRollup]:
+        """Return the rollups following a key, by primary key."""
+        statement = (
+            select(ScanRollup)
+            .order_by(ScanRollup.product_id, ScanRollup.day, ScanRollup.country)
+            .limit(limit)
+        )
+        if self.product_id is not None:
+            statement = statement.where(ScanRollup.product_id == self.product_id)
+        if self.start is not None:
+            statement = statement.where(ScanRollup.day >= self.start)
+        if self.end is not None:
+            statement = statement.where(ScanRollup.day <= self.end)
+        if self.country is not None:
+            statement = statement.where(ScanRollup.country == self.country)
+        if after is not None:
+            statement = statement.where(
+                tuple_(ScanRollup.product_id, ScanRollup.day, ScanRollup.country)
+                > tuple_(*(literal(value) for value in after))
+            )
+        async with async_session_maker() as session:
+            return list((await session.execute(statement)).scalars())
+
+    async def rows(self, page_size: int) -> AsyncIterator[list[ScanRollup]]:
+        """Yield every rollup matching, page by page."""
+        after = None
+        while rollups := await self.page(after, page_size):
+            yield rollups
+            if len(rollups) < page_size:
+                return
+            last = rollups[-1]
+            after = (last.product_id, last.day, last.country)
+
+
+async def export_csv(rollups: RollupFilter, page_size: int) -> AsyncIterator[bytes]:
+    """Yield the rollups as CSV, a header then a chunk per page."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for page in rollups.rows(page_size):
+        writer.writerows(
+            [rollup.product_id, rollup.day, rollup.country, rollup.scans, rollup.authentic]
+            for rollup in page
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def export_ndjson(rollups: RollupFilter, page_size: int) -> AsyncIterator[bytes]:
+    """Yield the rollups as NDJSON, a chunk per page."""
+    async for page in rollups.rows(page_size):
+        yield b"".join(
+            ScanRollupRead.model_validate(rollup).model_dump_json().encode() + b"\n"
+            for rollup in page
+        )
+
+
+def get_analytics_router() -> APIRouter:
+    """Return the admin routes of the scan analytics."""
+    router = APIRouter(dependencies=[Depends(current_admin_user)])
+
+    @router.get("/scans", response_model=ScanRollupPage)
+    async def read_scans(
+        rollups: RollupFilter = Depends(),
+        after: str | None = None,
+        limit: int = Query(100, ge=1, le=1000),
+    ) -> dict[str, Any]:
+        """Return a page of the scans per product, day and country, and the next page cursor."""
+        key = decode_cursor(after, int, date.fromisoformat, str) if after else None
+        page = await rollups.page(key, limit)
+        return {
+            "items": page,
+            "next": (
+                encode_cursor([page[-1].product_id, str(page[-1].day), page[-1].country])
+                if len(page) == limit
+                else None
+            ),
+        }
+
+    @router.get("/scans/export")
+    async def export_scans(
+        rollups: RollupFilter = Depends(),
+        export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    ) -> StreamingResponse:
+        """Stream every scan per product, day and country matching, as CSV or NDJSON."""
+        if export_format == "csv":
+            return StreamingResponse(
+                export_csv(rollups, settings.rollup_export_page_size),
+                media_type="text/csv",
+                headers={"Content-Disposition": 'attachment; filename="scans.csv"'},
+            )
+        return StreamingResponse(
+            export_ndjson(rollups, settings.rollup_export_page_size),
+            media_type="application/x-ndjson",
+        )
+
+    return router
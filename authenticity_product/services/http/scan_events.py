@@ -0,0 +1,74 @@
+"""Scan events module.
+
+Every verification is recorded for the analytics through a batched writer, with the coarse
+location of the scan: the country given by the CDN in front of the service, and the position
+the client may send, rounded to a tenth of a degree. The scans of the authentic codes also feed
+the anomaly detector.
+"""
+from datetime import datetime
+
+from starlette.requests import Request
+from authenticity_product.services.http.anomalies import anomaly_detector
+from authenticity_product.services.http.batch_writer import BatchWriter
+from authenticity_product.services.http.config import settings
+
+
+SCAN_EVENT_COLUMNS = (
+    "scanned_at",
+    "code",
+    "product_id",
+    "result",
+    "country",
+    "latitude",
+    "longitude",
+    "client",
+)
+
+
+def coarse(coordinate: float | None) -> float | None:
+    """Return a coordinate rounded to about ten kilometers."""
+    return None if coordinate is None else round(coordinate, 1)
+
+
+scan_event_writer = BatchWriter(
+    "scan_event",
+    SCAN_EVENT_COLUMNS,
+    partition_column="scanned_at",
+    queue_size=settings.scan_events_queue_size,
+    batch_size=settings.scan_events_batch_size,
+    flush_interval_in_seconds=settings.scan_events_flush_interval_in_seconds,
+    shutdown_timeout_in_seconds=settings.scan_events_shutdown_timeout_in_seconds,
+)
+
+
+def record_scan(
+    request: Request,
+    code: str,
+    product_id: int | None,
+    result: str,
+    latitude: float | None = None,
+    longitude: float | None = None,
+    key: str | None = None,
+) -> None:
+    """Queue the event of a scan, dropped if the writer falls behind.
+
+    The anomaly detector follows the scans of a code under a key, the code itself by default.
+    """
+    country = request.headers.get(settings.scan_country_header)
+    latitude, longitude = coarse(latitude), coarse(longitude)
+    if result == "authentic" and settings.anomaly_detection_enabled:
+        anomaly_detector.observe(key or code, product_id, latitude, longitude, country)
+    if not settings.scan_events_enabled:
+        return
+    scan_event_writer.add(
+        (
+            datetime.now(),
+            code[:200],
+            product_id,
+            result,
+            country,
+            latitude,
+            longitude,
+            request.headers.get("user-agent", "")[:200] or None,
+        )
+    )
@@ -0,0 +1,233 @@
+"""Shared memory cache module.
+
+A fixed-size hash table in a ``multiprocessing.shared_memory`` segment, attached by name by every
+worker of the host, so a value cached by one worker is a hit for the others. Each key hashes to
+a set of consecutive slots, a slot holding one value with its expiry and the generation of the
+table it was written in; bumping the generation invalidates every entry at once.
+
+Any process of the host may write to the segment, so the values are stored as JSON, which
+decodes to data only, never pickled. The UUIDs, datetimes, dates and bytes JSON lacks are
+tagged, and tuples are read back as lists.
+
+There is no lock between the processes. A writer makes the sequence number of a slot odd while
+it writes, and each slot carries a checksum, so a reader racing a writer, or two racing
+writers, only ever produce a miss.
+"""
+import base64
+import hashlib
+import json
+import struct
+import time
+from datetime import date, datetime
+from multiprocessing import shared_memory
+from typing import Any
+from uuid import UUID
+
+
+MAGIC = b"APCACHE1"
+# magic, generation, slot count, slot size
+HEADER = struct.Struct("<8sQII")
+HEADER_SIZE = 64
+GENERATION_OFFSET = 8
+# sequence, value length, key hash, generation, expiry (epoch seconds), checksum
+SLOT_HEADER = struct.Struct("<IIQQdQ")
+SEQUENCE = struct.Struct("<I")
+
+
+def hash_key(key: str) -> int:
+    """Return the non-zero 64 bits hash of a key, 0 marks an empty slot."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+def checksum(key_hash: int, generation: int, expires_at: float, value: bytes) -> int:
+    """Return the checksum of the content of a slot."""
+    digest = hashlib.blake2b(struct.pack("<QQd", key_hash, generation, expires_at), digest_size=8)
+    digest.update(value)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def encode_tagged(value: Any) -> dict[str, str]:
+    """Return the tagged JSON form of a value JSON lacks."""
+    if isinstance(value, UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"$bytes": base64.b64encode(value).decode()}
+    raise TypeError(f"{type(value).__name__} values cannot be shared")
+
+
+def decode_tagged(document: dict[str, Any]) -> Any:
+    """Return the value of a tagged JSON object, or the object itself."""
+    if len(document) == 1:
+        [(tag, value)] = document.items()
+        if tag == "$uuid":
+            return UUID(value)
+        if tag == "$datetime":
+            return datetime.fromisoformat(value)
+        if tag == "$date":
+            return date.fromisoformat(value)
+        if tag == "$bytes":
+            return base64.b64decode(value)
+    return document
+
+
+def dumps(value: Any) -> bytes:
+    """Return the content of a slot holding a value."""
+    return json.dumps(value, default=encode_tagged, separators=(",", ":")).encode()
+
+
+def loads(data: bytes) -> Any:
+    """Return the value held by the content of a slot."""
+    return json.loads(data, object_hook=decode_tagged)
+
+
+class SharedMemoryCache:
+    """Cache shared by the processes of a host, with the interface of the in-process TTLCache.
+
+    The segment is created by the first process and attached by the others. The workers share
+    the resource tracker of their parent process, which unlinks the segment once it exits, so a
+    restarted worker still finds the values of its siblings.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slots: int,
+        slot_size: int,
+        ttl_in_seconds: float,
+        ways: int = 4,
+    ):
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError(f"Slot size must be larger than {SLOT_HEADER.size} bytes")
+        self.slots = slots
+        self.slot_size = slot_size
+        self.ttl_in_seconds = ttl_in_seconds
+        self.ways = min(ways, slots)
+        self.hits = 0
+        self.misses = 0
+        size = HEADER_SIZE + slots * slot_size
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.buffer = self.memory.buf
+        magic, _, existing_slots, existing_slot_size = HEADER.unpack_from(self.buffer, 0)
+        if magic == MAGIC and (existing_slots, existing_slot_size) != (slots, slot_size):
+            raise ValueError(f"Shared cache {name} exists with another geometry")
+        if magic != MAGIC:
+            HEADER.pack_into(self.buffer, 0, MAGIC, 1, slots, slot_size)
+
+    @property
+    def generation(self) -> int:
+        """Return the current generation of the table."""
+        return int(struct.unpack_from("<Q", self.buffer, GENERATION_OFFSET)[0])
+
+    def offsets(self, key_hash: int) -> list[int]:
+        """Return the offsets of the slots a key may be stored in."""
+        first = key_hash % self.slots
+        return [
+            HEADER_SIZE + (first + way) % self.slots * self.slot_size for way in range(self.ways)
+        ]
+
+    def read(self, offset: int, key_hash: int, generation: int) -> bytes | None:
+        """Return the value of a slot if it holds a live, consistent entry for the key."""
+        (
+            sequence,
+            length,
+            slot_key,
+            slot_generation,
+            expires_at,
+            slot_checksum,
+        ) = SLOT_HEADER.unpack_from(self.buffer, offset)
+        if slot_key != key_hash or sequence & 1:
+            return None
+        if slot_generation != generation or expires_at < time.time():
+            return None
+        if length > self.slot_size - SLOT_HEADER.size:
+            return None
+        start = offset + SLOT_HEADER.size
+        value = bytes(self.buffer[start : start + length])
+        if SEQUENCE.unpack_from(self.buffer, offset)[0] != sequence:
+            return None
+        if checksum(key_hash, generation, expires_at, value) != slot_checksum:
+            return None
+        return value
+
+    def get(self, key: str) -> Any | None:
+        """Return the cached value, or None if it is missing or expired."""
+        key_hash, generation = hash_key(key), self.generation
+        for offset in self.offsets(key_hash):
+            if (value := self.read(offset, key_hash, generation)) is not None:
+                try:
+                    decoded = loads(value)
+                except ValueError:
+                    break
+                self.hits += 1
+                return decoded
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl_in_seconds: float | None = None) -> None:
+        """Store a value, in the slot of the key, a free slot or the one expiring first.
+
+        Values too large for a slot are not cached.
+        """
+        data = dumps(value)
+        if len(data) > self.slot_size - SLOT_HEADER.size:
+            return
+        key_hash, generation, now = hash_key(key), self.generation, time.time()
+        expires_at = now + (self.ttl_in_seconds if ttl_in_seconds is None else ttl_in_seconds)
+        candidates = []
+        for offset in self.offsets(key_hash):
+            _, _, slot_key, slot_generation, slot_expires_at, _ = SLOT_HEADER.unpack_from(
+                self.buffer, offset
+            )
+            if slot_key == key_hash:
+                candidates = [(float("-inf"), offset)]
+                break
+            free = slot_key == 0 or slot_generation != generation or slot_expires_at < now
+            candidates.append((float("-inf") if free else slot_expires_at, offset))
+        self.write(min(candidates)[1], key_hash, generation, expires_at, data)
+
+    def write(
+        self, offset: int, key_hash: int, generation: int, expires_at: float, data: bytes
+    ) -> None:
+        """Write an entry to a slot, its sequence number staying odd while it is written."""
+        sequence = SEQUENCE.unpack_from(self.buffer, offset)[0] | 1
+        SEQUENCE.pack_into(self.buffer, offset, sequence)
+        start = offset + SLOT_HEADER.size
+        self.buffer[start : start + len(data)] = data
+        SLOT_HEADER.pack_into(
+            self.buffer,
+            offset,
+            sequence,
+            len(data),
+            key_hash,
+            generation,
+            expires_at,
+            checksum(key_hash, generation, expires_at, data),
+        )
+        SEQUENCE.pack_into(self.buffer, offset, (sequence + 1) & 0xFFFFFFFF)
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache."""
+        key_hash = hash_key(key)
+        for offset in self.offsets(key_hash):
+            if SLOT_HEADER.unpack_from(self.buffer, offset)[2] == key_hash:
+                self.write(offset, 0, 0, 0.0, b"")
+
+    def clear(self) -> None:
+        """Invalidate every value by starting a new generation."""
+        struct.pack_into("<Q", self.buffer, GENERATION_OFFSET, self.generation + 1)
+
+    def close(self) -> None:
+        """Detach this process from the segment."""
+        self.buffer = None  # type: ignore[assignment]
+        self.memory.close()
+
+    def unlink(self) -> None:
+        """Destroy the segment, once no worker uses it anymore."""
+        self.memory.unlink()
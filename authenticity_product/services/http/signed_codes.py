@@ -0,0 +1,188 @@
+"""Signed product codes module.
+
+A signed code is checked against the public key of the service without any query, the
+database only being asked whether the code was revoked, an answer cached for a while. The
+codes are signed with the key of ``PRODUCT_CODE_KEY_URL``, an Ed25519 or ECDSA P-256 key whose
+codes are 127 characters long, or with the RSA key signing the tokens, whose codes are longer
+but still fit a QR code.
+
+Usage: python -m authenticity_product.services.http.signed_codes PRODUCT_ID FIRST_SERIAL COUNT
+"""
+import argparse
+import functools
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from sqlalchemy import text
+from authenticity_product.services.http.cache import CacheBackend, get_backend
+from authenticity_product.services.http.circuit_breaker import CONNECTION_ERRORS
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.metrics import VERIFICATION_LOOKUPS
+from authenticity_product.verifier import (
+    encode,
+    get_algorithm,
+    get_key_id,
+    HEADER,
+    PrivateKey,
+    SignedCode,
+    Verifier,
+)
+
+
+class CodeSigner:
+    """Signature of product codes with a private key."""
+
+    def __init__(self, private_key: PrivateKey):
+        self.private_key = private_key
+        self.algorithm = get_algorithm(private_key)
+        self.key_id = get_key_id(private_key.public_key())
+
+    def sign(self, product_id: int, serial: int) -> str:
+        """Return the signed code of a serial of a product."""
+        payload = HEADER.pack(self.algorithm, self.key_id, product_id, serial)
+        if isinstance(self.private_key, ed25519.Ed25519PrivateKey):
+            signature = self.private_key.sign(payload)
+        elif isinstance(self.private_key, ec.EllipticCurvePrivateKey):
+            r, s = decode_dss_signature(self.private_key.sign(payload, ec.ECDSA(hashes.SHA256())))
+            signature = r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        else:
+            signature = self.private_key.sign(payload, padding.PKCS1v15(), hashes.SHA256())
+        return encode(payload + signature)
+
+    def public_pem(self) -> str:
+        """Return the public key to hand to the offline verifiers."""
+        return (
+            self.private_key.public_key()
+            .public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+            .decode()
+        )
+
+
+@functools.cache
+def get_code_signer() -> CodeSigner:
+    """Return the signer of the codes, its key being fetched on first use."""
+    return CodeSigner(settings.product_code_key)
+
+
+@functools.cache
+def get_code_verifier() -> Verifier:
+    """Return the verifier of the codes signed by this service."""
+    return Verifier([settings.product_code_key.public_key()])
+
+
+class RevocationList:
+    """Revocation status of signed codes, through a cache."""
+
+    def __init__(self, cache: CacheBackend):
+        self.cache = cache
+
+    async def is_revoked(self, code: SignedCode) -> bool:
+        """Return whether a signed code was revoked."""
+        key = f"{code.product_id}:{code.serial}"
+        if (cached := self.cache.get(key)) is not None:
+            VERIFICATION_LOOKUPS.labels("cache", "revoked" if cached else "found").inc()
+            return bool(cached)
+        settings.circuit_breaker.check()
+        try:
+            async with async_session_maker() as session:
+                revoked = (
+                    await session.execute(
+                        text(
+                            "SELECT 1 FROM revoked_code "
+                            "WHERE product_id = :product_id AND serial = :serial"
+                        ),
+                        {"product_id": code.product_id, "serial": code.serial},
+                    )
+                ).first() is not None
+        except CONNECTION_ERRORS as error:
+            settings.circuit_breaker.record_error(error)
+            raise
+        VERIFICATION_LOOKUPS.labels("database", "revoked" if revoked else "found").inc()
+        self.cache.set(key, b"1" if revoked else b"")
+        return revoked
+
+    async def revoked_among(self, codes: list[SignedCode]) -> set[tuple[int, int]]:
+        """Return the product and serial of the revoked codes among signed codes.
+
+        The codes missing from the cache are looked up with a single query.
+        """
+        revoked, misses = set(), []
+        for code in codes:
+            if (cached := self.cache.get(f"{code.product_id}:{code.serial}")) is None:
+                misses.append((code.product_id, code.serial))
+            elif cached:
+                revoked.add((code.product_id, code.serial))
+        VERIFICATION_LOOKUPS.labels("cache", "revoked").inc(len(revoked))
+        VERIFICATION_LOOKUPS.labels("cache", "found").inc(len(codes) - len(misses) - len(revoked))
+        if not misses:
+            return revoked
+        settings.circuit_breaker.check()
+        try:
+            async with async_session_maker() as session:
+                rows = (
+                    await session.execute(
+                        text(
+                            "SELECT product_id, serial FROM revoked_code "
+                            "WHERE (product_id, serial) IN "
+                            "(SELECT * FROM unnest(CAST(:product_ids AS integer[]), "
+                            "CAST(:serials AS bigint[])))"
+                        ),
+                        {
+                            "product_ids": [product_id for product_id, _ in misses],
+                            "serials": [serial for _, serial in misses],
+                        },
+                    )
+                ).all()
+        except CONNECTION_ERRORS as error:
+            settings.circuit_breaker.record_error(error)
+            raise
+        found = {(row.product_id, row.serial) for row in rows}
+        for product_id, serial in misses:
+            self.cache.set(f"{product_id}:{serial}", b"1" if (product_id, serial) in found else b"")
+        VERIFICATION_LOOKUPS.labels("database", "revoked").inc(len(found))
+        VERIFICATION_LOOKUPS.labels("database", "found").inc(len(misses) - len(found))
+        return revoked | found
+
+    async def revoke(self, product_id: int, serial: int, reason: str | None = None) -> None:
+        """Revoke the signed code of a serial of a product."""
+        async with async_session_maker() as session:
+            await session.execute(
+                text(
+                    "INSERT INTO revoked_code (product_id, serial, reason, created_at, updated_at) "
+                    "VALUES (:product_id, :serial, :reason, LOCALTIMESTAMP, LOCALTIMESTAMP) "
+                    "ON CONFLICT DO NOTHING"
+                ),
+                {"product_id": product_id, "serial": serial, "reason": reason},
+            )
+            await session.commit()
+        self.cache.delete(f"{product_id}:{serial}")
+
+
+revocation_list = RevocationList(
+    get_backend(
+        "revocation",
+        settings.verification_cache_max_size,
+        settings.revocation_cache_ttl_in_seconds,
+        slot_size=64,
+    )
+)
+
+
+def main() -> None:
+    """Print the signed codes of a range of serials of a product."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("product_id", type=int)
+    parser.add_argument("first_serial", type=int)
+    parser.add_argument("count", type=int)
+    parsed = parser.parse_args()
+    signer = get_code_signer()
+    for serial in range(parsed.first_serial, parsed.first_serial + parsed.count):
+        print(signer.sign(parsed.product_id, serial))
+
+
+if __name__ == "__main__":
+    main()
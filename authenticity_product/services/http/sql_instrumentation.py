@@ -0,0 +1,207 @@
+"""Per-request SQL instrumentation module."""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExceptionContext, ExecutionContext
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("authenticity_product.access")
+
+
+class RequestQueryStats:
+    """Queries issued while serving one request."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    @property
+    def duration_in_ms(self) -> float:
+        """Return the total time spent in the database in milliseconds."""
+        return self.duration * 1000
+
+
+current_query_stats: ContextVar[RequestQueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def redact(parameters: Any) -> Any:
+    """Replace the values of the parameters of a statement, keeping their shape."""
+    if isinstance(parameters, dict):
+        return {key: "?" for key in parameters}
+    if isinstance(parameters, (list, tuple)):
+        return ["?"] * len(parameters)
+    return parameters
+
+
+EXPLAINABLE_STATEMENTS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+
+
+class QueryInstrumentation:
+    """Count the queries of each request, and log the slow and repeated ones."""
+
+    def __init__(
+        self,
+        slow_query_threshold_in_ms: float,
+        explain_slow_queries: bool = False,
+        repeated_query_threshold: int = 10,
+    ):
+        self.slow_query_threshold = slow_query_threshold_in_ms / 1000
+        self.explain_slow_queries = explain_slow_queries
+        self.repeated_query_threshold = repeated_query_threshold
+
+    def instrument(self, engine: Engine) -> None:
+        """Listen to the statements executed by an engine."""
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    @staticmethod
+    def before_cursor_execute(
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext | None,
+        executemany: bool,
+    ) -> None:
+        """Remember when the statement started."""
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def after_cursor_execute(
+        self,
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext | None,
+        executemany: bool,
+    ) -> None:
+        """Account the statement to the current request."""
+        duration = time.perf_counter() - conn.info["query_start_time"].pop()
+        if (stats := current_query_stats.get()) is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats.statements[statement] += 1
+            if stats.statements[statement] == self.repeated_query_threshold:
+                logger.warning(
+                    f"Statement executed {self.repeated_query_threshold} times in one request, "
+                    f"check for N+1 queries: {statement}"
+                )
+        if duration >= self.slow_query_threshold:
+            self.log_slow_query(conn, statement, parameters, duration, executemany)
+
+    @staticmethod
+    def handle_error(context: ExceptionContext) -> None:
+        """Forget the start of a failed statement."""
+        if context.connection is not None and context.connection.info.get("query_start_time"):
+            context.connection.info["query_start_time"].pop()
+
+    def log_slow_query(
+        self,
+        conn: Connection,
+        statement: str,
+        parameters: Any,
+        duration: float,
+        executemany: bool,
+    ) -> None:
+        """Log a slow query with its parameters redacted, and its plan if enabled."""
+        message = (
+            f"Slow query ({duration * 1000:.1f} ms): {statement} parameters={redact(parameters)}"
+        )
+        if self.explain_slow_queries and not executemany:
+            if (plan := self.explain(conn, statement, parameters)) is not None:
+                message = f"{message}\n{plan}"
+        logger.warning(message)
+
+    @staticmethod
+    def explain(conn: Connection, statement: str, parameters: Any) -> str | None:
+        """Return the plan of a statement, unless it cannot be explained.
+
+        The plan is fetched with a new DBAPI cursor, so neither the events nor the result of
+        the instrumented cursor are affected. EXPLAIN without ANALYZE never runs the statement,
+        and runs in a savepoint so that its failure does not abort the transaction of the
+        request.
+        """
+        words = statement.split(None, 1)
+        if not words or words[0].upper() not in EXPLAINABLE_STATEMENTS:
+            return None
+        try:
+            cursor = conn.connection.cursor()
+            try:
+                cursor.execute("SAVEPOINT explain_slow_query")
+                try:
+                    cursor.execute(f"EXPLAIN {statement}", parameters)
+                    plan = "\n".join(str(row[0]) for row in cursor.fetchall())
+                except Exception:
+                    cursor.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+                    raise
+                finally:
+                    cursor.execute("RELEASE SAVEPOINT explain_slow_query")
+                return plan
+            finally:
+                cursor.close()
+        except Exception:  # pylint: disable=broad-except
+            logger.debug("Could not explain the slow query", exc_info=True)
+            return None
+
+
+class QueryStatsMiddleware:
+    """ASGI middleware reporting the queries of each request.
+
+    The count and duration of the queries are sent in a Server-Timing header and written
+    to the access log.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Collect the queries of the request."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = current_query_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.duration_in_ms:.1f};desc="{stats.count} queries", '
+                    f"app;dur={(time.perf_counter() - start) * 1000:.1f}",
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_stats.reset(token)
+            duration_in_ms = (time.perf_counter() - start) * 1000
+            access_logger.info(
+                f'"{scope["method"]} {scope["path"]}" {status_code} {duration_in_ms:.1f}ms '
+                f"db_queries={stats.count} db_time={stats.duration_in_ms:.1f}ms",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_in_ms": round(duration_in_ms, 1),
+                    "db_queries": stats.count,
+                    "db_time_in_ms": round(stats.duration_in_ms, 1),
+                },
+            )
@@ -9,6 +9,10 @@ from fastapi_users.authentication.strategy.jwt import (  # type: ignore
 )
 from fastapi_users.jwt import decode_jwt, generate_jwt, SecretType
 from authenticity_product.models import User
+from authenticity_product.services.http.cache import TokenCache
+from authenticity_product.services.http.metrics import AUTH_OPERATION_LATENCY
+from authenticity_product.services.http.structured_logging import bind_log_context
+from authenticity_product.services.http.tracing import tracer
 
 
 class JWTStrategy(Strategy[User, UUID]):
@@ -21,12 +25,14 @@ class JWTStrategy(Strategy[User, UUID]):
         token_audience: list[str] | None = None,
         algorithm: str = "RS256",
         public_key: SecretType | None = None,
+        token_cache: TokenCache | None = None,
     ):
         self.secret = secret
         self.lifetime_seconds = lifetime_seconds
         self.token_audience = token_audience
         self.algorithm = algorithm
         self.public_key = public_key
+        self.token_cache = token_cache
 
     @property
     def encode_key(self) -> SecretType:
@@ -42,31 +48,44 @@ class JWTStrategy(Strategy[User, UUID]):
         self, token: str | None, user_manager: BaseUserManager[User, UUID]
     ) -> User | None:
         """Read token."""
-        if token is None:
-            return None
-
-        try:
-            data = decode_jwt(
-                token,
-                self.decode_key,
-                self.token_audience if self.token_audience is not None else ["fastapi-users:auth"],
-                algorithms=[self.algorithm],
-            )
-            if (user_id := data.get("id")) is None:
+        with AUTH_OPERATION_LATENCY.labels("read_token").time(), tracer.start_as_current_span(
+            "JWTStrategy.read_token"
+        ):
+            if token is None:
                 return None
-        except jwt.PyJWTError:
-            return None
 
-        try:
-            parsed_id = user_manager.parse_id(user_id)
-            return await user_manager.get(parsed_id)
-        except (exceptions.UserNotExists, exceptions.InvalidID):
-            return None
+            if self.token_cache is None or (user_id := self.token_cache.get(token)) is None:
+                try:
+                    data = decode_jwt(
+                        token,
+                        self.decode_key,
+                        self.token_audience
+                        if self.token_audience is not None
+                        else ["fastapi-users:auth"],
+                        algorithms=[self.algorithm],
+                    )
+                    if (user_id := data.get("id")) is None:
+                        return None
+                except jwt.PyJWTError:
+                    return None
+                if self.token_cache is not None:
+                    self.token_cache.set(token, user_id, data.get("exp"))
+
+            try:
+                parsed_id = user_manager.parse_id(user_id)
+                user = await user_manager.get(parsed_id)
+            except (exceptions.UserNotExists, exceptions.InvalidID):
+                return None
+            bind_log_context(user_id=str(user.id))
+            return user
 
     async def write_token(self, user: User) -> str:
         """Write a token to the response."""
-        data = {"id": str(user.id), "aud": self.token_audience, "role": user.role}
-        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+        with AUTH_OPERATION_LATENCY.labels("write_token").time():
+            data = {"id": str(user.id), "aud": self.token_audience, "role": user.role}
+            return generate_jwt(
+                data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm
+            )
 
     async def destroy_token(self, token: str, user: User) -> None:
         """Destroy a token from the response."""
@@ -0,0 +1,148 @@
+"""Structured logging module.
+
+Records are handed to a queue on the calling thread, with the context of the request they
+belong to, and formatted as JSON lines and written by a listener thread, so a slow stdout never
+blocks the event loop. ``LOG_LEVEL`` sets the level, ``LOG_FORMAT=text`` switches to plain lines
+for local development and ``ACCESS_LOG_SAMPLE_RATE`` keeps only a fraction of the successful
+access log lines. Like the tracing, it is configured from the environment by the application
+factory, so that merely importing the module leaves the logging of a process alone.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_ID_HEADER = "x-request-id"
+ACCESS_LOGGER_NAME = "authenticity_product.access"
+# attributes of every LogRecord, anything else was given in extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message"}
+
+log_context: ContextVar[dict[str, Any] | None] = ContextVar("log_context", default=None)
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Add fields to the log context of the current request."""
+    if (context := log_context.get()) is not None:
+        context.update(fields)
+
+
+class ContextQueueHandler(QueueHandler):
+    """Queue handler attaching the request context, the formatting is left to the listener."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Interpolate the message and copy the context of the request into the record."""
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if (context := log_context.get()) is not None:
+            for key, value in context.items():
+                if key == "scope":
+                    if (route := value.get("route")) is not None:
+                        record.__dict__.setdefault("route", route.path)
+                else:
+                    record.__dict__.setdefault(key, value)
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatter writing a record as a single JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record with its extra fields."""
+        document = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        document.update(
+            (key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Filter keeping a fraction of the successful access log records."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Keep the record if it is an error, or picked by the sampling."""
+        if record.levelno >= logging.WARNING or getattr(record, "status", 0) >= 500:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class LogContextMiddleware:
+    """ASGI middleware giving each request a log context.
+
+    The request id comes from the ``X-Request-ID`` header of the gateway, or is generated, and
+    is returned in the response.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Run the request with its log context."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        token = log_context.set({"request_id": request_id, "scope": scope})
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            log_context.reset(token)
+
+
+listener: QueueListener | None = None
+
+
+def configure_logging() -> None:
+    """Send the records of the root logger through a queue to a JSON stdout handler, once."""
+    global listener  # pylint: disable=global-statement
+    if listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+        )
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(ContextQueueHandler(log_queue))  # type: ignore[arg-type]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logging.getLogger(ACCESS_LOGGER_NAME).addFilter(
+        SamplingFilter(float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1")))
+    )
+
@@ -0,0 +1,147 @@
+"""Distributed tracing module.
+
+Spans are exported when ``TRACING_EXPORTER`` is ``otlp`` (to the collector given by the
+standard ``OTEL_EXPORTER_OTLP_TRACES_ENDPOINT`` variable, a local collector by default) or
+``file`` (one JSON span per line in ``TRACING_FILE_PATH``). Otherwise the tracer does not record
+anything. The tracer provider is installed by the application factory, so that merely importing
+this module leaves the tracing of a process alone.
+"""
+import os
+from typing import Any
+
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExceptionContext, ExecutionContext
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+tracer = trace.get_tracer("authenticity_product")
+
+
+def format_span(span: ReadableSpan) -> str:
+    """Format a span as a single JSON line."""
+    return span.to_json(indent=None) + os.linesep
+
+
+def get_span_exporter(exporter: str) -> SpanExporter | None:
+    """Return the span exporter selected by its name."""
+    if exporter == "otlp":
+        # protobuf is slow to import, it is only loaded when a collector is used
+        # pylint: disable-next=import-outside-toplevel
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter()
+    if exporter == "file":
+        out = open(  # pylint: disable=consider-using-with
+            os.getenv("TRACING_FILE_PATH", "spans.jsonl"), "a", encoding="utf-8"
+        )
+        return ConsoleSpanExporter(out=out, formatter=format_span)
+    return None
+
+
+def configure_tracing() -> None:
+    """Install the tracer provider selected by the environment, once."""
+    if isinstance(trace.get_tracer_provider(), TracerProvider):
+        return
+    if (exporter := get_span_exporter(os.getenv("TRACING_EXPORTER", "none"))) is None:
+        return
+    provider = TracerProvider(
+        resource=Resource.create(
+            {"service.name": os.getenv("APPLICATION_NAME", "authenticity-product")}
+        )
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+
+class TracingMiddleware:
+    """ASGI middleware creating the server span of every HTTP request.
+
+    The W3C trace context sent by the upstream gateways is extracted from the headers, so the
+    spans of this service are attached to the trace of the caller.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Run the request inside a server span."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = propagate.extract(dict(Headers(scope=scope)))
+        with tracer.start_as_current_span(
+            f'{scope["method"]} {scope["path"]}',
+            context=context,
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+        ) as span:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                if (route := scope.get("route")) is not None:
+                    span.set_attribute("http.route", route.path)
+                    span.update_name(f'{scope["method"]} {route.path}')
+
+
+def before_cursor_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: ExecutionContext | None,
+    executemany: bool,
+) -> None:
+    """Start the span of a statement."""
+    span = tracer.start_span(
+        statement.split(None, 1)[0].upper() if statement else "SQL",
+        kind=SpanKind.CLIENT,
+        attributes={"db.system": "postgresql", "db.statement": statement},
+    )
+    conn.info.setdefault("tracing_spans", []).append(span)
+
+
+def after_cursor_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: ExecutionContext | None,
+    executemany: bool,
+) -> None:
+    """End the span of a statement."""
+    if spans := conn.info.get("tracing_spans"):
+        spans.pop().end()
+
+
+def handle_error(context: ExceptionContext) -> None:
+    """End the span of a failed statement."""
+    if context.connection is None:
+        return
+    if spans := context.connection.info.get("tracing_spans"):
+        span: Span = spans.pop()
+        span.record_exception(context.original_exception)
+        span.set_status(Status(StatusCode.ERROR))
+        span.end()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Create a span for each statement executed by an engine."""
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
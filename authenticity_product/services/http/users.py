@@ -1,22 +1,66 @@
 """Module contains the user service for the FastAPI application."""
+import logging
 import uuid
 from collections.abc import AsyncGenerator
+from datetime import datetime
+from typing import Any
 
-from fastapi import Depends, Request
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_users import BaseUserManager, exceptions, FastAPIUsers, UUIDIDMixin
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.password import PasswordHelper
 from sqlalchemy.future import select
 from authenticity_product.models import User
 from authenticity_product.schemas import UserEmailOrPhone
+from authenticity_product.services.http.cache import principal_cache, token_cache
 from authenticity_product.services.http.config import settings
 from authenticity_product.services.http.db_async import get_user_db_async
+from authenticity_product.services.http.login_audit import (
+    INACTIVE_USER,
+    INVALID_PASSWORD,
+    record_login,
+    UNKNOWN_USER,
+)
+from authenticity_product.services.http.metrics import AUTH_OPERATION_LATENCY
+from authenticity_product.services.http.outbox import (
+    create_message,
+    USER_FORGOT_PASSWORD,
+    USER_REQUEST_VERIFY,
+)
 from authenticity_product.services.http.strategy import JWTStrategy
+from authenticity_product.services.http.tracing import tracer
 
 
+logger = logging.getLogger(__name__)
+
 SECRET = "SECRET"
 
 
+class TimedPasswordHelper(PasswordHelper):  # type: ignore
+    """Password helper observing the latency of hashing and verification."""
+
+    def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify a password against its hash, and return an updated hash if needed."""
+        with AUTH_OPERATION_LATENCY.labels("password_verify").time(), tracer.start_as_current_span(
+            "UserManager.password_verify"
+        ):
+            return super().verify_and_update(plain_password, hashed_password)  # type: ignore
+
+    def hash(self, password: str) -> str:
+        """Hash a password."""
+        with AUTH_OPERATION_LATENCY.labels("password_hash").time(), tracer.start_as_current_span(
+            "UserManager.password_hash"
+        ):
+            return super().hash(password)  # type: ignore
+
+
+password_helper = TimedPasswordHelper()
+
+
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     """User manager."""
 
@@ -25,19 +69,124 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
 
     async def on_after_register(self, user: User, request: Request | None = None) -> None:
         """After register."""
-        print(f"User {user.id} has registered.")
+        logger.info(
+            f"User {user.id} has registered", extra={"event": "user.registered", "user_id": user.id}
+        )
+
+    async def on_after_update(
+        self, user: User, update_dict: dict[str, Any], request: Request | None = None
+    ) -> None:
+        """After update, drop the stale principal from the cache."""
+        principal_cache.invalidate(user.id)
+        logger.info(
+            f"User {user.id} has been updated",
+            extra={"event": "user.updated", "user_id": user.id, "fields": sorted(update_dict)},
+        )
+
+    async def on_after_delete(self, user: User, request: Request | None = None) -> None:
+        """After delete, drop the principal from the cache."""
+        principal_cache.invalidate(user.id)
+        logger.info(
+            f"User {user.id} has been deleted", extra={"event": "user.deleted", "user_id": user.id}
+        )
 
     async def on_after_forgot_password(
         self, user: User, token: str, request: Request | None = None
     ) -> None:
-        """After forgot password."""
-        print(f"User {user.id} has forgot their password. Reset token: {token}")
+        """After forgot password, queue the reset token for delivery."""
+        await self.enqueue(USER_FORGOT_PASSWORD, user, token)
+        logger.info(
+            f"User {user.id} has forgot their password",
+            extra={"event": "user.forgot_password", "user_id": user.id},
+        )
 
     async def on_after_request_verify(
         self, user: User, token: str, request: Request | None = None
     ) -> None:
-        """After request verify function, send verification email."""
-        print(f"Verification requested for user {user.id}. Verification token: {token}")
+        """After request verify function, queue the verification email."""
+        await self.enqueue(USER_REQUEST_VERIFY, user, token)
+        logger.info(
+            f"Verification requested for user {user.id}",
+            extra={"event": "user.request_verify", "user_id": user.id},
+        )
+
+    async def enqueue(self, event: str, user: User, token: str) -> None:
+        """Write a message carrying a token of a user to the outbox."""
+        session = self.user_db.session  # type: ignore[attr-defined]
+        session.add(
+            create_message(
+                event,
+                {"user_id": str(user.id), "email": user.email, "phone": user.phone, "token": token},
+            )
+        )
+        await session.commit()
+
+    async def on_after_verify(self, user: User, request: Request | None = None) -> None:
+        """After verify, drop the stale principal from the cache."""
+        principal_cache.invalidate(user.id)
+        logger.info(
+            f"User {user.id} has been verified",
+            extra={"event": "user.verified", "user_id": user.id},
+        )
+
+    async def on_after_reset_password(self, user: User, request: Request | None = None) -> None:
+        """After reset password, drop the stale principal from the cache."""
+        principal_cache.invalidate(user.id)
+        logger.info(
+            f"User {user.id} has reset their password",
+            extra={"event": "user.reset_password", "user_id": user.id},
+        )
+
+    async def on_after_login(
+        self, user: User, request: Request | None = None, response: Response | None = None
+    ) -> None:
+        """After login, record the first one of a user."""
+        logger.info(
+            f"User {user.id} has logged in", extra={"event": "user.login", "user_id": user.id}
+        )
+        if user.first_login_at is None:
+            await self.user_db.update(user, {"first_login_at": datetime.now()})
+
+    async def authenticate(self, credentials: OAuth2PasswordRequestForm) -> User | None:
+        """Authenticate a user by email or phone and password, recording the attempt.
+
+        :param credentials: The user credentials.
+        :return: The user, unless the credentials are wrong.
+        """
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # hash anyway, so that the unknown users answer as late as the others
+            self.password_helper.hash(credentials.password)
+            record_login(credentials.username, None, False, UNKNOWN_USER)
+            return None
+        verified, updated_password_hash = self.password_helper.verify_and_update(
+            credentials.password, user.hashed_password
+        )
+        if not verified:
+            record_login(credentials.username, user, False, INVALID_PASSWORD)
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        # the login router rejects the inactive users it is given
+        if user.is_active:
+            record_login(credentials.username, user, True)
+        else:
+            record_login(credentials.username, user, False, INACTIVE_USER)
+        return user
+
+    async def get(self, id: uuid.UUID) -> User:  # pylint: disable=redefined-builtin
+        """Get a user by id, served from the principal cache when possible.
+
+        :param id: Id. of the user to retrieve.
+        :raises UserNotExists: The user does not exist.
+        :return: A user.
+        """
+        if (user := principal_cache.get(id)) is not None:
+            return user
+        user = await super().get(id)
+        principal_cache.set(user)
+        return user
 
     async def get_by_email_and_phone(self, user_email_or_phone: UserEmailOrPhone) -> User:
         """Retrieve a user by email or phone number.
@@ -51,15 +200,16 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         Raises:
             exceptions.UserNotExists: If no user is found with the given email or phone.
         """
-        if user_email_or_phone.is_email():
-            user = await self.user_db.get_by_email(user_email_or_phone)  # Fixed parameter
+        with AUTH_OPERATION_LATENCY.labels("get_by_email_and_phone").time():
+            if user_email_or_phone.is_email():
+                user = await self.user_db.get_by_email(user_email_or_phone)  # Fixed parameter
 
-        if user_email_or_phone.is_phone():
-            statement = select(User).where(User.phone == user_email_or_phone)  # Fixed parameter
-            user = await self.user_db._get_user(statement)  # type: ignore
+            if user_email_or_phone.is_phone():
+                statement = select(User).where(User.phone == user_email_or_phone)  # Fixed parameter
+                user = await self.user_db._get_user(statement)  # type: ignore
 
-        if user is None:
-            raise exceptions.UserNotExists()
+            if user is None:
+                raise exceptions.UserNotExists()
 
         return user
 
@@ -78,7 +228,7 @@ async def get_user_manager(
     user_db: SQLAlchemyUserDatabase[User, uuid.UUID] = Depends(get_user_db_async),
 ) -> AsyncGenerator[UserManager, None]:
     """Async generator to get the user manager."""
-    yield UserManager(user_db)
+    yield UserManager(user_db, password_helper)
 
 
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
@@ -92,6 +242,7 @@ def get_jwt_strategy() -> JWTStrategy:
         secret=settings.private_key,
         public_key=settings.public_key,
         lifetime_seconds=settings.token_expiration_in_seconds,
+        token_cache=token_cache,
     )
 
 
@@ -104,3 +255,10 @@ auth_backend = AuthenticationBackend(
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
 current_active_user = fastapi_users.current_user(active=True)
+
+
+async def current_admin_user(user: User = Depends(current_active_user)) -> User:
+    """Return the user of the request, if an admin."""
+    if user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return user
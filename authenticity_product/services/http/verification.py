@@ -0,0 +1,371 @@
+"""Serial code verification module.
+
+A scan looks the code up in a cache first, which also remembers unknown codes for a shorter
+time, so that bursts of scans of a popular or of a forged code do not reach the database. The
+cache holds the serialized response, so a hit costs neither a query nor a serialization, and
+concurrent misses of a code share a single query. Codes missing from the Bloom filter of the
+issued codes are unknown without a lookup, see ``code_filter``. Longer codes are signed codes, see
+``signed_codes``.
+
+Batches of codes, such as the pallets checked by a warehouse, are looked up by chunks with a
+single ``= ANY`` query for the codes of a chunk missing from the cache, and the result of each
+code is streamed as a line of NDJSON once its chunk is resolved.
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import re
+import secrets
+from collections.abc import AsyncIterator
+from typing import Any
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import any_, ARRAY, bindparam, select, String
+from authenticity_product.models import Product, SerialCode, User
+from authenticity_product.serial_codes import CODE_LENGTH
+from authenticity_product.services.http.cache import CacheBackend, get_backend
+from authenticity_product.services.http.circuit_breaker import CONNECTION_ERRORS
+from authenticity_product.services.http.code_filter import code_filter
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.metrics import (
+    CODE_FILTER_FALSE_POSITIVES,
+    VERIFICATION_LOOKUPS,
+)
+from authenticity_product.services.http.scan_events import record_scan
+from authenticity_product.services.http.signed_codes import (
+    get_code_signer,
+    get_code_verifier,
+    revocation_list,
+)
+from authenticity_product.services.http.users import current_active_user
+from authenticity_product.verifier import CODE_ALPHABET, FROM_BASE32, InvalidCode, SignedCode
+
+
+code_pattern = re.compile(f"[{CODE_ALPHABET}]{{{CODE_LENGTH}}}")
+LOOKUP_STATEMENT = (
+    select(Product.id, Product.name, Product.brand)
+    .join(SerialCode, SerialCode.product_id == Product.id)
+    .where(SerialCode.code == bindparam("code"))
+)
+BATCH_LOOKUP_STATEMENT = (
+    select(SerialCode.code, Product.id, Product.name, Product.brand)
+    .join(Product, SerialCode.product_id == Product.id)
+    .where(SerialCode.code == any_(bindparam("codes", type_=ARRAY(String))))
+)
+NOT_FOUND = b'{"detail":"Unknown code"}'
+REVOKED = b'{"detail":"Revoked code"}'
+# room for the longest signed code in a line of NDJSON, the largest body of a batch per code
+BATCH_BYTES_PER_CODE = 512
+
+
+def generate_code() -> str:
+    """Return a random code, 80 bits long."""
+    return (
+        base64.b32encode(secrets.token_bytes(CODE_LENGTH * 5 // 8)).decode().translate(FROM_BASE32)
+    )
+
+
+# the product id of an authentic code, with its response
+Verified = tuple[int, bytes]
+
+
+def from_entry(entry: Any) -> Verified | None:
+    """Return the product of a cached code, None if unknown.
+
+    The shared cache reads the tuples back as lists.
+    """
+    if not entry:
+        return None
+    product_id, body = entry
+    return product_id, body
+
+
+def serialize(code: str, product_id: int, name: str, brand: str | None) -> bytes:
+    """Return the response of an authentic code."""
+    return json.dumps(
+        {
+            "code": code,
+            "authentic": True,
+            "product": {"id": product_id, "name": name, "brand": brand},
+        },
+        separators=(",", ":"),
+    ).encode()
+
+
+def normalize_code(code: str) -> str:
+    """Return a code as stored, whatever its case and separators when typed by hand."""
+    return code.replace("-", "").replace(" ", "").upper()
+
+
+class CodeVerifier:
+    """Lookup of the product of a code, through a cache of the responses.
+
+    An authentic code is cached with the id of its product next to its response, so that a hit
+    needs no deserialization, and an unknown code as an empty response.
+    """
+
+    def __init__(self, cache: CacheBackend, negative_ttl_in_seconds: float):
+        self.cache = cache
+        self.negative_ttl_in_seconds = negative_ttl_in_seconds
+        self._pending: dict[str, asyncio.Task[Verified | None]] = {}
+
+    async def verify(self, code: str) -> Verified | None:
+        """Return the product id and serialized product of a code, or None if it is unknown."""
+        # checked before the cache, so that forged codes do not evict the cached ones
+        if not code_filter.might_contain(code):
+            VERIFICATION_LOOKUPS.labels("filter", "unknown").inc()
+            return None
+        if (entry := self.cache.get(code)) is not None:
+            VERIFICATION_LOOKUPS.labels("cache", "found" if entry else "unknown").inc()
+            return from_entry(entry)
+        if (task := self._pending.get(code)) is None:
+            task = self._pending[code] = asyncio.create_task(self.lookup(code))
+            task.add_done_callback(lambda _: self._pending.pop(code, None))
+        # a cancelled request must not cancel the lookup the others wait for
+        return await asyncio.shield(task)
+
+    async def lookup(self, code: str) -> Verified | None:
+        """Query the product of a code and cache the response."""
+        settings.circuit_breaker.check()
+        try:
+            async with async_session_maker() as session:
+                row = (await session.execute(LOOKUP_STATEMENT, {"code": code})).first()
+        except CONNECTION_ERRORS as error:
+            settings.circuit_breaker.record_error(error)
+            raise
+        if row is None:
+            VERIFICATION_LOOKUPS.labels("database", "unknown").inc()
+            if code_filter.bloom is not None:
+                CODE_FILTER_FALSE_POSITIVES.inc()
+            self.cache.set(code, b"", self.negative_ttl_in_seconds)
+            return None
+        VERIFICATION_LOOKUPS.labels("database", "found").inc()
+        verified = row.id, serialize(code, row.id, row.name, row.brand)
+        self.cache.set(code, verified)
+        return verified
+
+    async def verify_many(self, codes: list[str]) -> dict[str, Verified | None]:
+        """Return the product id and serialized product of each code, None for the unknown ones.
+
+        The codes missing from the cache are looked up with a single query.
+        """
+        entries: dict[str, Any] = dict.fromkeys(codes, b"")
+        candidates = [code for code in codes if code_filter.might_contain(code)]
+        VERIFICATION_LOOKUPS.labels("filter", "unknown").inc(len(codes) - len(candidates))
+        entries.update((code, self.cache.get(code)) for code in candidates)
+        VERIFICATION_LOOKUPS.labels("cache", "found").inc(
+            sum(bool(entries[code]) for code in candidates)
+        )
+        VERIFICATION_LOOKUPS.labels("cache", "unknown").inc(
+            sum(entries[code] == b"" for code in candidates)
+        )
+        if not (misses := [code for code, entry in entries.items() if entry is None]):
+            return {code: from_entry(entry) for code, entry in entries.items()}
+        settings.circuit_breaker.check()
+        try:
+            async with async_session_maker() as session:
+                rows = (await session.execute(BATCH_LOOKUP_STATEMENT, {"codes": misses})).all()
+        except CONNECTION_ERRORS as error:
+            settings.circuit_breaker.record_error(error)
+            raise
+        for row in rows:
+            entries[row.code] = verified = row.id, serialize(row.code, row.id, row.name, row.brand)
+            self.cache.set(row.code, verified)
+        VERIFICATION_LOOKUPS.labels("database", "found").inc(len(rows))
+        VERIFICATION_LOOKUPS.labels("database", "unknown").inc(len(misses) - len(rows))
+        if code_filter.bloom is not None:
+            CODE_FILTER_FALSE_POSITIVES.inc(len(misses) - len(rows))
+        for code in misses:
+            if entries[code] is None:
+                self.cache.set(code, b"", self.negative_ttl_in_seconds)
+        return {code: from_entry(entry) for code, entry in entries.items()}
+
+    def invalidate(self, code: str) -> None:
+        """Drop a code from the cache, once it was created or changed."""
+        self.cache.delete(code)
+
+
+code_verifier = CodeVerifier(
+    get_backend(
+        "verification",
+        settings.verification_cache_max_size,
+        settings.verification_cache_ttl_in_seconds,
+        slot_size=512,
+    ),
+    settings.verification_negative_ttl_in_seconds,
+)
+
+
+def get_verify_router() -> APIRouter:
+    """Return the public route verifying a code."""
+    router = APIRouter()
+
+    @router.get("/keys")
+    async def keys() -> dict[str, list[dict[str, Any]]]:
+        """Return the public keys verifying the signed codes offline."""
+        signer = get_code_signer()
+        return {"keys": [{"kid": signer.key_id, "pem": signer.public_pem()}]}
+
+    @router.post("/batch")
+    async def verify_batch(
+        request: Request, user: User = Depends(current_active_user)
+    ) -> StreamingResponse:
+        """Tell whether each code of a batch is authentic, as a line of NDJSON per code.
+
+        The codes are sent as a JSON list, or an object with a "codes" list, or as NDJSON, a
+        code or an object with a "code" per line.
+        """
+        limit = settings.batch_verify_limits.get(
+            user.role, settings.batch_verify_limits.get("user", 0)
+        )
+        codes = [normalize_code(code) for code in await read_codes(request, limit)]
+        return StreamingResponse(
+            stream_results(request, codes, settings.batch_verify_chunk_size),
+            media_type="application/x-ndjson",
+        )
+
+    @router.get("/{code}")
+    async def verify(
+        request: Request, code: str, lat: float | None = None, lon: float | None = None
+    ) -> Response:
+        """Tell whether a code is authentic, and of which product."""
+        code = normalize_code(code)
+        key = None
+        if len(code) > CODE_LENGTH:
+            result, content, response = await verify_signed(code)
+            product_id = None if content is None else content.product_id
+            key = None if content is None else activity_key(content)
+        elif code_pattern.fullmatch(code) and (verified := await code_verifier.verify(code)):
+            result = "authentic"
+            product_id, body = verified
+            response = Response(body, media_type="application/json")
+        else:
+            result, product_id = "unknown", None
+            response = Response(NOT_FOUND, status.HTTP_404_NOT_FOUND, media_type="application/json")
+        record_scan(request, code, product_id, result, lat, lon, key)
+        return response
+
+    return router
+
+
+def activity_key(content: SignedCode) -> str:
+    """Return the key of the scans of a signed code, whichever signature of it is scanned."""
+    return f"{content.product_id}:{content.serial}"
+
+
+async def verify_signed(code: str) -> tuple[str, SignedCode | None, Response]:
+    """Tell whether a signed code is authentic, the database only being asked for revocations.
+
+    Return the outcome and the content of the code with the response.
+    """
+    try:
+        signed = get_code_verifier().verify(code)
+    except InvalidCode:
+        VERIFICATION_LOOKUPS.labels("signature", "invalid").inc()
+        response = Response(NOT_FOUND, status.HTTP_404_NOT_FOUND, media_type="application/json")
+        return "invalid", None, response
+    if await revocation_list.is_revoked(signed):
+        response = Response(REVOKED, status.HTTP_410_GONE, media_type="application/json")
+        return "revoked", signed, response
+    body = json.dumps(
+        {"authentic": True, "product": {"id": signed.product_id}, "serial": signed.serial},
+        separators=(",", ":"),
+    ).encode()
+    return "authentic", signed, Response(body, media_type="application/json")
+
+
+def parse_code(line: bytes) -> Any:
+    """Return the code of a line of NDJSON, a JSON string or object, or the bare code."""
+    if line.startswith((b"{", b'"')):
+        document = json.loads(line)
+        return document.get("code") if isinstance(document, dict) else document
+    return line.decode()
+
+
+def too_large(limit: int) -> HTTPException:
+    """Return the error answering a batch above the limit of the user."""
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {limit} codes per batch",
+    )
+
+
+async def read_codes(request: Request, limit: int) -> list[str]:
+    """Return the codes of a batch verification, or answer with a 413 or a 422.
+
+    The body is bounded by the size of the largest batch allowed before it is parsed.
+    """
+    max_size = limit * BATCH_BYTES_PER_CODE
+    if int(request.headers.get("content-length") or 0) > max_size:
+        raise too_large(limit)
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_size:
+            raise too_large(limit)
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            codes = [parse_code(line.strip()) for line in body.splitlines() if line.strip()]
+        else:
+            document = json.loads(body)
+            codes = document.get("codes") if isinstance(document, dict) else document
+    except ValueError as error:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Malformed batch") from error
+    if not isinstance(codes, list) or not all(isinstance(code, str) for code in codes):
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_ENTITY, "Expected a list of codes")
+    if len(codes) > limit:
+        raise too_large(limit)
+    return codes
+
+
+def dump_line(document: dict[str, Any]) -> bytes:
+    """Return a line of NDJSON."""
+    return json.dumps(document, separators=(",", ":")).encode() + b"\n"
+
+
+async def resolve_chunk(request: Request, codes: list[str]) -> bytes:
+    """Return the NDJSON results of a chunk of codes, recording their scans."""
+    serials = [code for code in codes if len(code) == CODE_LENGTH and code_pattern.fullmatch(code)]
+    verified = await code_verifier.verify_many(serials) if serials else {}
+    contents: dict[str, SignedCode] = {}
+    for code in codes:
+        if len(code) > CODE_LENGTH:
+            with contextlib.suppress(InvalidCode):
+                contents[code] = get_code_verifier().verify(code)
+    revoked = await revocation_list.revoked_among(list(contents.values())) if contents else set()
+    lines = []
+    for code in codes:
+        if found := verified.get(code):
+            product_id, body = found
+            lines.append(body + b"\n")
+            record_scan(request, code, product_id, "authentic")
+        elif (content := contents.get(code)) is None:
+            lines.append(dump_line({"code": code, "authentic": False}))
+            record_scan(request, code, None, "invalid" if len(code) > CODE_LENGTH else "unknown")
+        elif (content.product_id, content.serial) in revoked:
+            lines.append(dump_line({"code": code, "authentic": False, "revoked": True}))
+            record_scan(request, code, content.product_id, "revoked", key=activity_key(content))
+        else:
+            lines.append(
+                dump_line(
+                    {
+                        "code": code,
+                        "authentic": True,
+                        "product": {"id": content.product_id},
+                        "serial": content.serial,
+                    }
+                )
+            )
+            record_scan(request, code, content.product_id, "authentic", key=activity_key(content))
+    return b"".join(lines)
+
+
+async def stream_results(
+    request: Request, codes: list[str], chunk_size: int
+) -> AsyncIterator[bytes]:
+    """Yield the NDJSON results of the codes of a batch, chunk by chunk."""
+    for start in range(0, len(codes), chunk_size):
+        yield await resolve_chunk(request, codes[start : start + chunk_size])
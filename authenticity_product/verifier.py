@@ -0,0 +1,153 @@
+"""Offline verifier of signed product codes.
+
+A signed code carries a product id and a serial with the signature of the issuer, encoded in
+the Crockford base32 alphabet, which a QR code stores in its compact alphanumeric mode. Its
+authenticity is checked against the public keys of the issuer alone, so that this module, which
+only depends on ``cryptography``, can be handed to retailers and run without any network. Only
+the revocation of a code needs the service.
+
+Usage: python -m authenticity_product.verifier --key issuer.pem CODE [CODE ...]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import struct
+import sys
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+
+
+PrivateKey = ed25519.Ed25519PrivateKey | ec.EllipticCurvePrivateKey | rsa.RSAPrivateKey
+PublicKey = ed25519.Ed25519PublicKey | ec.EllipticCurvePublicKey | rsa.RSAPublicKey
+
+# Crockford base32, without the letters mistaken for digits
+CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+TO_BASE32 = str.maketrans(CODE_ALPHABET, "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567")
+FROM_BASE32 = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", CODE_ALPHABET)
+# algorithm, key id, product id and serial
+HEADER = struct.Struct(">BHIQ")
+ED25519, ES256, RS256 = 1, 2, 3
+
+
+class InvalidCode(ValueError):
+    """The code is malformed, or not signed by a known key."""
+
+
+@dataclass(frozen=True)
+class SignedCode:
+    """Content of an authentic signed code."""
+
+    product_id: int
+    serial: int
+    key_id: int
+
+
+def get_algorithm(key: PrivateKey | PublicKey) -> int:
+    """Return the signature algorithm of a key."""
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return ED25519
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return ES256
+    return RS256
+
+
+def get_key_id(public_key: PublicKey) -> int:
+    """Return the id of a public key, the first bytes of the hash of its encoding."""
+    encoded = public_key.public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return int.from_bytes(hashlib.sha256(encoded).digest()[:2], "big")
+
+
+def encode(data: bytes) -> str:
+    """Return the code of bytes, in the Crockford alphabet and without padding."""
+    return base64.b32encode(data).decode().rstrip("=").translate(FROM_BASE32)
+
+
+def decode(code: str) -> bytes:
+    """Return the bytes of a code, whatever its case and separators when typed by hand.
+
+    Only the spelling the bytes encode to is accepted, rather than letters outside the alphabet
+    or other unused bits in the last character, so that a code cannot be printed many ways.
+    """
+    code = code.replace("-", "").replace(" ", "").upper()
+    base32 = code.translate(TO_BASE32)
+    try:
+        data = base64.b32decode(base32 + "=" * (-len(base32) % 8))
+    except ValueError as error:
+        raise InvalidCode("Malformed code") from error
+    if encode(data) != code:
+        raise InvalidCode("Malformed code")
+    return data
+
+
+class Verifier:
+    """Verification of signed codes against the public keys of the issuer."""
+
+    def __init__(self, public_keys: Iterable[PublicKey]):
+        self.public_keys = {get_key_id(key): key for key in public_keys}
+
+    @classmethod
+    def from_pem(cls, *pems: bytes) -> "Verifier":
+        """Return a verifier of the public keys encoded in PEM."""
+        keys = [serialization.load_pem_public_key(pem) for pem in pems]
+        return cls(key for key in keys if isinstance(key, PublicKey))  # type: ignore[arg-type]
+
+    def verify(self, code: str) -> SignedCode:
+        """Return the content of a code, or raise InvalidCode if it is not authentic."""
+        data = decode(code)
+        if len(data) <= HEADER.size:
+            raise InvalidCode("Malformed code")
+        algorithm, key_id, product_id, serial = HEADER.unpack_from(data)
+        key = self.public_keys.get(key_id)
+        if key is None or get_algorithm(key) != algorithm:
+            raise InvalidCode("Unknown key")
+        payload, signature = data[: HEADER.size], data[HEADER.size :]
+        try:
+            if isinstance(key, ed25519.Ed25519PublicKey):
+                key.verify(signature, payload)
+            elif isinstance(key, ec.EllipticCurvePublicKey):
+                if len(signature) != 64:
+                    raise InvalidSignature
+                der = encode_dss_signature(
+                    int.from_bytes(signature[:32], "big"), int.from_bytes(signature[32:], "big")
+                )
+                key.verify(der, payload, ec.ECDSA(hashes.SHA256()))
+            else:
+                key.verify(signature, payload, padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature as error:
+            raise InvalidCode("Invalid signature") from error
+        return SignedCode(product_id, serial, key_id)
+
+
+def main(arguments: list[str] | None = None) -> int:
+    """Print the content of each code, and return 1 if any is not authentic."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--key", action="append", required=True, help="public key of the issuer, in PEM"
+    )
+    parser.add_argument("codes", nargs="+")
+    parsed = parser.parse_args(arguments)
+    keys = []
+    for path in parsed.key:
+        with open(path, "rb") as file:
+            keys.append(file.read())
+    verifier = Verifier.from_pem(*keys)
+    status = 0
+    for code in parsed.codes:
+        try:
+            print(json.dumps({"authentic": True, **asdict(verifier.verify(code))}))
+        except InvalidCode as error:
+            print(json.dumps({"authentic": False, "detail": str(error)}))
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Load test the auth service, in-process or through a local uvicorn.
+
+Each scenario sends a number of requests at a fixed concurrency to an application whose
+database was seeded by ``benchmarks.seed_users``, and reports its throughput, latency
+percentiles and status codes as JSON, for comparison between revisions. Token verification
+runs the JWT strategy in-process whatever the target.
+
+Usage: python -m benchmarks.auth_service --users 1000000 [--target uvicorn] [--concurrency 32]
+       [--requests 2000] [--scenarios login_email,users_me] [--create [--database bench_auth]]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Any
+
+import httpx
+from benchmarks.seed_users import (
+    create_database,
+    disposable_database,
+    drop_database,
+    email,
+    PASSWORD,
+    phone,
+    seed,
+)
+
+
+SCENARIOS = (
+    "register",
+    "login_email",
+    "login_phone",
+    "users_me",
+    "admin_list",
+    "admin_search",
+    "verify_token",
+)
+# the benchmark measures the service, not the admission limits of a single client
+os.environ.setdefault("ADMISSION_IP_CAPACITY", "1000000000")
+os.environ.setdefault("ADMISSION_IDENTIFIER_CAPACITY", "1000000000")
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    """Return a percentile of sorted latencies, in milliseconds."""
+    return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 2)
+
+
+@asynccontextmanager
+async def in_process_client() -> AsyncIterator[httpx.AsyncClient]:
+    """Yield a client calling the application in this process."""
+    # imported here, once the database of the benchmark is configured
+    # pylint: disable=import-outside-toplevel
+    from asgi_lifespan import LifespanManager
+    from authenticity_product.services.http.entrypoint import app
+
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(workers: int) -> AsyncIterator[httpx.AsyncClient]:
+    """Yield a client calling the application served by a local uvicorn."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "authenticity_product.services.http.entrypoint:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--no-access-log",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits
+        ) as client:
+            for _ in range(300):
+                try:
+                    if (await client.get("/readyz")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("uvicorn did not become ready")
+            yield client
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def login(client: httpx.AsyncClient, username: str) -> httpx.Response:
+    """Log a synthetic user in."""
+    return await client.post("/auth/jwt/login", data={"username": username, "password": PASSWORD})
+
+
+def get_scenarios(
+    users: int, token: str
+) -> dict[str, Callable[[httpx.AsyncClient], Awaitable[int]]]:
+    """Return the request of each scenario, as a function returning its status code."""
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def register(client: httpx.AsyncClient) -> int:
+        index = random.randrange(10**8)
+        response = await client.post(
+            "/auth/register",
+            json={
+                "email": f"register{index}-{random.randrange(10**9)}@bench.example",
+                "password": PASSWORD,
+                "first_name": "Bench",
+                "last_name": "Register",
+                "civility": "Mr",
+                "phone": f"06{index:08d}",
+                "role": "user",
+            },
+        )
+        return response.status_code
+
+    async def login_email(client: httpx.AsyncClient) -> int:
+        return (await login(client, email(random.randrange(users)))).status_code
+
+    async def login_phone(client: httpx.AsyncClient) -> int:
+        return (await login(client, phone(random.randrange(users)))).status_code
+
+    async def users_me(client: httpx.AsyncClient) -> int:
+        return (await client.get("/users/me", headers=headers)).status_code
+
+    async def admin_list(client: httpx.AsyncClient) -> int:
+        page = random.randrange(1, 50)
+        return (await client.get(f"/admin/user/list?page={page}")).status_code
+
+    async def admin_search(client: httpx.AsyncClient) -> int:
+        search = email(random.randrange(users))
+        return (await client.get(f"/admin/user/list?search={search}")).status_code
+
+    return {
+        "register": register,
+        "login_email": login_email,
+        "login_phone": login_phone,
+        "users_me": users_me,
+        "admin_list": admin_list,
+        "admin_search": admin_search,
+    }
+
+
+def get_verify_token(token: str) -> Callable[[httpx.AsyncClient], Awaitable[int]]:
+    """Return the token verification scenario, run on the strategy of this process."""
+    # pylint: disable=import-outside-toplevel
+    from fastapi_users.db import SQLAlchemyUserDatabase
+    from authenticity_product.models import User
+    from authenticity_product.services.http.db_async import async_session_maker
+    from authenticity_product.services.http.users import get_jwt_strategy, UserManager
+
+    strategy = get_jwt_strategy()
+
+    async def verify_token(client: httpx.AsyncClient) -> int:
+        async with async_session_maker() as session:
+            user_manager = UserManager(SQLAlchemyUserDatabase(session, User))
+            return 200 if await strategy.read_token(token, user_manager) is not None else 401
+
+    return verify_token
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    request: Callable[[httpx.AsyncClient], Awaitable[int]],
+    requests: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    """Send the requests of a scenario from concurrent clients."""
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                status = str(await request(client))
+            except httpx.TransportError as error:
+                status = type(error).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "throughput_per_second": round(requests / elapsed, 1),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "statuses": dict(statuses),
+    }
+
+
+async def main(arguments: argparse.Namespace) -> dict[str, Any]:
+    """Run the selected scenarios against the selected target."""
+    client_factory = (
+        uvicorn_client(arguments.workers) if arguments.target == "uvicorn" else in_process_client()
+    )
+    results: dict[str, Any] = {}
+    async with client_factory as client:
+        response = await login(client, email(0))
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        scenarios = get_scenarios(arguments.users, token)
+        scenarios["verify_token"] = get_verify_token(token)
+        for name in arguments.scenarios.split(","):
+            await run_scenario(
+                client, scenarios[name], arguments.concurrency, arguments.concurrency
+            )
+            results[name] = await run_scenario(
+                client, scenarios[name], arguments.requests, arguments.concurrency
+            )
+    return {
+        "target": arguments.target,
+        "users": arguments.users,
+        "concurrency": arguments.concurrency,
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=100_000, help="synthetic users seeded")
+    parser.add_argument("--database", help="the application one, or a new bench_* one to create")
+    parser.add_argument(
+        "--create", action="store_true", help="create, seed and finally drop the database"
+    )
+    parsed = parser.parse_args()
+    if parsed.create:
+        try:
+            parsed.database = disposable_database(parsed.database)
+        except ValueError as error:
+            parser.error(str(error))
+    parsed.database = parsed.database or os.environ["DB_NAME"]
+    os.environ["DB_NAME"] = parsed.database
+    if parsed.create:
+        create_database(parsed.database)
+        seed(parsed.database, parsed.users)
+    try:
+        print(json.dumps(asyncio.run(main(parsed)), indent=2))
+    finally:
+        if parsed.create:
+            drop_database(parsed.database)
@@ -0,0 +1,76 @@
+"""Measure the overhead of the Prometheus middleware per request.
+
+Usage: python -m benchmarks.metrics_middleware [--requests 100000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+from starlette.types import Message
+from authenticity_product.services.http.metrics import PrometheusMiddleware
+
+
+def build_app() -> FastAPI:
+    """Build a minimal application with a single templated route."""
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int) -> dict[str, int]:
+        return {"id": item_id}
+
+    return app
+
+
+async def drive(app: object, requests: int) -> float:
+    """Call an ASGI application directly and return the mean latency in microseconds."""
+    body_message: Message = {"type": "http.request", "body": b"", "more_body": False}
+
+    async def receive() -> Message:
+        return body_message
+
+    async def send(message: Message) -> None:
+        return None
+
+    start = time.perf_counter()
+    for i in range(requests):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/items/{i}",
+            "raw_path": f"/items/{i}".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [],
+            "server": ("bench", 80),
+            "client": ("127.0.0.1", 1234),
+        }
+        await app(scope, receive, send)  # type: ignore
+    return (time.perf_counter() - start) / requests * 1_000_000
+
+
+async def main(requests: int) -> dict[str, float]:
+    """Run the benchmark with and without the middleware."""
+    bare = build_app()
+    measured = PrometheusMiddleware(build_app())
+    await drive(bare, requests // 10)
+    await drive(measured, requests // 10)
+    bare_us = await drive(bare, requests)
+    measured_us = await drive(measured, requests)
+    return {
+        "requests": requests,
+        "bare_us_per_request": round(bare_us, 2),
+        "middleware_us_per_request": round(measured_us, 2),
+        "overhead_us_per_request": round(measured_us - bare_us, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100_000)
+    arguments = parser.parse_args()
+    print(json.dumps(asyncio.run(main(arguments.requests)), indent=2))
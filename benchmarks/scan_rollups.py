@@ -0,0 +1,147 @@
+"""Measure the scan dashboards on the rollups against grouping the raw scan events.
+
+A disposable database is loaded with synthetic scan events spread over the products, countries
+and the days of the last months, generated by the server into the monthly partitions. The
+rollup job then aggregates them from scratch, and the dashboard query of a product over a
+quarter is timed both on the rollups and as a GROUP BY over the events, for random products.
+
+Usage: python -m benchmarks.scan_rollups --events 200000000 [--database bench_rollups]
+       [--products 1000] [--months 12] [--queries 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from benchmarks.auth_service import percentile
+from benchmarks.seed_users import connect, create_database, drop_database
+
+
+COUNTRIES = 50
+RAW_STATEMENT = (
+    "SELECT scanned_at::date, coalesce(country, ''), count(*), "
+    "count(*) FILTER (WHERE result = 'authentic') FROM scan_event "
+    "WHERE product_id = %s AND scanned_at >= %s AND scanned_at < %s GROUP BY 1, 2 ORDER BY 1, 2"
+)
+ROLLUP_STATEMENT = (
+    "SELECT day, country, scans, authentic FROM scan_rollup "
+    "WHERE product_id = %s AND day >= %s AND day < %s ORDER BY day, country"
+)
+
+
+def load_events(
+    database: str, events: int, products: int, months: int, batch_size: int = 10_000_000
+) -> dict[str, Any]:
+    """Generate scan events into the monthly partitions, and return the load statistics."""
+    # pylint: disable=import-outside-toplevel
+    from authenticity_product.services.http.partitions import month_start, next_month
+
+    first = month_start(datetime.now() - timedelta(days=31 * (months - 1)))
+    connection = connect(database)
+    began = time.perf_counter()
+    with connection, connection.cursor() as cursor:
+        month = first
+        for _ in range(months):
+            cursor.execute(
+                f'CREATE TABLE "scan_event_p{month:%Y%m}" PARTITION OF scan_event '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+            )
+            month = next_month(month)
+        seconds = int((datetime.now() - first).total_seconds())
+        for start in range(0, events, batch_size):
+            cursor.execute(
+                "INSERT INTO scan_event (scanned_at, code, product_id, result, country) "
+                "SELECT %s::timestamp + random() * %s * interval '1 second', 'BENCHMARK', "
+                "1 + (random() * (%s - 1))::int, "
+                "CASE WHEN random() < 0.95 THEN 'authentic' ELSE 'revoked' END, "
+                "'C' || (random() * %s)::int FROM generate_series(1, %s)",
+                (first, seconds, products, COUNTRIES, min(batch_size, events - start)),
+            )
+            connection.commit()
+        loaded = time.perf_counter()
+        cursor.execute("ANALYZE scan_event")
+        cursor.execute(
+            "SELECT sum(pg_total_relation_size(relid)) FROM pg_partition_tree('scan_event')"
+        )
+        (size,) = cursor.fetchone()
+    connection.close()
+    return {
+        "events": events,
+        "rows_per_second": round(events / (loaded - began)),
+        "events_mb": round(size / 2**20),
+    }
+
+
+async def aggregate(batch_size: int) -> dict[str, Any]:
+    """Aggregate every event into the rollups, and return the events per second."""
+    # pylint: disable=import-outside-toplevel
+    from authenticity_product.services.http.db_async import engine_async
+    from authenticity_product.services.http.rollups import RollupJob
+
+    job = RollupJob(0, batch_size)
+    began = time.perf_counter()
+    events = 0
+    while aggregated := await job.aggregate():
+        events += aggregated
+    elapsed = time.perf_counter() - began
+    await engine_async.dispose()
+    return {
+        "events": events,
+        "seconds": round(elapsed, 1),
+        "events_per_second": round(events / elapsed),
+    }
+
+
+def time_queries(database: str, statement: str, products: int, queries: int) -> dict[str, Any]:
+    """Run the dashboard query of random products over a quarter, and return its latencies."""
+    connection = connect(database)
+    latencies = []
+    with connection, connection.cursor() as cursor:
+        for _ in range(queries):
+            end = date.today() - timedelta(days=random.randrange(0, 180))
+            parameters = (random.randint(1, products), end - timedelta(days=90), end)
+            began = time.perf_counter()
+            cursor.execute(statement, parameters)
+            cursor.fetchall()
+            latencies.append(time.perf_counter() - began)
+    connection.close()
+    latencies.sort()
+    return {
+        "queries": queries,
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "max_ms": percentile(latencies, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200_000_000)
+    parser.add_argument("--database", default="bench_rollups")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true", help="keep the database afterwards")
+    parsed = parser.parse_args()
+    os.environ["DB_NAME"] = parsed.database
+    create_database(parsed.database)
+    try:
+        report = {
+            "load": load_events(parsed.database, parsed.events, parsed.products, parsed.months)
+        }
+        report["rollup"] = asyncio.run(aggregate(parsed.batch_size))
+        report["raw_group_by"] = time_queries(
+            parsed.database, RAW_STATEMENT, parsed.products, parsed.queries
+        )
+        report["rollups"] = time_queries(
+            parsed.database, ROLLUP_STATEMENT, parsed.products, parsed.queries * 50
+        )
+        print(json.dumps(report, indent=2))
+    finally:
+        if not parsed.keep:
+            drop_database(parsed.database)
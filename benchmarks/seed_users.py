@@ -0,0 +1,149 @@
+"""Seed a database with synthetic users for the benchmarks.
+
+Users are streamed to the user table with COPY in batches, all sharing one password hash, so
+millions of them take seconds rather than hours of hashing. User ``i`` has the email
+``user{i}@bench.example`` and the phone ``05{i:08d}``.
+
+A disposable database can be created, migrated to the head revision, and dropped afterwards.
+Only the databases named ``bench_*`` are ever created or dropped, a random one by default, so
+that the database of the application is never wiped.
+
+Usage: python -m benchmarks.seed_users --users 1000000 [--create [--database bench_users]]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Any
+
+import psycopg2
+from fastapi_users.password import PasswordHelper
+
+
+PASSWORD = "benchmark-password"
+BENCH_PREFIX = "bench_"
+COLUMNS = (
+    "id",
+    "email",
+    "hashed_password",
+    "is_active",
+    "is_superuser",
+    "is_verified",
+    "first_name",
+    "last_name",
+    "phone",
+    "civility",
+    "role",
+    "created_at",
+    "updated_at",
+)
+
+
+def email(index: int) -> str:
+    """Return the email of a synthetic user."""
+    return f"user{index}@bench.example"
+
+
+def phone(index: int) -> str:
+    """Return the phone of a synthetic user."""
+    return f"05{index:08d}"
+
+
+def connect(database: str) -> Any:
+    """Connect to a database of the configured server."""
+    return psycopg2.connect(
+        host=os.environ["DB_HOST"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASSWORD"],
+        dbname=database,
+    )
+
+
+def check_disposable(database: str) -> None:
+    """Refuse a database which is not a disposable one of the benchmarks."""
+    if not database.startswith(BENCH_PREFIX):
+        raise ValueError(f"{database} is not a benchmark database, named {BENCH_PREFIX}*")
+
+
+def disposable_database(database: str | None) -> str:
+    """Return the database to create, a random benchmark one unless named."""
+    database = database or f"{BENCH_PREFIX}{uuid.uuid4().hex[:8]}"
+    check_disposable(database)
+    if database == os.getenv("DB_NAME"):
+        raise ValueError(f"{database} is the database of the application")
+    return database
+
+
+def create_database(database: str) -> None:
+    """Create an empty database and migrate it to the head revision."""
+    check_disposable(database)
+    connection = connect("postgres")
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}"')
+        cursor.execute(f'CREATE DATABASE "{database}"')
+    connection.close()
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        env={**os.environ, "DB_NAME": database},
+        check=True,
+        capture_output=True,
+    )
+
+
+def drop_database(database: str) -> None:
+    """Drop a disposable database."""
+    check_disposable(database)
+    connection = connect("postgres")
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+    connection.close()
+
+
+def seed(database: str, users: int, start: int = 0, batch_size: int = 100_000) -> dict[str, Any]:
+    """Copy synthetic users to a database, and return the rows per second."""
+    hashed_password = PasswordHelper().hash(PASSWORD)
+    now = datetime.now().isoformat()
+    connection = connect(database)
+    began = time.perf_counter()
+    with connection, connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO role (name, created_at, updated_at) VALUES "
+            "('admin', now(), now()), ('user', now(), now()) ON CONFLICT (name) DO NOTHING"
+        )
+        for batch_start in range(start, start + users, batch_size):
+            buffer = io.StringIO()
+            for index in range(batch_start, min(batch_start + batch_size, start + users)):
+                buffer.write(
+                    f"{uuid.uuid4()}\t{email(index)}\t{hashed_password}\tt\tf\tt\tBench\t"
+                    f"User{index}\t{phone(index)}\tMr\tuser\t{now}\t{now}\n"
+                )
+            buffer.seek(0)
+            cursor.copy_expert(f'COPY "user" ({", ".join(COLUMNS)}) FROM STDIN', buffer)
+        cursor.execute('ANALYZE "user"')
+    connection.close()
+    elapsed = time.perf_counter() - began
+    return {"users": users, "seconds": round(elapsed, 2), "rows_per_second": round(users / elapsed)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--database", help="the application one, or a new bench_* one to create")
+    parser.add_argument("--create", action="store_true", help="create and migrate the database")
+    arguments = parser.parse_args()
+    if arguments.create:
+        try:
+            arguments.database = disposable_database(arguments.database)
+        except ValueError as error:
+            parser.error(str(error))
+        create_database(arguments.database)
+    arguments.database = arguments.database or os.environ["DB_NAME"]
+    print(json.dumps(seed(arguments.database, arguments.users, arguments.start), indent=2))
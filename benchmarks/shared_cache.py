@@ -0,0 +1,95 @@
+"""Compare the hit rate and latency of the per-worker and the shared memory caches.
+
+Every worker process looks up keys drawn from a skewed distribution, and caches the value of
+each miss as if it had been loaded from the database.
+
+Usage: python -m benchmarks.shared_cache [--workers 4] [--lookups 100000] [--keys 10000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+import uuid
+from typing import Any
+
+from authenticity_product.services.http.cache import CacheBackend, TTLCache
+from authenticity_product.services.http.shared_cache import SharedMemoryCache
+
+
+TTL_IN_SECONDS = 300
+SLOT_SIZE = 1024
+
+
+def get_backend(backend: str, name: str, keys: int) -> CacheBackend:
+    """Return the cache of a worker."""
+    if backend == "shared":
+        return SharedMemoryCache(name, keys * 2, SLOT_SIZE, TTL_IN_SECONDS)
+    return TTLCache(keys, TTL_IN_SECONDS)
+
+
+def work(backend: str, name: str, keys: int, lookups: int, seed: int, results: Any) -> None:
+    """Look keys up in a cache and report the hits and the latency of each lookup."""
+    cache = get_backend(backend, name, keys)
+    generator = random.Random(seed)
+    value = {"id": str(uuid.uuid4()), "email": "user@example.com", "is_active": True}
+    hits, latencies = 0, []
+    for _ in range(lookups):
+        key = str(min(int(generator.paretovariate(1.2)), keys))
+        start = time.perf_counter_ns()
+        cached = cache.get(key)
+        latencies.append(time.perf_counter_ns() - start)
+        if cached is not None:
+            hits += 1
+        else:
+            cache.set(key, value)
+    results.put((hits, latencies))
+
+
+def run(backend: str, workers: int, keys: int, lookups: int) -> dict[str, Any]:
+    """Run the workers on a cache backend and aggregate their results."""
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    name = f"benchmark_{os.getpid()}_{backend}"
+    if backend == "shared":
+        get_backend(backend, name, keys)
+    processes = [
+        context.Process(target=work, args=(backend, name, keys, lookups, seed, results))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    if backend == "shared":
+        SharedMemoryCache(name, keys * 2, SLOT_SIZE, TTL_IN_SECONDS).unlink()
+    latencies = sorted(latency for _, worker_latencies in outcomes for latency in worker_latencies)
+    return {
+        "hit_rate": round(sum(hits for hits, _ in outcomes) / len(latencies), 4),
+        "mean_us": round(statistics.fmean(latencies) / 1000, 2),
+        "p50_us": round(latencies[len(latencies) // 2] / 1000, 2),
+        "p99_us": round(latencies[int(len(latencies) * 0.99)] / 1000, 2),
+    }
+
+
+def main(workers: int, lookups: int, keys: int) -> dict[str, Any]:
+    """Run the benchmark with both backends."""
+    return {
+        "workers": workers,
+        "lookups_per_worker": lookups,
+        "keys": keys,
+        "per_worker": run("memory", workers, keys, lookups),
+        "shared": run("shared", workers, keys, lookups),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    arguments = parser.parse_args()
+    print(json.dumps(main(arguments.workers, arguments.lookups, arguments.keys), indent=2))
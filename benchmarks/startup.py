@@ -0,0 +1,87 @@
+"""Measure the import time of the application and the time to its first request.
+
+Both are measured in a fresh interpreter, the import with ``python -X importtime`` and the
+first request from the interpreter start to the response of /healthz through the lifespan.
+
+Usage: python -m benchmarks.startup [--runs 3]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+
+
+MODULE = "authenticity_product.services.http.entrypoint"
+FIRST_REQUEST = f"""
+import asyncio
+import httpx
+from asgi_lifespan import LifespanManager
+from {MODULE} import app
+
+
+async def main():
+    async with LifespanManager(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as client:
+            (await client.get("/healthz")).raise_for_status()
+    print("ready", flush=True)
+
+
+asyncio.run(main())
+"""
+
+
+def measure_import() -> tuple[float, dict[str, float]]:
+    """Return the import time of the application, and the self time of its slowest modules."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    self_times, total = {}, 0.0
+    for line in result.stderr.splitlines():
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        self_times[name] = int(fields[0]) / 1000
+        if name == MODULE:
+            total = int(fields[1]) / 1000
+    slowest = sorted(self_times, key=self_times.__getitem__, reverse=True)[:10]
+    return total, {name: self_times[name] for name in slowest}
+
+
+def measure_first_request() -> float:
+    """Return the milliseconds from the interpreter start to the first response."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST], capture_output=True, text=True, check=False
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode or "ready" not in result.stdout:
+        raise RuntimeError(result.stderr)
+    return elapsed
+
+
+def main(runs: int) -> dict[str, Any]:
+    """Run the measures and keep their medians, the first runs warm the file cache."""
+    imports = [measure_import() for _ in range(runs)]
+    first_requests = [measure_first_request() for _ in range(runs)]
+    return {
+        "runs": runs,
+        "import_ms": round(statistics.median(total for total, _ in imports), 1),
+        "first_request_ms": round(statistics.median(first_requests), 1),
+        "slowest_modules_self_ms": imports[-1][1],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    arguments = parser.parse_args()
+    print(json.dumps(main(arguments.runs), indent=2))
@@ -0,0 +1,128 @@
+"""Measure the serial code verification at tens of millions of codes.
+
+A disposable database is loaded with random codes through COPY, the uniqueness constraint
+being added once loaded, then /verify is driven in-process for codes never looked up (database
+path), hot codes (cache hits) and unknown codes (negative cache). The size of the hash index is
+reported with the throughput and latency percentiles of each scenario.
+
+Usage: python -m benchmarks.verify_codes --codes 20000000 [--database bench_codes]
+       [--concurrency 32] [--requests 20000]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+from typing import Any
+
+import httpx
+from benchmarks.auth_service import in_process_client, run_scenario
+from benchmarks.seed_users import connect, create_database, drop_database
+
+
+def load_codes(database: str, codes: int, batch_size: int = 500_000) -> dict[str, Any]:
+    """Copy random codes of one product to a database, and return the load statistics."""
+    # pylint: disable=import-outside-toplevel
+    from authenticity_product.services.http.verification import generate_code
+
+    connection = connect(database)
+    began = time.perf_counter()
+    with connection, connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO product (name, created_at, updated_at) "
+            "VALUES ('Benchmark', now(), now()) RETURNING id"
+        )
+        product_id = cursor.fetchone()[0]
+        cursor.execute("ALTER TABLE serial_code DROP CONSTRAINT serial_code_code_excl")
+        for start in range(0, codes, batch_size):
+            buffer = io.StringIO()
+            for _ in range(min(batch_size, codes - start)):
+                buffer.write(f"{generate_code()}\t{product_id}\tnow\tnow\n")
+            buffer.seek(0)
+            cursor.copy_expert(
+                "COPY serial_code (code, product_id, created_at, updated_at) FROM STDIN", buffer
+            )
+        loaded = time.perf_counter()
+        cursor.execute(
+            "ALTER TABLE serial_code ADD CONSTRAINT serial_code_code_excl "
+            "EXCLUDE USING hash (code WITH =)"
+        )
+        cursor.execute("ANALYZE serial_code")
+        cursor.execute("SELECT pg_relation_size('serial_code_code_excl')")
+        index_size = cursor.fetchone()[0]
+    connection.close()
+    return {
+        "codes": codes,
+        "rows_per_second": round(codes / (loaded - began)),
+        "index_build_seconds": round(time.perf_counter() - loaded, 1),
+        "hash_index_mb": round(index_size / 2**20, 1),
+    }
+
+
+def sample_codes(database: str, count: int) -> list[str]:
+    """Return random codes of the database."""
+    connection = connect(database)
+    with connection, connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = 'serial_code'")
+        percent = min(100.0, 200.0 * count / max(cursor.fetchone()[0], 1))
+        cursor.execute(
+            "SELECT code FROM serial_code TABLESAMPLE BERNOULLI (%s) LIMIT %s", (percent, count)
+        )
+        codes = [row[0] for row in cursor.fetchall()]
+    connection.close()
+    random.shuffle(codes)
+    return codes
+
+
+async def main(arguments: argparse.Namespace) -> dict[str, Any]:
+    """Run the verification scenarios."""
+    # pylint: disable=import-outside-toplevel
+    from authenticity_product.services.http.verification import generate_code
+
+    known = sample_codes(arguments.database, arguments.requests)
+    hot = known[:100]
+    unknown = [generate_code() for _ in range(100)]
+    results = {}
+    async with in_process_client() as client:
+        cold = iter(known)
+
+        async def verify_cold(client: httpx.AsyncClient) -> int:
+            return (await client.get(f"/verify/{next(cold)}")).status_code
+
+        async def verify_hot(client: httpx.AsyncClient) -> int:
+            return (await client.get(f"/verify/{random.choice(hot)}")).status_code
+
+        async def verify_unknown(client: httpx.AsyncClient) -> int:
+            return (await client.get(f"/verify/{random.choice(unknown)}")).status_code
+
+        results["database"] = await run_scenario(
+            client, verify_cold, len(known), arguments.concurrency
+        )
+        results["cache_hit"] = await run_scenario(
+            client, verify_hot, arguments.requests, arguments.concurrency
+        )
+        results["unknown"] = await run_scenario(
+            client, verify_unknown, arguments.requests, arguments.concurrency
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--codes", type=int, default=20_000_000)
+    parser.add_argument("--database", default="bench_codes")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--keep", action="store_true", help="keep the database afterwards")
+    parsed = parser.parse_args()
+    os.environ["DB_NAME"] = parsed.database
+    create_database(parsed.database)
+    try:
+        report = {"load": load_codes(parsed.database, parsed.codes)}
+        report["scenarios"] = asyncio.run(main(parsed))
+        print(json.dumps(report, indent=2))
+    finally:
+        if not parsed.keep:
+            drop_database(parsed.database)
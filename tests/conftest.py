@@ -9,11 +9,12 @@ from asgi_lifespan import LifespanManager
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import sessionmaker
-from authenticity_product.models import DeclarativeBase, User
+from authenticity_product.models import DeclarativeBase, Product, SerialCode, User
 from authenticity_product.schemas import UserCreate
 from authenticity_product.services.http.db_async import async_session_maker
 from authenticity_product.services.http.entrypoint import app
 from authenticity_product.services.http.users import UserManager
+from authenticity_product.services.http.verification import generate_code
 
 
 @pytest.fixture(scope="session")
@@ -118,6 +119,34 @@ async def fake_user(db_dependency, user_manager, test_app_client):
     db_dependency.commit()
 
 
+@pytest.fixture(scope="module")
+@pytest.mark.asyncio
+async def headers(test_app_client, fake_user):
+    response = await test_app_client.post(
+        "/auth/jwt/login", data={"username": fake_user.email, "password": "guinevere"}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="module")
+def product(db_dependency):
+    product = Product(name="Perfume", brand="Camelot")
+    db_dependency.add(product)
+    db_dependency.commit()
+    return product
+
+
+@pytest.fixture(scope="module")
+def add_code(db_dependency):
+    def _add_code(product) -> str:
+        code = generate_code()
+        db_dependency.add(SerialCode(code=code, product_id=product.id))
+        db_dependency.commit()
+        return code
+
+    return _add_code
+
+
 @pytest.fixture(scope="module")
 def client():
     from authenticity_product.services.http.entrypoint import app
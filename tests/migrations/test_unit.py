@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from authenticity_product.migrations import backfill, create_index, create_unique_constraint
+from authenticity_product.services.http.config import settings
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine(settings.db_uri)
+    with engine.connect() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS migration_test"))
+        connection.execute(text("CREATE TABLE migration_test (id INTEGER PRIMARY KEY, code TEXT)"))
+        connection.execute(
+            text("INSERT INTO migration_test SELECT i, NULL FROM generate_series(1, 25) AS i")
+        )
+        connection.commit()
+        yield connection
+        connection.rollback()
+        connection.execute(text("DROP TABLE migration_test"))
+        connection.commit()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("mode", ["", "zero-downtime"])
+def test_helpers_build_the_same_schema(connection, mode):
+    context = MigrationContext.configure(connection, opts={"mode": mode})
+    with Operations.context(context):
+        updated = backfill(
+            "migration_test",
+            "code = 'code-' || id",
+            "code IS NULL",
+            batch_size=10,
+            pause_in_seconds=0,
+        )
+        create_index("ix_migration_test_code", "migration_test", ["code"])
+        create_index(
+            "ix_migration_test_short", "migration_test", ["id"], postgresql_where="id < 10"
+        )
+        create_unique_constraint("migration_test_code_key", "migration_test", ["code"])
+    connection.commit()
+    inspector = inspect(connection)
+    assert updated == 25
+    assert (
+        connection.execute(text("SELECT count(*) FROM migration_test WHERE code IS NULL")).scalar()
+        == 0
+    )
+    indexes = {index["name"]: index for index in inspector.get_indexes("migration_test")}
+    assert "ix_migration_test_code" in indexes
+    assert indexes["ix_migration_test_short"]["dialect_options"]["postgresql_where"] == "(id < 10)"
+    assert [
+        constraint["name"] for constraint in inspector.get_unique_constraints("migration_test")
+    ] == ["migration_test_code_key"]
@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException, status
+from authenticity_product.services.http.admission import (
+    BucketLimit,
+    InMemoryBucketStore,
+    login_admission,
+    PostgresBucketStore,
+)
+from authenticity_product.services.http.db_async import engine_async
+
+
+@pytest.mark.asyncio
+async def test_in_memory_bucket_refills_over_time():
+    store = InMemoryBucketStore()
+    limit = BucketLimit(capacity=2, refill_per_second=1)
+    assert await store.take("key", limit) == 0
+    assert await store.take("key", limit) == 0
+    assert await store.take("key", limit) > 0
+    tokens, updated_at = store.buckets["key"]
+    store.buckets["key"] = (tokens, updated_at - 1)
+    assert await store.take("key", limit) == 0
+
+
+@pytest.mark.asyncio
+async def test_in_memory_store_evicts_least_recently_used():
+    store = InMemoryBucketStore(max_size=2)
+    limit = BucketLimit(capacity=1, refill_per_second=1)
+    for key in ("a", "b", "a", "c"):
+        await store.take(key, limit)
+    assert list(store.buckets) == ["a", "c"]
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestAdmission:
+    async def test_postgres_bucket_is_shared(self, test_app_client):
+        limit = BucketLimit(capacity=2, refill_per_second=0.01)
+        key = f"test:{uuid.uuid4()}"
+        stores = [PostgresBucketStore(engine_async), PostgresBucketStore(engine_async)]
+        results = [await store.take(key, limit) for store in stores + stores]
+        assert results[:2] == [0, 0]
+        assert results[2] == results[3] == 100
+
+    async def test_identifier_limit_rejects_before_hashing(self, test_app_client, monkeypatch):
+        monkeypatch.setattr(login_admission, "identifier_limit", BucketLimit(1, 0.001))
+        data = {"username": f"{uuid.uuid4()}@camelot.bt", "password": "excalibur"}
+        response = await test_app_client.post("/auth/jwt/login", data=data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = await test_app_client.post("/auth/jwt/login", data=data)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response.headers["retry-after"]) >= 1
+        body = (await test_app_client.get("/metrics")).text
+        assert 'admission_rejections_total{bucket="identifier",route="login"}' in body
+
+    async def test_hashing_slots_shed_with_503(self, test_app_client, monkeypatch):
+        monkeypatch.setattr(login_admission, "hash_slots", asyncio.Semaphore(0))
+        monkeypatch.setattr(login_admission, "hash_wait_in_seconds", 0.01)
+        data = {"username": "lancelot@camelot.bt", "password": "excalibur"}
+        response = await test_app_client.post("/auth/jwt/login", data=data)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+    async def test_logout_is_not_admitted(self, test_app_client, monkeypatch):
+        async def reject(*args):
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        monkeypatch.setattr(login_admission, "take", reject)
+        data = {"username": "lancelot@camelot.bt", "password": "excalibur"}
+        response = await test_app_client.post("/auth/jwt/login", data=data)
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        response = await test_app_client.post("/auth/jwt/logout")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -0,0 +1,182 @@
+import time
+
+import pytest
+from fastapi import status
+from prometheus_client import REGISTRY
+from sqlalchemy import event, select
+from authenticity_product.models import Product, SerialCode, SuspiciousCode
+from authenticity_product.services.http.anomalies import anomaly_detector, AnomalyDetector
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.signed_codes import get_code_signer
+from authenticity_product.services.http.verification import generate_code
+
+
+def detector(**limits) -> AnomalyDetector:
+    return AnomalyDetector(
+        **{
+            "window_in_seconds": 3600,
+            "max_scans": 3,
+            "max_locations": 2,
+            "max_speed_in_kmh": 900,
+            "max_codes": 100,
+            "checkpoint_interval_in_seconds": 60,
+            **limits,
+        }
+    )
+
+
+def flags_count(reason: str) -> float:
+    return REGISTRY.get_sample_value("suspicious_codes_total", {"reason": reason}) or 0
+
+
+class TestAnomalies:
+    def test_codes_scanned_too_often_in_the_window_are_suspicious(self):
+        anomalies = detector()
+        now = time.time()
+        anomalies.observe("OFTEN", 1, None, None, "DZ", now - 7200)
+        for seconds in (3, 2, 1):
+            anomalies.observe("OFTEN", 1, None, None, "DZ", now - seconds)
+        activity = anomalies._activities["OFTEN"]
+        assert anomalies.anomalies(activity, now) == ([], 3, 1)
+        anomalies.observe("OFTEN", 1, None, None, "DZ", now)
+        assert anomalies.anomalies(activity, now) == (["scans"], 4, 1)
+        assert activity.scans == 5 and activity.first_seen == now - 7200
+
+    def test_codes_scanned_in_many_places_or_far_apart_are_suspicious(self):
+        anomalies = detector(max_scans=10)
+        now = time.time()
+        for country in ("DZ", "TN", "MA"):
+            anomalies.observe("PLACES", 1, None, None, country, now)
+        assert anomalies.anomalies(anomalies._activities["PLACES"], now) == (["locations"], 3, 3)
+        # Algiers then Paris, 1350 km within the hour
+        anomalies.observe("TRAVEL", 1, 36.8, 3.1, None, now - 3000)
+        anomalies.observe("TRAVEL", 1, 48.9, 2.4, None, now)
+        assert anomalies.anomalies(anomalies._activities["TRAVEL"], now) == (["travel"], 2, 2)
+        anomalies.observe("NEARBY", 1, 36.8, 3.1, None, now - 60)
+        anomalies.observe("NEARBY", 1, 36.7, 3.0, None, now)
+        assert anomalies.anomalies(anomalies._activities["NEARBY"], now)[0] == []
+
+    def test_least_recently_scanned_codes_are_evicted_once_saved(self):
+        anomalies = detector(max_codes=2)
+        for code in ("FIRST", "SECOND", "FIRST", "THIRD"):
+            anomalies.observe(code, 1, None, None, None)
+        assert list(anomalies._activities) == ["FIRST", "THIRD"]
+        assert set(anomalies._dirty) == {"FIRST", "SECOND", "THIRD"}
+
+
+@pytest.mark.asyncio
+class TestCheckpoints:
+    async def test_workers_merge_their_scans_and_flag_the_code(self, db_dependency, product):
+        code, now = generate_code(), time.time()
+        first, second = detector(), detector()
+        flagged = flags_count("scans")
+        for seconds in (4, 3):
+            first.observe(code, product.id, None, None, "DZ", now - seconds)
+        for seconds in (2, 1):
+            second.observe(code, product.id, None, None, "DZ", now - seconds)
+        await first.checkpoint()
+        assert (
+            db_dependency.scalars(select(SuspiciousCode).where(SuspiciousCode.code == code)).all()
+            == []
+        )
+        db_dependency.commit()
+        await second.checkpoint()
+        suspicious = db_dependency.scalars(
+            select(SuspiciousCode).where(SuspiciousCode.code == code)
+        ).all()
+        db_dependency.commit()
+        assert [(flag.reason, flag.scans, flag.locations) for flag in suspicious] == [
+            ("scans", 4, 1)
+        ]
+        assert second._activities[code].scans == 4 and not second._dirty
+        assert flags_count("scans") == flagged + 1
+        second.observe(code, product.id, None, None, "DZ")
+        await second.checkpoint()
+        assert flags_count("scans") == flagged + 1
+        restarted = detector()
+        await restarted.load()
+        assert restarted._activities[code].scans == 5
+        assert len(restarted._activities[code].recent) == 4
+
+    async def test_scans_observed_during_a_checkpoint_are_saved_by_the_next(self, product):
+        code, anomalies = generate_code(), detector()
+        anomalies.observe(code, product.id, None, None, "DZ")
+
+        def observe_meanwhile(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO code_activity"):
+                anomalies.observe(code, product.id, None, None, "DZ")
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", observe_meanwhile)
+        try:
+            await anomalies.checkpoint()
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", observe_meanwhile)
+        assert anomalies._activities[code].unsaved == 1
+        await anomalies.checkpoint()
+        restarted = detector()
+        await restarted.load()
+        assert restarted._activities[code].scans == 2
+
+    async def test_scans_are_kept_when_the_checkpoint_fails(self, monkeypatch):
+        anomalies = detector()
+        anomalies.observe("FAILED", 1, None, None, None)
+
+        async def fail(activities):
+            raise ConnectionError
+
+        monkeypatch.setattr(anomalies, "save", fail)
+        with pytest.raises(ConnectionError):
+            await anomalies.checkpoint()
+        assert set(anomalies._dirty) == {"FAILED"}
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestAnomalyRoutes:
+    async def test_authentic_scans_feed_the_detector(self, test_app_client, db_dependency, product):
+        code = generate_code()
+        db_dependency.add(SerialCode(code=code, product_id=product.id))
+        db_dependency.commit()
+        await test_app_client.get(f"/verify/{code}?lat=36.7538&lon=3.0588")
+        unknown = generate_code()
+        await test_app_client.get(f"/verify/{unknown}")
+        activity = anomaly_detector._activities[code]
+        assert activity.product_id == product.id
+        assert activity.recent[0][1:] == (36.8, 3.1, None)
+        assert unknown not in anomaly_detector._activities
+
+    async def test_signed_codes_are_followed_by_product_and_serial(self, test_app_client, product):
+        code = get_code_signer().sign(product.id, 7)
+        await test_app_client.get(f"/verify/{code.lower()}")
+        await test_app_client.get(f"/verify/{code[:8]}-{code[8:]}")
+        assert len(anomaly_detector._activities[f"{product.id}:7"].recent) == 2
+        assert code not in anomaly_detector._activities
+
+    async def test_suspicious_codes_are_listed_by_page(
+        self, test_app_client, headers, db_dependency, monkeypatch
+    ):
+        monkeypatch.setattr(anomaly_detector, "max_scans", 1)
+        product = Product(name="Watch")
+        db_dependency.add(product)
+        db_dependency.commit()
+        # flagged in the order of the codes
+        codes = sorted(generate_code() for _ in range(3))
+        for code in codes:
+            for _ in range(2):
+                anomaly_detector.observe(code, product.id, None, None, "DZ")
+        await anomaly_detector.checkpoint()
+        response = await test_app_client.get(
+            f"/anomalies?product_id={product.id}&limit=2", headers=headers
+        )
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert [flag["code"] for flag in page] == codes[:0:-1]
+        response = await test_app_client.get(
+            f"/anomalies?product_id={product.id}&before={page[-1]['id']}", headers=headers
+        )
+        assert [flag["code"] for flag in response.json()] == [codes[0]]
+        response = await test_app_client.get(f"/anomalies/{codes[0]}", headers=headers)
+        assert response.json()["scans"] == 2
+        assert [flag["reason"] for flag in response.json()["flags"]] == ["scans"]
+        response = await test_app_client.get(f"/anomalies/{generate_code()}", headers=headers)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+from fastapi import status
+from sqlalchemy import event
+from authenticity_product.models import SerialCode
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.signed_codes import get_code_signer, revocation_list
+from authenticity_product.services.http.verification import generate_code
+
+
+@pytest.fixture(scope="module")
+def codes(db_dependency, product):
+    codes = [generate_code() for _ in range(5)]
+    db_dependency.add_all(SerialCode(code=code, product_id=product.id) for code in codes)
+    db_dependency.commit()
+    return codes
+
+
+def read_lines(response) -> list[dict]:
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestBatchVerification:
+    async def test_batch_requires_a_user(self, test_app_client):
+        response = await test_app_client.post("/verify/batch", json=[generate_code()])
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_codes_are_resolved_in_chunks_and_streamed_in_order(
+        self, test_app_client, headers, product, codes, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "batch_verify_chunk_size", 4)
+        unknown = generate_code()
+        batch = [codes[0].lower(), unknown, *codes[1:]]
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if "serial_code" in statement:
+                statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", count)
+        try:
+            response = await test_app_client.post(
+                "/verify/batch", json={"codes": batch}, headers=headers
+            )
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", count)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        results = read_lines(response)
+        assert [result["code"] for result in results] == [codes[0], unknown, *codes[1:]]
+        assert [result["authentic"] for result in results] == [True, False, True, True, True, True]
+        assert results[0]["product"] == {"id": product.id, "name": "Perfume", "brand": "Camelot"}
+        assert len(statements) == 2
+
+    async def test_ndjson_batch_with_signed_codes(self, test_app_client, headers, product, codes):
+        signer = get_code_signer()
+        valid, revoked = signer.sign(product.id, 10), signer.sign(product.id, 11)
+        await revocation_list.revoke(product.id, 11)
+        body = "\n".join(
+            [json.dumps({"code": codes[0]}), json.dumps(valid), revoked, "", "NOT-A-CODE"]
+        )
+        response = await test_app_client.post(
+            "/verify/batch",
+            content=body,
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        results = read_lines(response)
+        assert results[0]["authentic"] is True
+        assert results[1] == {
+            "code": valid,
+            "authentic": True,
+            "product": {"id": product.id},
+            "serial": 10,
+        }
+        assert results[2] == {"code": revoked, "authentic": False, "revoked": True}
+        assert results[3] == {"code": "NOTACODE", "authentic": False}
+
+    async def test_batch_size_is_limited_by_role(self, test_app_client, headers, monkeypatch):
+        monkeypatch.setattr(settings, "batch_verify_limits", {"admin": 2, "user": 1})
+        response = await test_app_client.post(
+            "/verify/batch", json=[generate_code() for _ in range(3)], headers=headers
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        assert response.json() == {"detail": "At most 2 codes per batch"}
+
+    async def test_oversized_body_is_rejected_before_parsing(
+        self, test_app_client, headers, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "batch_verify_limits", {"admin": 2, "user": 1})
+        response = await test_app_client.post(
+            "/verify/batch", content=b"[" + b" " * 2048 + b"]", headers=headers
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        async def unsized_body():
+            yield b"["
+            for _ in range(4):
+                yield b" " * 512
+
+        response = await test_app_client.post(
+            "/verify/batch", content=unsized_body(), headers=headers
+        )
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    async def test_malformed_batch_is_rejected(self, test_app_client, headers):
+        response = await test_app_client.post(
+            "/verify/batch", json={"codes": [1, 2]}, headers=headers
+        )
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
@@ -0,0 +1,179 @@
+import pytest
+from fastapi import status
+from prometheus_client import REGISTRY
+from sqlalchemy import event, text
+from authenticity_product.services.http.code_filter import BloomFilter, code_filter, CodeFilter
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.verification import generate_code
+
+
+def sample(name: str, labels: dict | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0
+
+
+class TestBloomFilter:
+    def test_codes_added_are_found_and_others_mostly_not(self, tmp_path):
+        bloom = BloomFilter.create(str(tmp_path / "codes.bloom"), 10000, 0.01)
+        codes = [generate_code() for _ in range(10000)]
+        bloom.add(codes)
+        assert all(code in bloom for code in codes)
+        false_positives = sum(generate_code() in bloom for _ in range(10000))
+        assert false_positives < 200
+        assert 0.005 < bloom.false_positive_rate() < 0.015
+
+    def test_the_file_keeps_the_codes_and_the_last_id(self, tmp_path):
+        path = str(tmp_path / "codes.bloom")
+        bloom = BloomFilter.create(path, 1000, 0.01)
+        bloom.add(["FIRSTCODE", "SECONDCODE"])
+        bloom.last_id = 42
+        bloom.close()
+        bloom = BloomFilter(path)
+        assert "FIRSTCODE" in bloom and "SECONDCODE" in bloom
+        assert (bloom.count, bloom.last_id) == (2, 42)
+
+    def test_other_files_are_rejected(self, tmp_path):
+        path = tmp_path / "codes.bloom"
+        path.write_bytes(b"\0" * 128)
+        with pytest.raises(ValueError):
+            BloomFilter(str(path))
+
+
+@pytest.mark.asyncio
+class TestCodeFilter:
+    async def test_a_single_worker_builds_and_updates_the_filter(
+        self, tmp_path, db_dependency, product, add_code
+    ):
+        issued = add_code(product)
+        writer = CodeFilter(str(tmp_path / "codes.bloom"), 1000, 0.01, 60, batch_size=2)
+        reader = CodeFilter(str(tmp_path / "codes.bloom"), 1000, 0.01, 60)
+        try:
+            assert writer.might_contain("NEVERISSUED")
+            await writer.refresh()
+            await reader.refresh()
+            assert writer.writer and not reader.writer
+            assert reader.might_contain(issued)
+            added = add_code(product)
+            assert not reader.might_contain(added)
+            await writer.refresh()
+            assert reader.might_contain(added)
+            await writer.add(["GENERATEDCODE"])
+            await reader.add(["NOTWRITTEN"])
+            assert reader.might_contain("GENERATEDCODE")
+            assert not writer.might_contain("NOTWRITTEN")
+        finally:
+            await writer.stop()
+            await reader.stop()
+        restarted = CodeFilter(str(tmp_path / "codes.bloom"), 1000, 0.01, 60)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if "SELECT id, code FROM serial_code" in statement:
+                statements.append(parameters)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", record)
+        try:
+            await restarted.refresh()
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", record)
+            await restarted.stop()
+        assert restarted.might_contain(added)
+        assert len(statements) == 1 and statements[0][0] > 0
+
+    async def test_codes_committed_after_higher_ids_are_read(
+        self, tmp_path, db_dependency, product, add_code
+    ):
+        code_filter_ = CodeFilter(str(tmp_path / "codes.bloom"), 1000, 0.01, 60)
+        late = generate_code()
+        async with engine_async.connect() as connection:
+            await connection.execute(
+                text(
+                    "INSERT INTO serial_code (code, product_id, created_at, updated_at) "
+                    "VALUES (:code, :product_id, LOCALTIMESTAMP, LOCALTIMESTAMP)"
+                ),
+                {"code": late, "product_id": product.id},
+            )
+            early = add_code(product)
+            await code_filter_.refresh()
+            assert code_filter_.might_contain(early)
+            assert not code_filter_.might_contain(late)
+            await connection.commit()
+        try:
+            await code_filter_.refresh()
+            assert code_filter_.might_contain(late)
+            await code_filter_.refresh()
+            assert not code_filter_._gaps
+        finally:
+            await code_filter_.stop()
+
+    async def test_a_filter_of_another_table_is_rebuilt(
+        self, tmp_path, db_dependency, product, add_code
+    ):
+        code = add_code(product)
+        path = str(tmp_path / "codes.bloom")
+        restored = BloomFilter.create(path, 1000, 0.01)
+        restored.last_id = 10**12
+        restored.close()
+        code_filter_ = CodeFilter(path, 1000, 0.01, 60)
+        try:
+            await code_filter_.refresh()
+            assert code_filter_.might_contain(code)
+            identity = code_filter_.bloom.identity
+            assert identity != 0
+            code_filter_.bloom.last_id = 10**12
+            await code_filter_.refresh()
+            assert code_filter_.bloom.last_id < 10**12
+            assert code_filter_.bloom.identity == identity
+        finally:
+            await code_filter_.stop()
+
+    async def test_an_outgrown_filter_is_rebuilt_larger(
+        self, tmp_path, db_dependency, product, add_code
+    ):
+        for _ in range(3):
+            add_code(product)
+        code_filter_ = CodeFilter(str(tmp_path / "codes.bloom"), 1, 0.01, 60)
+        try:
+            await code_filter_.refresh()
+            small = code_filter_.bloom
+            await code_filter_.refresh()
+            assert code_filter_.bloom is not small
+            assert code_filter_.bloom.bits > small.bits
+        finally:
+            await code_filter_.stop()
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestVerificationPrefilter:
+    async def test_codes_missing_from_the_filter_are_unknown_without_a_query(
+        self, test_app_client, db_dependency, product, add_code, tmp_path, monkeypatch
+    ):
+        code, forged_code = add_code(product), generate_code()
+        bloom = BloomFilter.create(str(tmp_path / "codes.bloom"), 1000, 0.01)
+        bloom.add([code, forged_code])
+        monkeypatch.setattr(code_filter, "bloom", bloom)
+        rejected = sample("verification_lookups_total", {"source": "filter", "result": "unknown"})
+        false_positives = sample("serial_code_filter_false_positives_total")
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if "serial_code" in statement:
+                statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", record)
+        try:
+            unknown = await test_app_client.get(f"/verify/{generate_code()}")
+            assert statements == []
+            found = await test_app_client.get(f"/verify/{code}")
+            forged = await test_app_client.get(f"/verify/{forged_code}")
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", record)
+        assert unknown.status_code == status.HTTP_404_NOT_FOUND
+        assert found.status_code == status.HTTP_200_OK
+        assert forged.status_code == status.HTTP_404_NOT_FOUND
+        assert len(statements) == 2
+        assert (
+            sample("verification_lookups_total", {"source": "filter", "result": "unknown"})
+            == rejected + 1
+        )
+        assert sample("serial_code_filter_false_positives_total") == false_positives + 1
@@ -0,0 +1,103 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+from fastapi import status
+from sqlalchemy import func, select, text
+from authenticity_product import verifier
+from authenticity_product.models import CodeGenerationJob, SerialCode
+from authenticity_product.serial_codes import CODE_ALPHABET, generate_chunk
+from authenticity_product.services.http.code_generation import code_generator, CodeGenerator
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.verification import code_pattern
+
+
+def test_chunks_are_codes_in_copy_format():
+    codes = generate_chunk(1000).decode().splitlines()
+    assert len(codes) == len(set(codes)) == 1000
+    assert all(code_pattern.fullmatch(code) for code in codes)
+
+
+def test_chunks_are_generated_with_the_standard_library_only():
+    script = (
+        "import sys; import authenticity_product.serial_codes; "
+        "print(any(name.split('.')[0] in ('sqlalchemy', 'fastapi', 'cryptography', 'requests') "
+        "for name in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, check=True)
+    assert result.stdout.strip() == b"False"
+    assert CODE_ALPHABET == verifier.CODE_ALPHABET
+
+
+def count_codes(db_dependency, product) -> int:
+    return db_dependency.scalar(
+        select(func.count()).select_from(SerialCode).where(SerialCode.product_id == product.id)
+    )
+
+
+@pytest.mark.asyncio
+class TestCodeGeneration:
+    async def test_taken_codes_are_skipped_in_bulk(self, db_dependency, product):
+        taken = generate_chunk(1).decode().strip()
+        db_dependency.add(SerialCode(code=taken, product_id=product.id))
+        db_dependency.commit()
+        chunk = generate_chunk(3) + f"{taken}\n".encode()
+        chunk += chunk.splitlines(keepends=True)[0]
+        async with engine_async.connect() as connection:
+            inserted = await code_generator.insert_chunk(connection, product.id, chunk)
+            await connection.rollback()
+        assert inserted == 3
+
+    async def test_interrupted_job_is_resumed_from_its_progress(self, db_dependency, product):
+        before = count_codes(db_dependency, product)
+        generator = CodeGenerator(chunk_size=700, workers=2)
+        job = await generator.create_job(product.id, 3000)
+        db_dependency.execute(
+            text("UPDATE code_generation_job SET generated = 1000 WHERE id = :id"), {"id": job.id}
+        )
+        db_dependency.commit()
+        await generator.run(job.id)
+        db_dependency.expire_all()
+        job = db_dependency.get(CodeGenerationJob, job.id)
+        assert (job.status, job.generated) == ("done", 3000)
+        assert job.rows_per_second > 0
+        assert count_codes(db_dependency, product) == before + 2000
+
+    async def test_job_run_elsewhere_is_skipped(self, db_dependency, product):
+        job = await code_generator.create_job(product.id, 10)
+        async with engine_async.connect() as connection:
+            await connection.execute(
+                text("SELECT pg_advisory_lock(hashtext('code_generation'), :id)"), {"id": job.id}
+            )
+            await code_generator.run(job.id)
+            await connection.invalidate()
+        db_dependency.expire_all()
+        assert db_dependency.get(CodeGenerationJob, job.id).status == "pending"
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestCodeGenerationRouter:
+    async def test_jobs_require_a_user(self, test_app_client, product):
+        response = await test_app_client.post(
+            "/codes/jobs", json={"product_id": product.id, "count": 10}
+        )
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    async def test_admin_triggers_a_job(self, test_app_client, db_dependency, product, fake_user):
+        login = await test_app_client.post(
+            "/auth/jwt/login", data={"username": fake_user.email, "password": "guinevere"}
+        )
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+        before = count_codes(db_dependency, product)
+        response = await test_app_client.post(
+            "/codes/jobs", json={"product_id": product.id, "count": 500}, headers=headers
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job_id = response.json()["id"]
+        await asyncio.gather(*code_generator._tasks)
+        response = await test_app_client.get(f"/codes/jobs/{job_id}", headers=headers)
+        assert response.json()["status"] == "done"
+        assert response.json()["generated"] == 500
+        assert count_codes(db_dependency, product) == before + 500
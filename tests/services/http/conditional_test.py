@@ -0,0 +1,60 @@
+import pytest
+from fastapi import status
+from sqlalchemy import event
+from authenticity_product.services.http.db_async import engine_async
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestConditionalMe:
+    async def test_validators_are_returned(self, test_app_client, headers, fake_user):
+        response = await test_app_client.get("/users/me", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"].startswith(f'"{fake_user.id.hex}-')
+        assert "last-modified" in response.headers
+        assert response.json()["id"] == str(fake_user.id)
+
+    async def test_matching_etag_is_not_modified(self, test_app_client, headers):
+        etag = (await test_app_client.get("/users/me", headers=headers)).headers["etag"]
+        response = await test_app_client.get(
+            "/users/me", headers={**headers, "If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    async def test_cached_principal_does_not_hit_database(self, test_app_client, headers):
+        etag = (await test_app_client.get("/users/me", headers=headers)).headers["etag"]
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", count)
+        try:
+            response = await test_app_client.get(
+                "/users/me", headers={**headers, "If-None-Match": etag}
+            )
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", count)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert statements == []
+
+    async def test_stale_etag_returns_body(self, test_app_client, headers):
+        response = await test_app_client.get(
+            "/users/me", headers={**headers, "If-None-Match": '"stale"'}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["email"] == "king.arthur@camelot.bt"
+
+    async def test_update_changes_etag(self, test_app_client, headers):
+        etag = (await test_app_client.get("/users/me", headers=headers)).headers["etag"]
+        response = await test_app_client.patch(
+            "/users/me", headers=headers, json={"password": "guinevere"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        response = await test_app_client.get(
+            "/users/me", headers={**headers, "If-None-Match": etag}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["etag"] != etag
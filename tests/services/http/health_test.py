@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from fastapi import status
+from sqlalchemy import exc
+from authenticity_product.services.http.circuit_breaker import CircuitBreaker, is_disconnect
+from authenticity_product.services.http.config import settings
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_in_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_breaker_lets_one_trial_through_after_the_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_in_seconds=60)
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 61
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+class DriverError(Exception):
+    def __init__(self, pgcode: str | None):
+        super().__init__(pgcode)
+        self.pgcode = pgcode
+
+
+def test_only_lost_connections_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_in_seconds=60)
+    for pgcode in ("57014", "40P01", "55P03"):
+        breaker.record_error(exc.OperationalError("SELECT 1", {}, DriverError(pgcode)))
+    breaker.record_error(exc.IntegrityError("INSERT", {}, DriverError("23505")))
+    assert breaker.state == "closed"
+    assert is_disconnect(exc.OperationalError("SELECT 1", {}, DriverError(None)))
+    assert is_disconnect(exc.OperationalError("SELECT 1", {}, DriverError("08006")))
+    assert is_disconnect(exc.OperationalError("SELECT 1", {}, DriverError("57P01")))
+    assert is_disconnect(
+        exc.InterfaceError("SELECT 1", {}, DriverError(None), connection_invalidated=True)
+    )
+    assert not is_disconnect(exc.InterfaceError("SELECT 1", {}, DriverError(None)))
+    breaker.record_error(exc.OperationalError("SELECT 1", {}, DriverError(None)))
+    assert breaker.state == "open"
+
+
+def test_only_database_errors_answer_service_unavailable():
+    from authenticity_product.services.http.entrypoint import app
+
+    assert exc.DBAPIError in app.exception_handlers
+    assert TimeoutError not in app.exception_handlers
+    assert ConnectionError not in app.exception_handlers
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestHealth:
+    async def test_healthz(self, test_app_client):
+        response = await test_app_client.get("/healthz")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"status": "ok", "circuit_breaker": "closed"}
+
+    async def test_readyz_reports_database_and_pools(self, test_app_client):
+        response = await test_app_client.get("/readyz")
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["status"] == "ready"
+        assert body["database"]["reachable"]
+        assert body["circuit_breaker"] == {"state": "closed", "failures": 0}
+        assert set(body["pools"]) >= {"asyncpg", "psycopg2"}
+
+    async def test_open_breaker_fails_fast(self, test_app_client):
+        for _ in range(settings.circuit_breaker.failure_threshold):
+            settings.circuit_breaker.record_failure()
+        try:
+            data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+            response = await test_app_client.post("/auth/jwt/login", data=data)
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.headers["retry-after"]
+            response = await test_app_client.get("/readyz")
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert response.json()["circuit_breaker"]["state"] == "open"
+        finally:
+            settings.circuit_breaker.record_success()
@@ -0,0 +1,130 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import status
+from sqlalchemy import event, select, text
+from authenticity_product.models import LoginAttempt
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.maintenance import PartitionRetention
+from authenticity_product.services.http.partitions import create_partition, drop_partitions
+
+INSERT_ATTEMPT = text(
+    "INSERT INTO login_attempt (attempted_at, user_id, identifier, success) "
+    "VALUES (:attempted_at, :user_id, 'lancelot@camelot.bt', false)"
+)
+
+
+def attempts(db_dependency, *identifiers) -> list[tuple]:
+    rows = db_dependency.execute(
+        select(
+            LoginAttempt.identifier,
+            LoginAttempt.user_id,
+            LoginAttempt.success,
+            LoginAttempt.reason,
+            LoginAttempt.ip,
+        )
+        .where(LoginAttempt.identifier.in_(identifiers))
+        .order_by(LoginAttempt.id)
+    ).all()
+    # the writers attach partitions, which waits for the transactions reading the table
+    db_dependency.commit()
+    return [tuple(row) for row in rows]
+
+
+def partitions(db_dependency) -> list[str]:
+    names = db_dependency.scalars(
+        text(
+            "SELECT relname FROM pg_inherits JOIN pg_class ON pg_class.oid = inhrelid "
+            "WHERE inhparent = 'login_attempt'::regclass ORDER BY relname"
+        )
+    ).all()
+    db_dependency.commit()
+    return list(names)
+
+
+@pytest.mark.asyncio
+class TestRetention:
+    async def test_months_past_the_retention_are_dropped(self, db_dependency):
+        async with engine_async.connect() as connection:
+            for month in (1, 2, 3):
+                await create_partition(connection, "login_attempt", datetime(2020, month, 1))
+            await create_partition(connection, "login_attempt", datetime.now())
+            statements = []
+
+            def record(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+
+            event.listen(engine_async.sync_engine, "before_cursor_execute", record)
+            try:
+                dropped = await drop_partitions(connection, "login_attempt", datetime(2020, 2, 15))
+            finally:
+                event.remove(engine_async.sync_engine, "before_cursor_execute", record)
+        assert dropped == ["login_attempt_p202001"]
+        assert (
+            'ALTER TABLE "login_attempt" DETACH PARTITION "login_attempt_p202001" CONCURRENTLY'
+            in statements
+        )
+        assert await PartitionRetention("logins", "login_attempt", 30).run(engine_async, 100, 0)
+        remaining = partitions(db_dependency)
+        assert not [name for name in remaining if name.startswith("login_attempt_p2020")]
+        assert f"login_attempt_p{datetime.now():%Y%m}" in remaining
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestLoginAudit:
+    async def test_password_logins_are_recorded_with_their_outcome(
+        self, test_app_client, db_dependency, fake_user
+    ):
+        for username, password in (
+            (fake_user.email, "morgana"),
+            ("mordred@camelot.bt", "guinevere"),
+            (fake_user.phone, "guinevere"),
+        ):
+            await test_app_client.post(
+                "/auth/jwt/login", data={"username": username, "password": password}
+            )
+        identifiers = (fake_user.email, "mordred@camelot.bt", fake_user.phone)
+        for _ in range(30):
+            if len(attempts(db_dependency, *identifiers)) >= 3:
+                break
+            await asyncio.sleep(0.1)
+        # the email logins of the fixtures are recorded along
+        assert [
+            attempt
+            for attempt in attempts(db_dependency, *identifiers)
+            if attempt[3] is not None or attempt[0] == fake_user.phone
+        ] == [
+            (fake_user.email, fake_user.id, False, "invalid_password", "127.0.0.1"),
+            ("mordred@camelot.bt", None, False, "unknown_user", "127.0.0.1"),
+            (fake_user.phone, fake_user.id, True, None, "127.0.0.1"),
+        ]
+
+    async def test_attempts_are_read_by_keyset_pages(self, test_app_client, headers):
+        user_id = uuid.uuid4()
+        async with engine_async.connect() as connection:
+            await create_partition(connection, "login_attempt", datetime(2026, 1, 1))
+            for day in (1, 2, 3):
+                await connection.execute(
+                    INSERT_ATTEMPT, {"attempted_at": datetime(2026, 1, day), "user_id": user_id}
+                )
+            await connection.commit()
+        parameters = f"user_id={user_id}&start=2026-01-01T12:00:00&limit=1"
+        response = await test_app_client.get(f"/audit/logins?{parameters}", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert [attempt["attempted_at"] for attempt in page["items"]] == ["2026-01-03T00:00:00"]
+        response = await test_app_client.get(
+            f"/audit/logins?{parameters}&after={page['next']}", headers=headers
+        )
+        assert [attempt["attempted_at"] for attempt in response.json()["items"]] == [
+            "2026-01-02T00:00:00"
+        ]
+        response = await test_app_client.get(
+            f"/audit/logins?{parameters}&after={response.json()['next']}", headers=headers
+        )
+        assert response.json() == {"items": [], "next": None}
+        response = await test_app_client.get("/audit/logins?after=garbage", headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
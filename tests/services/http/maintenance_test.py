@@ -0,0 +1,113 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import status
+from fastapi_users.password import PasswordHelper
+from prometheus_client import REGISTRY
+from sqlalchemy import select, text
+from authenticity_product.models import User
+from authenticity_product.services.http.cache import principal_cache
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.maintenance import (
+    BatchedDelete,
+    Scheduler,
+    unverified_users,
+)
+
+
+def add_user(
+    db_dependency, name, days, is_verified=False, role="user", hashed_password="hashed"
+) -> User:
+    user = User(
+        email=f"{name}@camelot.bt",
+        hashed_password=hashed_password,
+        first_name=name,
+        last_name="knight",
+        phone=f"06{abs(hash(name)) % 10**8:08d}",
+        role=role,
+        is_verified=is_verified,
+        created_at=datetime.now() - timedelta(days=days),
+    )
+    db_dependency.add(user)
+    db_dependency.commit()
+    return user
+
+
+def emails(db_dependency) -> list[str]:
+    rows = db_dependency.scalars(select(User.email).order_by(User.email)).all()
+    db_dependency.commit()
+    return list(rows)
+
+
+def deleted_count(job: str) -> float:
+    return REGISTRY.get_sample_value("maintenance_deleted_rows_total", {"job": job}) or 0
+
+
+def runs_count(job: str, outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value("maintenance_runs_total", {"job": job, "outcome": outcome}) or 0
+    )
+
+
+@pytest.mark.asyncio
+class TestMaintenance:
+    async def test_long_unverified_users_are_deleted_by_batches(
+        self, db_dependency, test_app_client
+    ):
+        for name in ("bedivere", "gawain", "kay"):
+            add_user(db_dependency, name, days=40)
+        add_user(db_dependency, "lancelot", days=40, is_verified=True)
+        add_user(db_dependency, "percival", days=1)
+        add_user(db_dependency, "merlin", days=40, role="admin")
+        deleted = deleted_count("unverified_users")
+        assert await unverified_users.run(engine_async, 2, time.monotonic() + 60)
+        assert emails(db_dependency) == [
+            "lancelot@camelot.bt",
+            "merlin@camelot.bt",
+            "percival@camelot.bt",
+        ]
+        assert deleted_count("unverified_users") == deleted + 3
+        assert not await unverified_users.run(engine_async, 2, time.monotonic())
+
+    async def test_unverified_users_who_logged_in_are_kept(self, db_dependency, test_app_client):
+        add_user(db_dependency, "galahad", days=40, hashed_password=PasswordHelper().hash("grail"))
+        response = await test_app_client.post(
+            "/auth/jwt/login", data={"username": "galahad@camelot.bt", "password": "grail"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert await unverified_users.run(engine_async, 100, time.monotonic() + 60)
+        assert "galahad@camelot.bt" in emails(db_dependency)
+
+    async def test_deleted_users_are_dropped_from_the_principal_cache(self, db_dependency):
+        user = add_user(db_dependency, "dagonet", days=40)
+        principal_cache.set(user)
+        assert await unverified_users.run(engine_async, 100, time.monotonic() + 60)
+        assert principal_cache.get(user.id) is None
+
+    async def test_a_job_runs_on_the_replica_holding_its_lock_only(self, db_dependency):
+        add_user(db_dependency, "tristan", days=40)
+        scheduler = Scheduler(engine_async, [unverified_users], 60, 100, 10)
+        skipped = runs_count("unverified_users", "skipped")
+        async with engine_async.connect() as connection:
+            await connection.execute(
+                text("SELECT pg_advisory_lock(hashtext('maintenance:unverified_users'))")
+            )
+            assert await scheduler.run_once(unverified_users) == "skipped"
+            assert "tristan@camelot.bt" in emails(db_dependency)
+            await connection.execute(
+                text("SELECT pg_advisory_unlock(hashtext('maintenance:unverified_users'))")
+            )
+        assert await scheduler.run_once(unverified_users) == "completed"
+        assert "tristan@camelot.bt" not in emails(db_dependency)
+        assert runs_count("unverified_users", "skipped") == skipped + 1
+
+    async def test_a_failed_job_releases_its_lock(self):
+        broken = BatchedDelete("broken", "missing_table", "id", "true")
+        scheduler = Scheduler(engine_async, [broken], 60, 100, 10)
+        assert await scheduler.run_once(broken) == "failed"
+        assert await scheduler.run_once(broken) == "failed"
+        async with engine_async.connect() as connection:
+            assert await connection.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext('maintenance:broken'))")
+            )
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import status
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestMetrics:
+    async def test_pool_gauges(self, test_app_client):
+        body = (await test_app_client.get("/metrics")).text
+        assert 'db_pool_size{engine="asyncpg"}' in body
+        assert 'db_pool_size{engine="psycopg2"}' in body
+        assert 'db_pool_connections{engine="asyncpg",state="checked_out"}' in body
+
+    async def test_request_latency_by_route_template(self, test_app_client, fake_user):
+        data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+        token = (await test_app_client.post("/auth/jwt/login", data=data)).json()["access_token"]
+        await test_app_client.get(
+            f"/users/{fake_user.id}", headers={"Authorization": f"Bearer {token}"}
+        )
+        response = await test_app_client.get("/metrics")
+        assert response.status_code == status.HTTP_200_OK
+        body = response.text
+        assert (
+            'http_request_duration_seconds_count{method="POST",'
+            'route="/auth/jwt/login",status="200"}' in body
+        )
+        assert 'route="/users/{id}",status="403"' in body
+        assert str(fake_user.id) not in body
+
+    async def test_auth_operation_latency(self, test_app_client, fake_user):
+        data = {"username": "0664302870", "password": "guinevere"}
+        await test_app_client.post("/auth/jwt/login", data=data)
+        body = (await test_app_client.get("/metrics")).text
+        for operation in ("get_by_email_and_phone", "password_verify", "write_token"):
+            assert f'auth_operation_duration_seconds_count{{operation="{operation}"}}' in body
+
+    async def test_unmatched_routes_share_a_label(self, test_app_client):
+        await test_app_client.get("/no/such/route")
+        body = (await test_app_client.get("/metrics")).text
+        assert 'route="<unmatched>",status="404"' in body
+        assert "/no/such/route" not in body
@@ -0,0 +1,106 @@
+import logging
+
+import pytest
+from fastapi import status
+from authenticity_product.services.http import otp
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.otp import (
+    hash_code,
+    InMemoryOtpStore,
+    LogOtpSender,
+    PostgresOtpStore,
+)
+
+
+class RecordingSender:
+    def __init__(self):
+        self.codes: dict[str, str] = {}
+
+    async def send(self, phone, code):
+        self.codes[phone] = code
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    recording_sender = RecordingSender()
+    monkeypatch.setattr(otp, "otp_sender", recording_sender)
+    return recording_sender
+
+
+@pytest.mark.asyncio
+async def test_in_memory_code_is_single_use():
+    store = InMemoryOtpStore()
+    await store.save("0664302870", hash_code("0664302870", "123456"), ttl_in_seconds=60)
+    assert await store.verify("0664302870", hash_code("0664302870", "123456"), max_attempts=3)
+    assert not await store.verify("0664302870", hash_code("0664302870", "123456"), max_attempts=3)
+
+
+@pytest.mark.asyncio
+async def test_in_memory_code_is_dropped_after_max_attempts():
+    store = InMemoryOtpStore()
+    await store.save("0664302870", hash_code("0664302870", "123456"), ttl_in_seconds=60)
+    for wrong in ("000000", "111111"):
+        assert not await store.verify("0664302870", hash_code("0664302870", wrong), 2)
+    assert not await store.verify("0664302870", hash_code("0664302870", "123456"), 2)
+
+
+@pytest.mark.asyncio
+async def test_in_memory_code_expires():
+    store = InMemoryOtpStore()
+    await store.save("0664302870", hash_code("0664302870", "123456"), ttl_in_seconds=0)
+    await store.save("0664302871", hash_code("0664302871", "123456"), ttl_in_seconds=60)
+    assert list(store.codes) == ["0664302871"]
+    assert not await store.verify("0664302870", hash_code("0664302870", "123456"), 3)
+
+
+@pytest.mark.asyncio
+async def test_log_sender_never_logs_the_code(caplog):
+    with caplog.at_level(logging.INFO):
+        await LogOtpSender().send("0664302870", "123456")
+    assert "0664302870" in caplog.text
+    assert "123456" not in caplog.text
+
+
+def test_codes_are_shared_by_the_workers():
+    assert isinstance(otp.otp_store, PostgresOtpStore)
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestPhoneOtp:
+    async def test_postgres_store(self, test_app_client):
+        store = PostgresOtpStore(engine_async)
+        code_hash = hash_code("0664302879", "123456")
+        await store.save("0664302879", code_hash, ttl_in_seconds=60)
+        assert not await store.verify("0664302879", hash_code("0664302879", "000000"), 2)
+        assert await store.verify("0664302879", code_hash, 2)
+        assert not await store.verify("0664302879", code_hash, 2)
+        await store.save("0664302879", code_hash, ttl_in_seconds=60)
+        for wrong in ("000000", "111111"):
+            assert not await store.verify("0664302879", hash_code("0664302879", wrong), 2)
+        assert not await store.verify("0664302879", code_hash, 2)
+
+    async def test_unknown_phone_is_not_revealed(self, test_app_client, sender):
+        response = await test_app_client.post(
+            "/auth/otp/request", json={"phone_number": "0770000000"}
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert sender.codes == {}
+
+    async def test_invalid_phone(self, test_app_client, sender):
+        response = await test_app_client.post("/auth/otp/request", json={"phone_number": "12"})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_code_is_exchanged_for_a_token(self, test_app_client, fake_user, sender):
+        response = await test_app_client.post(
+            "/auth/otp/request", json={"phone_number": fake_user.phone}
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        json = {"phone_number": fake_user.phone, "code": sender.codes[fake_user.phone]}
+        response = await test_app_client.post("/auth/otp/verify", json=json)
+        assert response.status_code == status.HTTP_200_OK
+        token = response.json()["access_token"]
+        me = await test_app_client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert me.json()["id"] == str(fake_user.id)
+        response = await test_app_client.post("/auth/otp/verify", json=json)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,128 @@
+import logging
+
+import pytest
+from sqlalchemy import select
+from authenticity_product.models import OutboxMessage, User
+from authenticity_product.services.http.db_async import async_session_maker
+from authenticity_product.services.http.outbox import (
+    create_message,
+    LogSender,
+    outbox_dispatcher,
+    OutboxDispatcher,
+    USER_FORGOT_PASSWORD,
+    USER_REGISTERED,
+)
+
+
+class RecordingSender:
+    def __init__(self, failing_event: str = "", failures: int = 0):
+        self.failing_event = failing_event
+        self.failures = failures
+        self.sent: list[str] = []
+
+    async def send(self, message):
+        if message.event == self.failing_event and self.failures:
+            self.failures -= 1
+            raise ConnectionError("provider down")
+        self.sent.append(message.idempotency_key)
+
+
+async def get_messages(event):
+    async with async_session_maker() as session:
+        statement = select(OutboxMessage).where(OutboxMessage.event == event)
+        return (await session.execute(statement)).scalars().all()
+
+
+@pytest.fixture
+async def stopped_dispatcher(test_app_client):
+    await outbox_dispatcher.stop()
+    yield
+    await outbox_dispatcher.start()
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestOutbox:
+    async def test_registration_writes_a_message(self, test_app_client, stopped_dispatcher):
+        json = {
+            "email": "percival@camelot.bt",
+            "first_name": "percival",
+            "last_name": "de galles",
+            "civility": "Mr",
+            "phone": "0664302871",
+            "password": "graal",
+            "role": "user",
+        }
+        user_id = (await test_app_client.post("/auth/register", json=json)).json()["id"]
+        messages = await get_messages(USER_REGISTERED)
+        registered = [message for message in messages if message.payload["user_id"] == user_id]
+        assert len(registered) == 1
+        assert registered[0].idempotency_key == f"{USER_REGISTERED}:{user_id}"
+        assert registered[0].sent_at is None
+
+    async def test_dispatcher_retries_failed_messages(self, test_app_client, stopped_dispatcher):
+        async with async_session_maker() as session:
+            session.add_all(create_message("test.event", {"index": index}) for index in range(3))
+            await session.commit()
+        sender = RecordingSender("test.event", failures=1)
+        dispatcher = OutboxDispatcher(
+            async_session_maker, sender, batch_size=10, base_backoff_in_seconds=0
+        )
+        while await dispatcher.dispatch_batch():
+            pass
+        messages = await get_messages("test.event")
+        sent = [key for key in sender.sent if key.startswith("test.event:")]
+        assert sorted(sent) == sorted(message.idempotency_key for message in messages)
+        assert all(message.sent_at is not None for message in messages)
+        assert sorted(message.attempts for message in messages) == [1, 1, 2]
+
+    async def test_dispatcher_abandons_after_max_attempts(
+        self, test_app_client, stopped_dispatcher
+    ):
+        async with async_session_maker() as session:
+            session.add(create_message("test.abandoned", {"index": 0}))
+            await session.commit()
+        dispatcher = OutboxDispatcher(
+            async_session_maker,
+            RecordingSender("test.abandoned", failures=5),
+            max_attempts=2,
+            base_backoff_in_seconds=0,
+        )
+        while await dispatcher.dispatch_batch():
+            pass
+        [message] = await get_messages("test.abandoned")
+        assert message.attempts == 2
+        assert message.sent_at is None
+        assert "provider down" in message.last_error
+
+    async def test_forgot_password_writes_a_message(self, test_app_client, fake_user):
+        await outbox_dispatcher.stop()
+        try:
+            json = {"email": "king.arthur@camelot.bt"}
+            await test_app_client.post("/auth/forgot-password", json=json)
+            messages = await get_messages(USER_FORGOT_PASSWORD)
+        finally:
+            await outbox_dispatcher.start()
+        assert [message.payload["user_id"] for message in messages] == [str(fake_user.id)]
+        assert messages[0].payload["token"]
+
+    async def test_other_sessions_write_no_message(self, db_dependency, stopped_dispatcher):
+        user = User(
+            email="dagonet@camelot.bt",
+            hashed_password="hashed",
+            first_name="dagonet",
+            last_name="fool",
+            phone="0664302879",
+            role="user",
+        )
+        db_dependency.add(user)
+        db_dependency.commit()
+        messages = await get_messages(USER_REGISTERED)
+        assert str(user.id) not in [message.payload["user_id"] for message in messages]
+
+    async def test_log_sender_never_logs_tokens(self, caplog):
+        message = create_message(USER_FORGOT_PASSWORD, {"user_id": "1", "token": "secret-token"})
+        with caplog.at_level(logging.INFO):
+            await LogSender().send(message)
+        assert USER_FORGOT_PASSWORD in caplog.text
+        assert "secret-token" not in caplog.text
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+from fastapi import status
+from authenticity_product.services.http.profiling import ProfilingMiddleware
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestProfiling:
+    async def test_header_without_admin_token_is_ignored(self, test_app_client):
+        response = await test_app_client.get("/metrics", headers={"X-Profile": "1"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain")
+
+    async def test_admin_header_returns_speedscope_profile(self, test_app_client, headers):
+        response = await test_app_client.get("/users/me", headers={**headers, "X-Profile": "1"})
+        assert response.status_code == status.HTTP_200_OK
+        assert "attachment" in response.headers["content-disposition"]
+        profile = response.json()
+        assert profile["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+        assert profile["profiles"]
+
+    async def test_sampled_requests_are_stored(self, tmp_path):
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def receive():
+            return {"type": "http.request", "body": b""}
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        middleware = ProfilingMiddleware(app, sample_rate=1.0, output_dir=str(tmp_path))
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": []}
+        await middleware(scope, receive, send)
+        assert messages[0]["status"] == 204
+        (profile,) = tmp_path.glob("*.speedscope.json")
+        assert "profiles" in json.loads(profile.read_text())
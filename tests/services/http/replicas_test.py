@@ -0,0 +1,97 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from authenticity_product.services.http import replicas
+from authenticity_product.services.http.replicas import Replica, ReplicaSet, RoutingSession
+
+
+def create_replica(host: str) -> Replica:
+    """Use the test database as a stand-in replica, it is never in recovery so its lag is 0."""
+    credentials = f"{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+    return Replica(
+        host,
+        create_async_engine(f"postgresql+asyncpg://{credentials}@{host}/{os.getenv('DB_NAME')}"),
+        create_engine(f"postgresql+psycopg2://{credentials}@{host}/{os.getenv('DB_NAME')}"),
+    )
+
+
+@pytest.fixture
+def primary():
+    engine = create_async_engine(
+        f"postgresql+asyncpg://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@"
+        f"{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+    )
+    yield engine
+    engine.sync_engine.dispose()
+
+
+def make_session_maker(primary, replica_set):
+    return sessionmaker(
+        class_=AsyncSession,
+        expire_on_commit=False,
+        sync_session_class=RoutingSession,
+        primary=primary.sync_engine,
+        replica_set=replica_set,
+        use_async_engines=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_a_healthy_replica(primary):
+    replica = create_replica(os.environ["DB_HOST"])
+    replica_set = ReplicaSet([replica], max_lag_in_seconds=5)
+    await replica_set.probe()
+    assert replica.healthy and replica.lag_in_seconds == 0
+
+    async with make_session_maker(primary, replica_set)() as session:
+        await session.execute(select(func.now()))
+        assert (
+            session.sync_session.get_bind(clause=select(func.now()))
+            is replica.engine_async.sync_engine
+        )
+        assert session.info["replica"] is replica
+        assert not session.info.get("use_primary")
+
+
+@pytest.mark.asyncio
+async def test_reads_after_a_write_stick_to_the_primary(primary):
+    replica = create_replica(os.environ["DB_HOST"])
+    replica_set = ReplicaSet([replica], max_lag_in_seconds=5)
+    await replica_set.probe()
+
+    async with make_session_maker(primary, replica_set)() as session:
+        await session.execute(select(func.now()))
+        await session.execute(text("SELECT pg_advisory_xact_lock(31)"))
+        assert session.info["use_primary"]
+        assert session.sync_session.get_bind(clause=select(func.now())) is primary.sync_engine
+        await session.rollback()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back_to_the_primary(primary):
+    unreachable = create_replica("127.0.0.1:1")
+    replica_set = ReplicaSet([unreachable], max_lag_in_seconds=5, probe_timeout_in_seconds=1)
+    await replica_set.probe()
+    assert not unreachable.healthy
+    assert replica_set.pick() is None
+
+    async with make_session_maker(primary, replica_set)() as session:
+        await session.execute(select(func.now()))
+        assert session.sync_session.get_bind(clause=select(func.now())) is primary.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_is_not_picked(monkeypatch):
+    lagging, healthy = create_replica(os.environ["DB_HOST"]), create_replica(os.environ["DB_HOST"])
+    replica_set = ReplicaSet([lagging, healthy], max_lag_in_seconds=5)
+    await replica_set.probe()
+    assert lagging.healthy and healthy.healthy
+
+    # the replica measures a lag above the maximum on its next probe
+    monkeypatch.setattr(replicas, "LAG_STATEMENT", text("SELECT 30.5"))
+    await replica_set.probe_replica(lagging)
+    assert not lagging.healthy and lagging.lag_in_seconds == 30.5
+    assert {replica_set.pick() for _ in range(4)} == {healthy}
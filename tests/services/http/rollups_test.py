@@ -0,0 +1,154 @@
+import json
+from datetime import date, datetime
+
+import pytest
+from fastapi import status
+from sqlalchemy import select, text
+from authenticity_product.models import Product, ScanEvent, ScanRollup
+from authenticity_product.services.http.config import settings
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.partitions import create_partition, month_start
+from authenticity_product.services.http.rollups import RollupJob
+
+
+INSERT_EVENT = text(
+    "INSERT INTO scan_event (scanned_at, code, product_id, result, country) "
+    "VALUES (:scanned_at, 'ROLLEDUP', :product_id, :result, :country)"
+)
+
+
+@pytest.fixture(scope="module")
+@pytest.mark.asyncio
+async def partition(db_dependency):
+    async with engine_async.connect() as connection:
+        await create_partition(connection, "scan_event", month_start(datetime.now()))
+
+
+def add_event(db_dependency, product_id, result="authentic", country="DZ"):
+    db_dependency.add(
+        ScanEvent(
+            scanned_at=datetime.now(),
+            code="ROLLEDUP",
+            product_id=product_id,
+            result=result,
+            country=country,
+        )
+    )
+    db_dependency.commit()
+
+
+def rollups(db_dependency, product) -> list[tuple]:
+    rows = db_dependency.execute(
+        select(ScanRollup.country, ScanRollup.scans, ScanRollup.authentic)
+        .where(ScanRollup.product_id == product.id)
+        .order_by(ScanRollup.country)
+    ).all()
+    db_dependency.commit()
+    return [tuple(row) for row in rows]
+
+
+@pytest.mark.asyncio
+class TestRollupJob:
+    async def test_new_events_are_added_to_the_rollups_once(
+        self, db_dependency, product, partition
+    ):
+        job = RollupJob(60, batch_size=2)
+        for result, country in (("authentic", "DZ"), ("authentic", "DZ"), ("revoked", None)):
+            add_event(db_dependency, product.id, result, country)
+        add_event(db_dependency, None, "unknown")
+        await job.catch_up()
+        assert rollups(db_dependency, product) == [("", 1, 0), ("DZ", 2, 2)]
+        await job.catch_up()
+        add_event(db_dependency, product.id)
+        await job.catch_up()
+        assert rollups(db_dependency, product) == [("", 1, 0), ("DZ", 3, 3)]
+
+    async def test_events_committed_after_higher_ids_are_waited_for(
+        self, db_dependency, product, partition
+    ):
+        job = RollupJob(60, batch_size=100)
+        async with engine_async.connect() as connection:
+            await connection.execute(
+                INSERT_EVENT,
+                {
+                    "scanned_at": datetime.now(),
+                    "product_id": product.id,
+                    "result": "authentic",
+                    "country": "TN",
+                },
+            )
+            add_event(db_dependency, product.id, country="TN")
+            await job.catch_up()
+            assert rollups(db_dependency, product) == [("", 1, 0), ("DZ", 3, 3)]
+            await connection.commit()
+        await job.catch_up()
+        assert rollups(db_dependency, product) == [("", 1, 0), ("DZ", 3, 3), ("TN", 2, 2)]
+        await job.catch_up()
+        assert not job._gaps
+
+
+@pytest.fixture(scope="module")
+def dashboard(db_dependency):
+    product = Product(name="Watch")
+    db_dependency.add(product)
+    db_dependency.commit()
+    db_dependency.add_all(
+        ScanRollup(
+            product_id=product.id, day=date(2026, 1, day), country=country, scans=day, authentic=day
+        )
+        for day in (1, 2, 3)
+        for country in ("DZ", "TN")
+    )
+    db_dependency.commit()
+    return product
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestAnalyticsRoutes:
+    async def test_rollups_are_read_by_keyset_pages(self, test_app_client, headers, dashboard):
+        parameters = f"product_id={dashboard.id}&start=2026-01-02&limit=3"
+        response = await test_app_client.get(f"/analytics/scans?{parameters}", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        assert [(row["day"], row["country"]) for row in page["items"]] == [
+            ("2026-01-02", "DZ"),
+            ("2026-01-02", "TN"),
+            ("2026-01-03", "DZ"),
+        ]
+        response = await test_app_client.get(
+            f"/analytics/scans?{parameters}&after={page['next']}", headers=headers
+        )
+        assert response.json() == {
+            "items": [
+                {
+                    "product_id": dashboard.id,
+                    "day": "2026-01-03",
+                    "country": "TN",
+                    "scans": 3,
+                    "authentic": 3,
+                }
+            ],
+            "next": None,
+        }
+        response = await test_app_client.get("/analytics/scans?after=garbage", headers=headers)
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_rollups_are_exported_as_csv_or_ndjson(
+        self, test_app_client, headers, dashboard, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "rollup_export_page_size", 4)
+        response = await test_app_client.get(
+            f"/analytics/scans/export?product_id={dashboard.id}&country=DZ", headers=headers
+        )
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.text.splitlines() == [
+            "product_id,day,country,scans,authentic",
+            *(f"{dashboard.id},2026-01-0{day},DZ,{day},{day}" for day in (1, 2, 3)),
+        ]
+        response = await test_app_client.get(
+            f"/analytics/scans/export?product_id={dashboard.id}&format=ndjson", headers=headers
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 6
+        assert lines[-1]["day"] == "2026-01-03" and lines[-1]["country"] == "TN"
@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import status
+from prometheus_client import REGISTRY
+from sqlalchemy import func, select, text
+from authenticity_product.models import Product, ScanEvent, SerialCode
+from authenticity_product.services.http.batch_writer import BatchWriter
+from authenticity_product.services.http.partitions import next_month
+from authenticity_product.services.http.scan_events import SCAN_EVENT_COLUMNS
+from authenticity_product.services.http.verification import generate_code
+
+
+def rows_count(outcome: str) -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "batch_writer_rows_total", {"table": "scan_event", "outcome": outcome}
+        )
+        or 0
+    )
+
+
+def event(scanned_at: datetime, code: str = "TESTCODE") -> tuple:
+    return (scanned_at, code, None, "unknown", None, None, None, None)
+
+
+def count_events(db_dependency, code: str) -> int:
+    count = db_dependency.scalar(
+        select(func.count()).select_from(ScanEvent).where(ScanEvent.code == code)
+    )
+    # the writers attach partitions, which waits for the transactions reading the table
+    db_dependency.commit()
+    return count
+
+
+def test_months_follow_each_other():
+    assert next_month(datetime(2026, 11, 1)) == datetime(2026, 12, 1)
+    assert next_month(datetime(2026, 12, 1)) == datetime(2027, 1, 1)
+
+
+@pytest.mark.asyncio
+class TestBatchWriter:
+    async def test_rows_are_written_by_size_and_time_in_monthly_partitions(self, db_dependency):
+        writer = BatchWriter(
+            "scan_event",
+            SCAN_EVENT_COLUMNS,
+            "scanned_at",
+            batch_size=3,
+            flush_interval_in_seconds=0.05,
+        )
+        await writer.start()
+        try:
+            for day in (1, 2, 3):
+                writer.add(event(datetime(2026, 1, day), "BATCHED"))
+            writer.add(event(datetime(2026, 2, 1), "BATCHED"))
+            await asyncio.sleep(0.3)
+        finally:
+            await writer.stop()
+        assert count_events(db_dependency, "BATCHED") == 4
+        partitions = db_dependency.scalars(
+            text(
+                "SELECT relname FROM pg_inherits JOIN pg_class ON pg_class.oid = inhrelid "
+                "WHERE inhparent = 'scan_event'::regclass ORDER BY relname"
+            )
+        ).all()
+        db_dependency.commit()
+        assert {"scan_event_p202601", "scan_event_p202602", "scan_event_p202603"} <= set(partitions)
+
+    async def test_rows_beyond_the_queue_are_dropped(self):
+        writer = BatchWriter("scan_event", SCAN_EVENT_COLUMNS, "scanned_at", queue_size=2)
+        dropped = rows_count("dropped")
+        assert [writer.add(event(datetime.now())) for _ in range(3)] == [True, True, False]
+        assert rows_count("dropped") == dropped + 1
+
+    async def test_queued_rows_are_written_on_stop(self, db_dependency):
+        writer = BatchWriter(
+            "scan_event", SCAN_EVENT_COLUMNS, "scanned_at", flush_interval_in_seconds=60
+        )
+        await writer.start()
+        for _ in range(5):
+            writer.add(event(datetime.now(), "STOPPED"))
+        await asyncio.sleep(0.05)
+        await writer.stop()
+        assert count_events(db_dependency, "STOPPED") == 5
+
+    async def test_rows_left_after_the_shutdown_timeout_are_lost(self, db_dependency):
+        writer = BatchWriter(
+            "scan_event", SCAN_EVENT_COLUMNS, "scanned_at", shutdown_timeout_in_seconds=0
+        )
+        lost = rows_count("lost")
+        for _ in range(5):
+            writer.add(event(datetime.now(), "LOST"))
+        await writer.stop()
+        assert rows_count("lost") == lost + 5
+        assert writer.queue.empty()
+
+    async def test_rows_being_written_when_the_shutdown_timeout_expires_are_lost(
+        self, monkeypatch
+    ):
+        writer = BatchWriter(
+            "scan_event",
+            SCAN_EVENT_COLUMNS,
+            "scanned_at",
+            flush_interval_in_seconds=0,
+            shutdown_timeout_in_seconds=0.05,
+        )
+        writing = asyncio.Event()
+
+        async def write(batch):
+            writing.set()
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(writer, "write", write)
+        await writer.start()
+        for _ in range(3):
+            writer.add(event(datetime.now(), "INTERRUPTED"))
+        await asyncio.wait_for(writing.wait(), 5)
+        lost, failed = rows_count("lost"), rows_count("failed")
+        await writer.stop()
+        assert rows_count("lost") == lost + 3
+        assert rows_count("failed") == failed
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestScanRecording:
+    async def test_scans_are_recorded_with_their_coarse_location(
+        self, test_app_client, db_dependency
+    ):
+        product = Product(name="Perfume")
+        db_dependency.add(product)
+        db_dependency.commit()
+        code = generate_code()
+        db_dependency.add(SerialCode(code=code, product_id=product.id))
+        db_dependency.commit()
+        response = await test_app_client.get(
+            f"/verify/{code}?lat=36.7538&lon=3.0588",
+            headers={"CF-IPCountry": "DZ", "User-Agent": "scanner/1.0"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        unknown = generate_code()
+        await test_app_client.get(f"/verify/{unknown}")
+        for _ in range(30):
+            if count_events(db_dependency, code) and count_events(db_dependency, unknown):
+                break
+            await asyncio.sleep(0.1)
+        recorded = (
+            db_dependency.execute(
+                select(ScanEvent).where(ScanEvent.code.in_([code, unknown])).order_by(ScanEvent.id)
+            )
+            .scalars()
+            .all()
+        )
+        db_dependency.commit()
+        assert [
+            (e.product_id, e.result, e.country, e.latitude, e.longitude, e.client) for e in recorded
+        ] == [
+            (product.id, "authentic", "DZ", 36.8, 3.1, "scanner/1.0"),
+            (None, "unknown", None, None, None, f"python-httpx/{httpx.__version__}"),
+        ]
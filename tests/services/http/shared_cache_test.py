@@ -0,0 +1,104 @@
+import multiprocessing
+import pickle
+import time
+import uuid
+from datetime import date, datetime
+
+import pytest
+from authenticity_product.services.http.cache import TokenCache, TTLCache
+from authenticity_product.services.http.shared_cache import (
+    hash_key,
+    SharedMemoryCache,
+    SLOT_HEADER,
+)
+
+
+class Payload:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit",))
+
+
+@pytest.fixture
+def shared_cache():
+    cache = SharedMemoryCache(f"test_{uuid.uuid4().hex[:16]}", 16, 256, 60)
+    yield cache
+    cache.unlink()
+
+
+def read_in_child(name, key, results):
+    results.put(SharedMemoryCache(name, 16, 256, 60).get(key))
+
+
+def test_values_expire_and_are_deleted(shared_cache):
+    shared_cache.set("a", {"id": 1})
+    shared_cache.set("b", "short", ttl_in_seconds=-1)
+    assert shared_cache.get("a") == {"id": 1}
+    assert shared_cache.get("b") is None
+    shared_cache.delete("a")
+    assert shared_cache.get("a") is None
+
+
+def test_clear_starts_a_new_generation(shared_cache):
+    shared_cache.set("a", 1)
+    shared_cache.clear()
+    assert shared_cache.get("a") is None
+    shared_cache.set("a", 2)
+    assert shared_cache.get("a") == 2
+
+
+def test_values_too_large_are_not_cached(shared_cache):
+    shared_cache.set("a", "x" * 1024)
+    assert shared_cache.get("a") is None
+
+
+def test_values_keep_their_types(shared_cache):
+    values = {
+        "id": uuid.uuid4(),
+        "created_at": datetime(2024, 1, 2, 3, 4, 5),
+        "birthday": date(2000, 1, 1),
+        "body": b'{"authentic":true}',
+        "is_active": True,
+    }
+    shared_cache.set("a", values)
+    assert shared_cache.get("a") == values
+    shared_cache.set("b", (1, b"body"))
+    assert shared_cache.get("b") == [1, b"body"]
+
+
+def test_pickled_values_are_never_loaded(shared_cache):
+    key_hash, generation = hash_key("a"), shared_cache.generation
+    offset = shared_cache.offsets(key_hash)[0]
+    shared_cache.write(offset, key_hash, generation, time.time() + 60, pickle.dumps(Payload()))
+    assert shared_cache.get("a") is None
+
+
+def test_slot_being_written_reads_as_miss(shared_cache):
+    shared_cache.set("a", 1)
+    for offset in shared_cache.offsets(hash_key("a")):
+        if SLOT_HEADER.unpack_from(shared_cache.buffer, offset)[2] == hash_key("a"):
+            shared_cache.buffer[offset] |= 1
+    assert shared_cache.get("a") is None
+
+
+def test_values_are_shared_with_other_processes(shared_cache):
+    shared_cache.set("a", "from parent")
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    process = context.Process(target=read_in_child, args=(shared_cache.memory.name, "a", results))
+    process.start()
+    assert results.get(timeout=10) == "from parent"
+    process.join()
+
+
+def test_another_geometry_is_rejected(shared_cache):
+    with pytest.raises(ValueError):
+        SharedMemoryCache(shared_cache.memory.name, 32, 256, 60)
+
+
+def test_token_cache_never_outlives_the_token():
+    cache = TokenCache(TTLCache(10, 60))
+    cache.set("valid", "user", time.time() + 60)
+    cache.set("expired", "user", time.time() - 1)
+    assert cache.get("valid") == "user"
+    assert cache.get("expired") is None
+    assert "valid" not in cache.backend._entries
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from fastapi import status
+from sqlalchemy import event
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.signed_codes import (
+    CodeSigner,
+    get_code_signer,
+    revocation_list,
+)
+from authenticity_product.verifier import InvalidCode, main, SignedCode, Verifier
+
+
+@pytest.mark.parametrize(
+    "private_key, length",
+    [
+        (ed25519.Ed25519PrivateKey.generate(), 127),
+        (ec.generate_private_key(ec.SECP256R1()), 127),
+        (rsa.generate_private_key(65537, 2048), 434),
+    ],
+)
+def test_codes_are_verified_offline(private_key, length):
+    signer = CodeSigner(private_key)
+    code = signer.sign(42, 2**63)
+    assert len(code) == length
+    verifier = Verifier.from_pem(signer.public_pem().encode())
+    assert verifier.verify(code.lower()) == SignedCode(42, 2**63, signer.key_id)
+
+
+def test_tampered_and_foreign_codes_are_rejected():
+    signer = CodeSigner(ed25519.Ed25519PrivateKey.generate())
+    verifier = Verifier([signer.private_key.public_key()])
+    code = signer.sign(1, 1)
+    tampered = code[:20] + ("0" if code[20] != "0" else "1") + code[21:]
+    with pytest.raises(InvalidCode, match="Invalid signature|Unknown key"):
+        verifier.verify(tampered)
+    with pytest.raises(InvalidCode, match="Unknown key"):
+        verifier.verify(CodeSigner(ed25519.Ed25519PrivateKey.generate()).sign(1, 1))
+    with pytest.raises(InvalidCode, match="Malformed code"):
+        verifier.verify(code[:10])
+
+
+def test_other_spellings_of_a_code_are_rejected():
+    signer = CodeSigner(ed25519.Ed25519PrivateKey.generate())
+    verifier = Verifier([signer.private_key.public_key()])
+    code = signer.sign(1, 1)
+    assert verifier.verify(f"{code[:8]}-{code[8:].lower()}").serial == 1
+    # the last character carries unused bits, and I, L, O and U are outside the alphabet
+    respellings = [code[:-1] + last for last in "0123456789ABCDEFGHJKMNPQRSTVWXYZ"]
+    respellings += [code.replace(digit, letter) for digit, letter in zip("1101", "ILOU")]
+    for respelling in set(respellings) - {code}:
+        with pytest.raises(InvalidCode):
+            verifier.verify(respelling)
+
+
+def test_command_line_verifier(tmp_path, capsys):
+    signer = CodeSigner(ec.generate_private_key(ec.SECP256R1()))
+    key = tmp_path / "issuer.pem"
+    key.write_text(signer.public_pem())
+    assert main(["--key", str(key), signer.sign(7, 8)]) == 0
+    assert json.loads(capsys.readouterr().out) == {
+        "authentic": True,
+        "product_id": 7,
+        "serial": 8,
+        "key_id": signer.key_id,
+    }
+    assert main(["--key", str(key), "ABCDEFGH" * 16]) == 1
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestSignedCodeVerification:
+    async def test_signed_code_is_verified_without_product_query(self, test_app_client, product):
+        code = get_code_signer().sign(product.id, 1)
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if "code" in statement:
+                statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", count)
+        try:
+            first = await test_app_client.get(f"/verify/{code}")
+            second = await test_app_client.get(f"/verify/{code}")
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", count)
+        assert first.status_code == second.status_code == status.HTTP_200_OK
+        assert first.json() == {"authentic": True, "product": {"id": product.id}, "serial": 1}
+        assert len(statements) == 1
+        assert "revoked_code" in statements[0]
+
+    async def test_revoked_code_is_gone(self, test_app_client, product):
+        code = get_code_signer().sign(product.id, 2)
+        assert (await test_app_client.get(f"/verify/{code}")).status_code == status.HTTP_200_OK
+        await revocation_list.revoke(product.id, 2, "stolen batch")
+        response = await test_app_client.get(f"/verify/{code}")
+        assert response.status_code == status.HTTP_410_GONE
+        assert response.json() == {"detail": "Revoked code"}
+
+    async def test_forged_code_is_rejected(self, test_app_client):
+        forged = CodeSigner(ed25519.Ed25519PrivateKey.generate()).sign(1, 3)
+        response = await test_app_client.get(f"/verify/{forged}")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_public_keys_verify_the_codes(self, test_app_client, product):
+        response = await test_app_client.get("/verify/keys")
+        assert response.status_code == status.HTTP_200_OK
+        verifier = Verifier.from_pem(*(key["pem"].encode() for key in response.json()["keys"]))
+        code = get_code_signer().sign(product.id, 4)
+        assert verifier.verify(code).serial == 4
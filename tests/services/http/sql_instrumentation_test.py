@@ -0,0 +1,89 @@
+import logging
+import os
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, exc, text
+from authenticity_product.services.http.sql_instrumentation import (
+    current_query_stats,
+    QueryInstrumentation,
+    RequestQueryStats,
+)
+
+
+@pytest.fixture
+def instrumented_engine():
+    engine = create_engine(
+        f"postgresql+psycopg2://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@"
+        f"{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+    )
+    QueryInstrumentation(
+        slow_query_threshold_in_ms=0, explain_slow_queries=True, repeated_query_threshold=3
+    ).instrument(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_queries_are_counted_per_request(instrumented_engine):
+    stats = RequestQueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        with instrumented_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+    finally:
+        current_query_stats.reset(token)
+    assert stats.count == 2
+    assert stats.duration > 0
+
+
+def test_slow_query_is_logged_redacted_with_plan(instrumented_engine, caplog):
+    with caplog.at_level(logging.WARNING):
+        with instrumented_engine.connect() as connection:
+            connection.execute(text("SELECT :secret AS value"), {"secret": "hunter2"})
+    messages = "\n".join(record.getMessage() for record in caplog.records)
+    assert "Slow query" in messages
+    assert "hunter2" not in messages
+    assert "{'secret': '?'}" in messages
+    assert "Result" in messages
+
+
+def test_unexplainable_slow_query_keeps_the_transaction(instrumented_engine, caplog):
+    with caplog.at_level(logging.WARNING):
+        with instrumented_engine.begin() as connection:
+            connection.execute(text("SET LOCAL statement_timeout = 0"))
+            assert connection.execute(text("SELECT 1")).scalar() == 1
+    assert any("SET LOCAL" in record.getMessage() for record in caplog.records)
+
+
+def test_failed_statement_is_not_timed(instrumented_engine):
+    with instrumented_engine.connect() as connection:
+        with pytest.raises(exc.ProgrammingError):
+            connection.execute(text("SELECT * FROM missing_table"))
+        connection.rollback()
+        assert not connection.info.get("query_start_time")
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_repeated_statement_is_reported(instrumented_engine, caplog):
+    token = current_query_stats.set(RequestQueryStats())
+    try:
+        with caplog.at_level(logging.WARNING):
+            with instrumented_engine.connect() as connection:
+                for _ in range(4):
+                    connection.execute(text("SELECT 1"))
+    finally:
+        current_query_stats.reset(token)
+    assert sum("N+1" in record.getMessage() for record in caplog.records) == 1
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestServerTiming:
+    async def test_login_reports_queries(self, test_app_client, fake_user):
+        data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+        response = await test_app_client.post("/auth/jwt/login", data=data)
+        assert response.status_code == status.HTTP_200_OK
+        server_timing = response.headers["server-timing"]
+        assert server_timing.startswith("db;dur=")
+        assert 'desc="1 queries"' in server_timing
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from asgi_lifespan import LifespanManager
+from fastapi import status
+from benchmarks.startup import measure_first_request, measure_import, MODULE
+from authenticity_product.services.http import entrypoint
+from authenticity_product.services.http.health import health_monitor
+
+
+IMPORT_BUDGET_IN_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_IN_MS", "3000"))
+FIRST_REQUEST_BUDGET_IN_MS = float(os.getenv("STARTUP_FIRST_REQUEST_BUDGET_IN_MS", "6000"))
+
+
+def test_import_does_not_fetch_keys():
+    env = {**os.environ, "FASTAPI_USERS_RSA_KEY_URL": "http://127.0.0.1:9/unreachable"}
+    env["PUBLIC_KEY_URL"] = env["FASTAPI_USERS_RSA_KEY_URL"]
+    result = subprocess.run(
+        [sys.executable, "-c", f"import {MODULE}"], env=env, capture_output=True, check=False
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_import_time_within_budget():
+    total, slowest = measure_import()
+    assert total < IMPORT_BUDGET_IN_MS, slowest
+
+
+def test_first_request_within_budget(db_dependency):
+    assert measure_first_request() < FIRST_REQUEST_BUDGET_IN_MS
+
+
+@pytest.mark.asyncio
+async def test_failed_startup_stops_the_started_tasks(db_dependency, monkeypatch):
+    async def fail():
+        raise RuntimeError("scan event writer unavailable")
+
+    monkeypatch.setattr(entrypoint.scan_event_writer, "start", fail)
+    with pytest.raises(RuntimeError):
+        async with LifespanManager(entrypoint.create_app()):
+            pass
+    assert health_monitor._task is None
+
+
+@pytest.mark.asyncio
+async def test_failed_key_fetch_fails_startup(monkeypatch):
+    def unreachable():
+        raise ConnectionError("key server down")
+
+    for name in ("get_rsa_key", "get_product_code_key"):
+        with monkeypatch.context() as patch:
+            patch.setattr(entrypoint, name, unreachable)
+            with pytest.raises(ConnectionError):
+                async with LifespanManager(entrypoint.create_app()):
+                    pass
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+async def test_admin_requires_an_admin_login(test_app_client):
+    response = await test_app_client.get("/admin/user/list")
+    assert response.status_code in (status.HTTP_302_FOUND, status.HTTP_303_SEE_OTHER)
+    assert "/admin/login" in response.headers["location"]
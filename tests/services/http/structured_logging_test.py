@@ -0,0 +1,72 @@
+import json
+import logging
+import queue
+
+import pytest
+from fastapi import status
+from authenticity_product.services.http.structured_logging import (
+    bind_log_context,
+    ContextQueueHandler,
+    JsonFormatter,
+    log_context,
+    SamplingFilter,
+)
+
+
+class Route:
+    path = "/users/{id}"
+
+
+def make_record(message="hello %s", args=("world",), **extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_records_carry_the_request_context():
+    log_queue = queue.SimpleQueue()
+    handler = ContextQueueHandler(log_queue)
+    token = log_context.set({"request_id": "abc", "scope": {"route": Route()}})
+    try:
+        bind_log_context(user_id="42")
+        handler.emit(make_record())
+    finally:
+        log_context.reset(token)
+    record = log_queue.get_nowait()
+    assert (record.request_id, record.user_id, record.route) == ("abc", "42", "/users/{id}")
+    assert record.msg == "hello world" and record.args is None
+
+
+def test_json_formatter_writes_extra_fields():
+    document = json.loads(JsonFormatter().format(make_record(event="user.login", user_id="42")))
+    assert document["message"] == "hello world"
+    assert document["level"] == "INFO"
+    assert document["event"] == "user.login"
+    assert document["user_id"] == "42"
+    assert "timestamp" in document
+
+
+def test_sampling_keeps_errors():
+    sampling = SamplingFilter(rate=0)
+    assert not sampling.filter(make_record(status=200))
+    assert sampling.filter(make_record(status=503))
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestRequestId:
+    async def test_request_id_is_generated(self, test_app_client):
+        response = await test_app_client.get("/healthz")
+        assert len(response.headers["x-request-id"]) == 32
+
+    async def test_request_id_is_propagated(self, test_app_client):
+        response = await test_app_client.get("/healthz", headers={"X-Request-ID": "gateway-1"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["x-request-id"] == "gateway-1"
+
+    async def test_login_is_logged(self, test_app_client, fake_user, caplog):
+        data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+        with caplog.at_level(logging.INFO):
+            await test_app_client.post("/auth/jwt/login", data=data)
+        events = [getattr(record, "event", None) for record in caplog.records]
+        assert "user.login" in events
@@ -0,0 +1,51 @@
+import pytest
+from fastapi import status
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanKind
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture(scope="module")
+def span_exporter():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    yield exporter
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestTracing:
+    async def test_login_spans_join_upstream_trace(self, span_exporter, test_app_client, fake_user):
+        span_exporter.clear()
+        data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+        response = await test_app_client.post(
+            "/auth/jwt/login",
+            data=data,
+            headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        spans = {span.name: span for span in span_exporter.get_finished_spans()}
+        server = spans["POST /auth/jwt/login"]
+        assert server.kind == SpanKind.SERVER
+        assert format(server.context.trace_id, "032x") == TRACE_ID
+        assert format(server.parent.span_id, "016x") == PARENT_ID
+        assert spans["UserManager.password_verify"].parent.span_id == server.context.span_id
+        assert spans["SELECT"].attributes["db.system"] == "postgresql"
+        assert spans["SELECT"].context.trace_id == server.context.trace_id
+
+    async def test_read_token_span(self, span_exporter, test_app_client, fake_user):
+        data = {"username": "king.arthur@camelot.bt", "password": "guinevere"}
+        token = (await test_app_client.post("/auth/jwt/login", data=data)).json()["access_token"]
+        span_exporter.clear()
+        await test_app_client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        names = [span.name for span in span_exporter.get_finished_spans()]
+        assert "JWTStrategy.read_token" in names
+        assert "GET /users/me" in names
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi import status
+from sqlalchemy import event
+from authenticity_product.models import SerialCode
+from authenticity_product.services.http.db_async import engine_async
+from authenticity_product.services.http.verification import (
+    code_verifier,
+    from_entry,
+    generate_code,
+)
+
+
+@pytest.mark.router
+@pytest.mark.asyncio
+class TestVerification:
+    async def test_known_code_is_served_from_cache_once_looked_up(
+        self, test_app_client, db_dependency, product, add_code
+    ):
+        code = add_code(product)
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if "serial_code" in statement:
+                statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", count)
+        try:
+            first = await test_app_client.get(f"/verify/{code.lower()}")
+            second = await test_app_client.get(f"/verify/{code[:8]}-{code[8:]}")
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", count)
+        assert first.status_code == second.status_code == status.HTTP_200_OK
+        assert first.json() == {
+            "code": code,
+            "authentic": True,
+            "product": {"id": product.id, "name": "Perfume", "brand": "Camelot"},
+        }
+        assert second.content == first.content
+        assert len(statements) == 1
+        assert from_entry(code_verifier.cache.get(code)) == (product.id, first.content)
+
+    async def test_unknown_code_is_cached_until_invalidated(
+        self, test_app_client, db_dependency, product
+    ):
+        code = generate_code()
+        response = await test_app_client.get(f"/verify/{code}")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert code_verifier.cache.get(code) == b""
+        db_dependency.add(SerialCode(code=code, product_id=product.id))
+        db_dependency.commit()
+        assert (await test_app_client.get(f"/verify/{code}")).status_code == 404
+        code_verifier.invalidate(code)
+        assert (await test_app_client.get(f"/verify/{code}")).status_code == 200
+
+    async def test_concurrent_misses_share_one_query(self, test_app_client):
+        code = generate_code()
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if "serial_code" in statement:
+                statements.append(statement)
+
+        event.listen(engine_async.sync_engine, "before_cursor_execute", count)
+        try:
+            results = await asyncio.gather(*(code_verifier.verify(code) for _ in range(5)))
+        finally:
+            event.remove(engine_async.sync_engine, "before_cursor_execute", count)
+        assert results == [None] * 5
+        assert len(statements) == 1
+
+    async def test_malformed_code_is_rejected_without_lookup(self, test_app_client):
+        response = await test_app_client.get("/verify/not-a-code!")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert code_verifier.cache.get("NOTACODE!") is None
+
+    async def test_codes_are_unique(self, db_dependency, product, add_code):
+        code = add_code(product)
+        db_dependency.add(SerialCode(code=code, product_id=product.id))
+        with pytest.raises(Exception, match="serial_code_code_excl"):
+            db_dependency.commit()
+        db_dependency.rollback()